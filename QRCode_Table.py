@@ -1,13 +1,34 @@
 import sys
+import bisect
 import segno
 import io
 import numpy as np
-import concurrent.futures
 import time
 import math
-from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem
-from PyQt5.QtGui import QPixmap, QIcon
+from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QLineEdit
+from PyQt5.QtGui import QPixmap, QImage, QIcon
 from PyQt5.QtCore import Qt
+from verify import Verifier, image_modules
+from autotune import AdaptiveTuner, get_config
+from serial_range import SerialRange
+from scheduler import ChunkScheduler, shared_scheduler, BULK, VISIBLE, PREFETCH
+from payload_index import PayloadIndex, cell
+from grouping import PayloadGroups, GroupView
+from progressive import ProgressiveView, PaintClock, reading_order, paint_now
+import profiler
+
+#Fraction of rendered codes decoded back to their payload, 0 turns verification off
+VERIFY_RATE = 1.0
+
+#Show results in index order (rows fill top down) or as soon as each chunk completes
+ORDERED_RESULTS = True
+
+#One cell per distinct payload with a count badge (double click a cell for its index runs)
+GROUP_DUPLICATES = False
+
+#Show the window at once with placeholders, fill the visible cells first with a preview from the
+#module matrix, then the final render (ignored in the grouped view)
+PROGRESSIVE_RENDERING = True
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -31,6 +52,16 @@ class MainWindow(QMainWindow):
         layout.setAlignment(Qt.AlignTop)
         layout.setSpacing(10)
 
+        #Search box, Enter jumps to the next code whose URL or hash starts with the text
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Find URL or hash (prefix), Enter for next match.")
+        self.search_box.returnPressed.connect(self.find_payload)
+        layout.addWidget(self.search_box)
+        self.search_text = None
+        self.matches = []
+        self.searched_count = 0
+        self.match_position = -1
+
         #Create the QTable widget
         self.table = QTableWidget()
         layout.addWidget(self.table)
@@ -38,59 +69,151 @@ class MainWindow(QMainWindow):
         #Set the main window's central widget
         self.setCentralWidget(scroll_area)
 
-        #Hardcoded lists of URLs (3 multiplied)
-        self.urls = (
-            ["https://www.example.com/1"] * 3 +
-            ["https://www.example.com/2"] * 3 +
-            ["https://www.example.com/3"] * 3 
-        )
+        #Hardcoded lists of URLs (3 multiplied, computed per index from a template so no list is held)
+        self.urls = SerialRange("https://www.example.com/{n}", 1, 4, repeat = 3)
 
         assert len(self.urls) == 9, "URL list length mismatch"
 
+        #Grouped view encodes, renders and lays out the distinct payloads only
+        self.groups = None
+        self.progressive = PROGRESSIVE_RENDERING and not GROUP_DUPLICATES
+        if GROUP_DUPLICATES:
+            self.groups = PayloadGroups(self.urls)
+            self.urls = self.groups.payloads()
+            print(self.groups.summary())
+
+        #Payload -> code index lookup, filled as results arrive
+        self.index = PayloadIndex()
+
+        #Worker count and UI batch size measured for this machine, adjusted while running
+        self.tuner = AdaptiveTuner(get_config(), ui_batch = 100)
+
+        #Decode back verification of a sample of the rendered codes
+        self.verifier = Verifier(VERIFY_RATE) if VERIFY_RATE else None
+
+        #Ctrl+Shift+P starts and stops a profile capture tagged with the run parameters
+        profiler.install(self, lambda: {"count": self.table.rowCount() * self.table.columnCount(),
+                                        "columns": self.table.columnCount(), "workers": self.tuner.workers,
+                                        "chunk_size": self.tuner.chunk_size, "ui_batch": self.tuner.ui_batch,
+                                        "verify_rate": VERIFY_RATE})
+
         #Add QR codes to table (9000 Qr codes 3 columns)
-        self.add_qr_codes(count = 9, columns = 3)
+        self.add_qr_codes(count = len(self.urls), columns = 3)
 
     def generate_qr_code(self, index):
-        """Generate a single QR code and its pixmap and index"""
+        """Generate a single QR code and its image and index"""
         try:
             start_time = time.time()
             #Use urls from list
             qr = segno.make(self.urls[index], micro = False)
-            #Save to Bytes IO as png
-            buffer = io.BytesIO()
-            qr.save(buffer, kind='png', scale = 7, border = 1)
-            #Convert to Pixmap
-            pixmap = QPixmap()
-            if not pixmap.loadFromData(buffer.getvalue()):
-                raise ValueError(f"Failed to load pixmap for QR code {index}.")
+            image = self.render_image(qr, index)
             elapsed = time.time() - start_time
-            return pixmap, index, elapsed
+            return image, index, elapsed, qr
         except Exception as e:
             print(F"Error generating QR code {index}: {e}.")
+            return None, index, 0, None
+
+    def render_image(self, qr, index):
+        """Render an encoded code to its image and queue it for verification (runs on the workers)."""
+        #Save to Bytes IO as png
+        buffer = io.BytesIO()
+        qr.save(buffer, kind='png', scale = 7, border = 1)
+        #Decode to a QImage, QPixmaps are only made on the GUI thread
+        image = QImage.fromData(buffer.getvalue())
+        if image.isNull():
+            raise ValueError(f"Failed to load image for QR code {index}.")
+
+        #Queue the rendered image for decode back verification
+        if self.verifier is not None:
+            png_data = buffer.getvalue()
+            self.verifier.submit(index, lambda: self.rendered_modules(png_data), self.urls[index])
+        return image
 
-    def add_qr_code(self, pixmap, index, columns):
+    def rendered_modules(self, png_data):
+        """Sample a rendered PNG back to its module grid for verification."""
+        image = QImage.fromData(png_data).convertToFormat(QImage.Format_Grayscale8)
+        bits = image.constBits()
+        bits.setsize(image.height() * image.bytesPerLine())
+        pixels = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+        return image_modules(pixels[:, :image.width()], scale = 7, border = 1)
+
+    def add_qr_code(self, image, index, columns, qr = None):
         """Add a QR code to the table widget."""
         try:
-            if pixmap is None:
+            if qr is None:
                 print(f"Skipping QR code {index} due to generation error.")
                 return
             
-            item = QTableWidgetItem()
-            item.setIcon(QIcon(pixmap.scaled(100, 100, Qt.KeepAspectRatio)))
-            item.setFlags(Qt.ItemIsEnabled) #Makes it non-editable
             row = index // columns
             col = index % columns
-            self.table.setItem(row, col, item)
-            print(f"Pixmap size for QR {index}: {pixmap.width()}x{pixmap.height()}.")
+            if self.progressive:
+                #Preview from the modules now, the rendered image after the next paint
+                label = self.table.cellWidget(row, col)
+                if label is None:
+                    label = ProgressiveView(100)
+                    self.table.setCellWidget(row, col, label)
+                label.set_preview(np.array(qr.matrix, dtype = np.uint8))
+                self.unrendered.append((label, image))
+                return
+            if self.groups is not None:
+                #Count badge and index runs painted over the code
+                self.table.setCellWidget(row, col, GroupView(image, 100, self.groups[index]))
+            else:
+                item = QTableWidgetItem()
+                item.setIcon(QIcon(QPixmap.fromImage(image).scaled(100, 100, Qt.KeepAspectRatio)))
+                item.setFlags(Qt.ItemIsEnabled) #Makes it non-editable
+                self.table.setItem(row, col, item)
+            print(f"Pixmap size for QR {index}: {image.width()}x{image.height()}.")
             
         except Exception as e:
             print(f"Error adding QR code {index}: {e}.")
 
+    def render_pending(self):
+        """Replace the previews painted so far with their final images."""
+        for label, image in self.unrendered:
+            label.set_final(image)
+        self.unrendered = []
+
+    def visible_rows(self):
+        """First and last table row in the viewport."""
+        first = max(0, self.table.rowAt(0))
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if last < 0:
+            last = self.table.rowCount() - 1
+        return first, last
+
+    def find_payload(self):
+        """Jump to the next code whose payload matches the search box, using the payload index."""
+        text = self.search_box.text()
+        #Search again when the text changed or results arrived since, carrying on after the current match
+        if text != self.search_text or len(self.index) != self.searched_count:
+            current = self.matches[self.match_position] if text == self.search_text and self.matches else -1
+            self.search_text = text
+            self.searched_count = len(self.index)
+            self.matches = self.index.find(text)
+            self.match_position = bisect.bisect_right(self.matches, current) - 1
+        if not self.matches:
+            print(f"No codes match {text!r} ({self.index.last_search*1000:.3f} ms).")
+            return
+        self.match_position = (self.match_position + 1) % len(self.matches)
+        row, col = cell(self.matches[self.match_position], self.columns)
+        self.table.setCurrentCell(row, col)
+        self.table.scrollTo(self.table.model().index(row, col), QTableWidget.PositionAtCenter)
+        print(f"Match {self.match_position + 1} of {len(self.matches)}: QR {self.matches[self.match_position]} "
+              f"at row {row}, column {col} ({self.index.last_search*1000:.3f} ms).")
+
+    def closeEvent(self, event):
+        """Stop the verification pool with the window, it is shared by every load."""
+        if self.verifier is not None:
+            self.verifier.close()
+        super().closeEvent(event)
+
     def add_qr_codes(self, count, columns):
         """Add multiple QR codes using cpu threads for better efficiency, maybe"""
         try: 
             start_time = time.time()
             total_generation_time = 0
+            self.columns = columns
 
             #Configure the table widget
             self.table.setRowCount(math.ceil(count / columns))  #Make enough rows for the QR codes
@@ -110,27 +233,71 @@ class MainWindow(QMainWindow):
             print(f"Row 0 height: {self.table.rowHeight(0)}.")
             print(f"Column 0 width: {self.table.columnWidth(0)}.")
 
+            #Progressive: placeholders for the visible cells on screen before any code is encoded,
+            #then the codes in reading order starting from the viewport
+            order = count
+            self.unrendered = []
+            if self.progressive:
+                paint_start = time.perf_counter()
+                self.show()
+                QApplication.processEvents()
+                first_row, last_row = self.visible_rows()
+                visible = range(first_row * columns, min(count, (last_row + 1) * columns))
+                self.paint_clock = PaintClock(visible, paint_start)
+                for index in visible:
+                    self.table.setCellWidget(index // columns, index % columns,
+                                             ProgressiveView(100, self.paint_clock, index))
+                paint_now()
+                order = reading_order(count, columns, first_row, last_row)
+                visible_left = len(visible)
+
             #Generate QR codes in parallel because we are cool [not cool enough to understand exactly how we are doing it though]
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                #Submit QR code generation task
-                futures = [
-                    executor.submit(self.generate_qr_code, i)
-                    for i in range(count)
-                ]
-
-                batch_size = 100
-                for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                    pixmap, index, gen_time = future.result()
+            #Workers shared with every window, one-off codes from the forms go ahead of this batch
+            with shared_scheduler(self.tuner.max_workers).executor(BULK) as executor:
+                #Chunks of codes per task and only a few chunks in flight instead of one future per code
+                scheduler = ChunkScheduler(executor, self.generate_qr_code, self.tuner.chunk_size,
+                                           max_in_flight = 2 * self.tuner.workers, ordered = ORDERED_RESULTS)
+                #The tuner's worker count caps how many of our chunks run at once
+                executor.set_workers(self.tuner.workers)
+                if self.progressive:
+                    #The viewport's codes, then the next screenful below it, go ahead of any bulk work
+                    executor.promote(VISIBLE, visible)
+                    executor.promote(PREFETCH, range(visible.stop, visible.stop + len(visible)))
+
+                #Batch size comes from the autotuner and shrinks when the window stops painting
+                pending_ui = 0
+                last_update = time.time()
+                for _, (image, index, gen_time, qr) in scheduler.run(order):
                     total_generation_time += gen_time
-                    self.add_qr_code(pixmap, index, columns)
+                    self.add_qr_code(image, index, columns, qr)
+                    self.index.add(index, self.urls[index])
+
+                    #The visible cells are shown as soon as they are all in, not at the end of a batch
+                    if self.progressive and visible_left:
+                        visible_left -= index in visible
+                        if not visible_left:
+                            paint_now() #Previews
+                            self.render_pending()
+                            paint_now() #Final images
+                            print(self.paint_clock.summary())
 
                     #Update ui in batches
-                    if (i+1) % batch_size == 0:
+                    pending_ui += 1
+                    if pending_ui >= self.tuner.ui_batch:
+                        frame_start = time.time()
+                        self.render_pending()
                         #self.table.resizeRowsToContents()
                         self.table.parent().adjustSize() #Adjust content widget size
                         QApplication.processEvents() #Keep UI Responsive
+                        now = time.time()
+                        self.tuner.record(pending_ui, now - last_update, frame_time = now - frame_start)
+                        executor.set_workers(self.tuner.workers)
+                        scheduler.max_in_flight = 2 * self.tuner.workers
+                        pending_ui = 0
+                        last_update = now
 
             #Final adjustments
+            self.render_pending()
             #self.table.resizeRowsToContents()
             #self.table.parent().adjustSize()
 
@@ -139,7 +306,15 @@ class MainWindow(QMainWindow):
             print(f"Total time: {elapsed:.2f} seconds.")
             print(f"QR code generation time: {total_generation_time:.2f} seconds.")
             print(f"Average generation time per QR: {total_generation_time/count*3000:.2f} ms.")
-        
+            print(self.tuner.summary())
+            print(scheduler.summary())
+            print(shared_scheduler().summary())
+
+            #Decode back verification results
+            if self.verifier is not None:
+                self.verifier.wait()
+                self.verifier.report()
+
         except Exception as e:
             print(f"Error in add_qr_codes: {e}.")
             raise
@@ -1,13 +1,48 @@
 import sys
-import segno
-import io
+import bisect
 import numpy as np
-import concurrent.futures
 import time
 import math
-from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QVBoxLayout, QTableWidget, QLabel
-from PyQt5.QtGui import QPixmap
+import os
+from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QVBoxLayout, QTableWidget, QTableWidgetItem, QComboBox, QLineEdit
 from PyQt5.QtCore import Qt
+from verify import Verifier, image_modules
+from inspection import inspect_batch, grade_letter, describe
+from autotune import AdaptiveTuner, get_config
+from serial_range import SerialRange
+from scheduler import ChunkScheduler, shared_scheduler, BULK, VISIBLE, PREFETCH
+from payload_index import PayloadIndex, cell
+from palette import COLOURS, CodeImages, CodeView, image_indices
+from grouping import PayloadGroups, GroupView
+from progressive import ProgressiveView, PaintClock, reading_order, paint_now
+import qrcore
+import profiler
+from snapshot import open_snapshot, save_snapshot, SUFFIX
+
+#Fraction of rendered codes decoded back to their payload, 0 turns verification off
+VERIFY_RATE = 0.1
+
+#Generated batch kept next to this script, reopening loads it instead of re-encoding
+SNAPSHOT_PATH = os.path.splitext(os.path.abspath(__file__))[0] + SUFFIX
+SNAPSHOT_PARAMS = {"micro": False}
+
+#Decoded images kept in memory, codes far from the viewport beyond this are re-rasterized on demand
+IMAGE_BUDGET_MB = 64
+
+#Show results in index order (rows fill top down) or as soon as each chunk completes
+ORDERED_RESULTS = True
+
+#One cell per distinct payload with a count badge (double click a cell for its index runs)
+GROUP_DUPLICATES = False
+
+#Show the window at once with placeholders, fill the visible cells first with a preview from the
+#module matrix, then the final render (ignored in the grouped view)
+PROGRESSIVE_RENDERING = True
+
+class GradeItem(QTableWidgetItem):
+    """Grade column cell that sorts by its numeric score instead of its text."""
+    def __lt__(self, other):
+        return self.data(Qt.UserRole) < other.data(Qt.UserRole)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -32,91 +67,269 @@ class MainWindow(QMainWindow):
             layout.setAlignment(Qt.AlignTop)
             layout.setSpacing(10)
 
+            #Colour of every displayed code, changing it only swaps colour tables
+            self.colour_combo = QComboBox()
+            self.colour_combo.addItems(list(COLOURS))
+            self.colour_combo.currentTextChanged.connect(self.set_colour)
+            layout.addWidget(self.colour_combo)
+
+            #Search box, Enter jumps to the next code whose URL or hash starts with the text
+            self.search_box = QLineEdit()
+            self.search_box.setPlaceholderText("Find URL or hash (prefix), Enter for next match.")
+            self.search_box.returnPressed.connect(self.find_payload)
+            layout.addWidget(self.search_box)
+            self.search_text = None
+            self.matches = []
+            self.searched_count = 0
+            self.match_position = -1
+
             #Create QTable Widget
             self.table = QTableWidget()
             layout.addWidget(self.table)
+            self.table.verticalScrollBar().valueChanged.connect(self.update_viewport)
 
             #Set the main window's central widget
             self.setCentralWidget(scroll_area)
 
-            #Hardcoded list of URLS (3 multiplied)
-            self.urls = (
-                ["https://www.example.com/1"] * 3000 +
-                ["https://www.example.com/2"] * 3000 +
-                ["https://www.example.com/3"] * 3000 
-            )
+            #Hardcoded list of URLS (3 multiplied, computed per index from a template so no list is held)
+            self.urls = SerialRange("https://www.example.com/{n}", 1, 4, repeat = 3000)
             assert len(self.urls) == 9000, "URL list length mismatch."
 
-            #Add QR codes to a table (9000 QR codes, 3 columns)
-            self.add_qr_codes(count=9000, columns = 3)
+            #Grouped view encodes, renders and lays out the distinct payloads only
+            self.groups = None
+            self.progressive = PROGRESSIVE_RENDERING and not GROUP_DUPLICATES
+            if GROUP_DUPLICATES:
+                self.groups = PayloadGroups(self.urls)
+                self.urls = self.groups.payloads()
+                print(self.groups.summary())
+
+            #One shared indexed image per distinct code, within the memory budget
+            self.images = CodeImages(budget_mb = IMAGE_BUDGET_MB)
+            self.matrices = {}  #Code key -> module matrix, each distinct code is encoded once
+            self.verified = {}  #Code key -> index whose shared image was queued for verification
+
+            #Payload -> code index lookup, filled as results arrive
+            self.index = PayloadIndex()
+            self.grade_items = {}  #Original row -> grade item, follows rows when sorted
+            self.detached = {}  #Cell index -> key of rendered cells without a widget yet (progressive load)
+
+            #Matrices of the last run, stale snapshots (other parameters or segno version) are ignored
+            self.snapshot = open_snapshot(SNAPSHOT_PATH, SNAPSHOT_PARAMS)
+
+            #Worker count and UI batch size measured for this machine, adjusted while running
+            self.tuner = AdaptiveTuner(get_config(), ui_batch = 1000)
+
+            #Decode back verification of a sample of the rendered codes
+            self.verifier = Verifier(VERIFY_RATE) if VERIFY_RATE else None
+
+            #Ctrl+Shift+P starts and stops a profile capture tagged with the run parameters
+            profiler.install(self, lambda: {"count": self.table.rowCount() * self.table.columnCount(),
+                                            "columns": self.table.columnCount(), "workers": self.tuner.workers,
+                                            "chunk_size": self.tuner.chunk_size, "ui_batch": self.tuner.ui_batch,
+                                            "verify_rate": VERIFY_RATE, "image_budget_mb": IMAGE_BUDGET_MB})
+
+            #Add QR codes to a table (9000 QR codes or one per distinct URL, 3 columns)
+            self.add_qr_codes(count=len(self.urls), columns = 3)
         except Exception as e:
             print(f"Error in __init__: {e}.")
             raise
 
     def generate_qr_code(self, index):
-        """Generate a single QR code and return its pixmap and index"""
+        """Generate a single QR code and return its image key, index and module matrix"""
         try:
             start_time = time.time()
 
             #Use URL from the hardcoded list
-            qr = segno.make(self.urls[index], micro = False)
+            url = self.urls[index]
+            key = qrcore.code_key(url, **SNAPSHOT_PARAMS)
 
-            #save to BytesIO as png
-            buffer = io.BytesIO()
-            qr.save(buffer, kind = 'png', scale = 8, border = 1)
+            #A code already seen reuses its matrix, then the snapshot is tried, encode otherwise
+            matrix = self.matrices.get(key)
+            if matrix is None:
+                position = self.snapshot.find(key) if self.snapshot is not None else None
+                if position is None:
+                    matrix = qrcore.qr_matrix(url, **SNAPSHOT_PARAMS)
+                    self.encoded[index] = True
+                else:
+                    matrix = self.snapshot.matrix(position)
+                self.matrices[key] = matrix
 
-            #Convert to Pixmap
-            pixmap = QPixmap()
-            if not pixmap.loadFromData(buffer.getvalue()):
-                raise ValueError(f"Failed to load pixmap for QR code {index}.")
+            #Progressive cells are rendered on the GUI thread once their preview is on screen
+            if not self.progressive:
+                self.render_code(key, index, matrix)
             elapsed = time.time() - start_time
-
-            #Print pixmap size
-            print(f"QR {index} pixmap size: {pixmap.width()}x{pixmap.height()}")
-            return pixmap, index, elapsed
+            return key, index, elapsed, matrix
         except Exception as e:
             print(f"Error generationg QR Code {index}: {e}.")
-            return None, index, 0
+            return None, index, 0, None
         
 
-    def add_qr_code(self, pixmap, index, columns):
-        """Add a QR code to the table widget using Qlabel"""
+    def render_code(self, key, index, matrix):
+        """Final image of a code (shared by every cell showing it), queued for verification."""
+        image = self.images.get(key, lambda: matrix, scale = 8, border = 1, index = index)
+        if image.isNull():
+            raise ValueError(f"Failed to create image for QR code {index}.")
+
+        #Queue the rendered image for decode back verification, once per shared image rather than sampled per cell
+        if self.verifier is not None and self.verified.setdefault(key, index) == index:
+            self.verifier.submit(index, lambda: self.rendered_modules(image), self.urls[index], sample = False)
+
+        #Print image size
+        print(f"QR {index} image size: {image.width()}x{image.height()}")
+        return image
+
+    def rendered_modules(self, image):
+        """Sample a rendered image back to its module grid for verification."""
+        #Dark index to black, light to white, whatever the current colour table
+        pixels = (1 - image_indices(image)) * 255
+        return image_modules(pixels, scale = 8, border = 1)
+
+    def set_colour(self, name):
+        """Recolour every displayed code by swapping the shared colour tables."""
+        elapsed = self.images.set_colour(name)
+        self.table.viewport().update()
+        print(f"Recoloured {len(self.images.images)} images to {name} in {elapsed*1000:.2f} ms.")
+
+    def add_qr_code(self, key, index, columns, matrix = None):
+        """Add a QR code to the table widget using a CodeView"""
         try:
-            if pixmap is None:
+            if key is None:
                 print(f"Skipping QR code {index} due to generation error.")
                 return
-            
-            #Create a QLabel and put the pixmap on it
-            label = QLabel()
-            label.setPixmap(pixmap.scaled(150, 150, Qt.KeepAspectRatio))
-            label.setAlignment(Qt.AlignCenter)
-
-            #Set fixed sizes
-            label.setFixedSize(150, 150)
             row = index // columns
             col = index % columns
 
-            #Set QLabel as cell widget
+            #Progressive: cells in view get a preview from the modules now and the final image after
+            #the next paint, the others their CodeView once rendered and scrolled to (or at the end)
+            if self.progressive:
+                label = self.table.cellWidget(row, col)
+                if label is not None:
+                    label.set_preview(matrix, self.images.table)
+                self.unrendered.append((label, key, index, matrix))
+                return
+
+            #Create a CodeView painting the shared image at a fixed size, fetched by key so it can be evicted
+            if self.groups is not None:
+                label = GroupView(self.images, 150, self.groups[index], key = key)
+            else:
+                label = CodeView(self.images, 150, key = key)
+
+            #Set CodeView as cell widget
             self.table.setCellWidget(row, col, label)
         except Exception as e:
             print(f"Error adding QR code {index}: {e}.")
 
+    def add_grades(self, batch, columns):
+        """Inspect a batch of matrices in one vectorized pass, the grade column shows each row's lowest score"""
+        if not batch:
+            return
+        metrics = inspect_batch([matrix for _, matrix in batch], border = 1, scale = 8)
+        for position, (index, _) in enumerate(batch):
+            row = index // columns
+            score = float(metrics["score"][position])
+            line = f"QR {index}: {describe(metrics, position)}"
+            item = self.table.item(row, columns)
+            if item is None:
+                item = GradeItem()
+                item.setFlags(Qt.ItemIsEnabled)
+                item.setTextAlignment(Qt.AlignCenter)
+                item.setToolTip(line)
+                self.table.setItem(row, columns, item)
+                self.grade_items[row] = item
+            else:
+                item.setToolTip(item.toolTip() + "\n" + line)
+                if score >= item.data(Qt.UserRole):
+                    continue
+            item.setData(Qt.UserRole, score)
+            item.setText(f"{grade_letter(metrics['grade'][position])} ({score:.0f})")
+
+    def render_pending(self):
+        """Render the codes received so far, replacing the previews painted for them."""
+        for label, key, index, matrix in self.unrendered:
+            self.render_code(key, index, matrix)
+            if label is not None:
+                label.set_final(self.images, key)
+            else:
+                self.detached[index] = key
+        self.unrendered = []
+
+    def attach_cells(self, indices = None):
+        """Give rendered cells their CodeView, the given ones (in view) or all that are left.
+
+        Thousands of cell widgets on a shown table make every processEvents re-lay them
+        out, so a progressive load adds them as they scroll into view and the rest at the end.
+        """
+        for index in list(self.detached) if indices is None else indices:
+            key = self.detached.pop(index, None)
+            if key is not None:
+                self.table.setCellWidget(index // self.columns, index % self.columns,
+                                         CodeView(self.images, 150, key = key))
+
+    def visible_rows(self):
+        """First and last table row in the viewport (rows as shown, sorting aside)."""
+        first = max(0, self.table.rowAt(0))
+        last = self.table.rowAt(self.table.viewport().height() - 1)
+        if last < 0:
+            last = self.table.rowCount() - 1
+        return first, last
+
+    def update_viewport(self):
+        """Tell the image budget which cells are on screen."""
+        first, last = self.visible_rows()
+        if self.detached:
+            #Rendered cells scrolled into view during a progressive load
+            self.attach_cells(range(first * self.columns, (last + 1) * self.columns))
+        self.images.set_viewport(first * self.columns, (last + 1) * self.columns - 1)
+
+    def find_payload(self):
+        """Jump to the next code whose payload matches the search box, using the payload index."""
+        text = self.search_box.text()
+        #Search again when the text changed or results arrived since, carrying on after the current match
+        if text != self.search_text or len(self.index) != self.searched_count:
+            current = self.matches[self.match_position] if text == self.search_text and self.matches else -1
+            self.search_text = text
+            self.searched_count = len(self.index)
+            self.matches = self.index.find(text)
+            self.match_position = bisect.bisect_right(self.matches, current) - 1
+        if not self.matches:
+            print(f"No codes match {text!r} ({self.index.last_search*1000:.3f} ms).")
+            return
+        self.match_position = (self.match_position + 1) % len(self.matches)
+        row, col = cell(self.matches[self.match_position], self.columns)
+        #Rows may have been sorted by grade, the grade item knows where its row went
+        item = self.grade_items.get(row)
+        if item is not None:
+            row = item.row()
+        self.table.setCurrentCell(row, col)
+        self.table.scrollTo(self.table.model().index(row, col), QTableWidget.PositionAtCenter)
+        print(f"Match {self.match_position + 1} of {len(self.matches)}: QR {self.matches[self.match_position]} "
+              f"at row {row}, column {col} ({self.index.last_search*1000:.3f} ms).")
+
+    def closeEvent(self, event):
+        """Stop the verification pool with the window, it is shared by every load."""
+        verifier = getattr(self, "verifier", None)
+        if verifier is not None:
+            verifier.close()
+        super().closeEvent(event)
+
     def add_qr_codes(self, count, columns):
         """Add multiple QR codes using threading (makes it look like it is doint it out of order, it is not)"""
         try:
             start_time = time.time()
             total_generation_time = 0
+            self.columns = columns
 
             #Configure QTable widget
             self.table.setRowCount(math.ceil(count/columns))
-            self.table.setColumnCount(columns)
-            self.table.setHorizontalHeaderLabels([f"Col {i+1}" for i in range(columns)])
+            self.table.setColumnCount(columns + 1)
+            self.table.setHorizontalHeaderLabels([f"Col {i+1}" for i in range(columns)] + ["Grade"])
             self.table.setShowGrid(False)
 
             #Set column width and row height
             cell_size = 160 #slightly bigger than the qr codes 150px
             for i in range(columns):
                 self.table.setColumnWidth(i, cell_size)
+            self.table.setColumnWidth(columns, 80)
             for row in range(self.table.rowCount()):
                 self.table.setRowHeight(row, cell_size)
             self.table.setStyleSheet("QTableWidget { padding: 5px; }")
@@ -125,26 +338,82 @@ class MainWindow(QMainWindow):
             print(f"Row 0 height: {self.table.rowHeight(0)}.")
             print(f"Column 0 height: {self.table.columnWidth(0)}.")
 
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                #Submit QR code generation tasks
-                futures = [
-                    executor.submit(self.generate_qr_code, i)
-                    for i in range(count)
-                ]
-
-                #Process results in batches
-                batch_size = 1000
-                for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                    pixmap, index, gen_time = future.result()
+            #Progressive: placeholders for the visible cells on screen before any code is encoded,
+            #then the codes in reading order starting from the viewport
+            order = count
+            self.unrendered = []
+            if self.progressive:
+                paint_start = time.perf_counter()
+                self.show()
+                QApplication.processEvents()
+                first_row, last_row = self.visible_rows()
+                visible = range(first_row * columns, min(count, (last_row + 1) * columns))
+                self.paint_clock = PaintClock(visible, paint_start)
+                for index in visible:
+                    self.table.setCellWidget(index // columns, index % columns,
+                                             ProgressiveView(150, self.paint_clock, index))
+                paint_now()
+                order = reading_order(count, columns, first_row, last_row)
+                visible_left = len(visible)
+
+            #Workers shared with every window, one-off codes from the forms go ahead of this batch
+            with shared_scheduler(self.tuner.max_workers).executor(BULK) as executor:
+                #Chunks of codes per task and only a few chunks in flight instead of one future per code
+                scheduler = ChunkScheduler(executor, self.generate_qr_code, self.tuner.chunk_size,
+                                           max_in_flight = 2 * self.tuner.workers, ordered = ORDERED_RESULTS)
+                #The tuner's worker count caps how many of our chunks run at once
+                executor.set_workers(self.tuner.workers)
+                if self.progressive:
+                    #The viewport's codes, then the next screenful below it, go ahead of any bulk work
+                    executor.promote(VISIBLE, visible)
+                    executor.promote(PREFETCH, range(visible.stop, visible.stop + len(visible)))
+
+                #Process results in batches, sized by the autotuner so the window keeps painting
+                pending_ui = 0
+                last_update = time.time()
+                graded = []
+                self.encoded = [False] * count
+                matrices = [None] * count
+                for _, (key, index, gen_time, matrix) in scheduler.run(order):
                     total_generation_time += gen_time
-                    self.add_qr_code(pixmap, index, columns)
+                    self.add_qr_code(key, index, columns, matrix)
+                    self.index.add(index, self.urls[index])
+                    if matrix is not None:
+                        graded.append((index, matrix))
+                        matrices[index] = matrix
+
+                    #The visible cells are shown as soon as they are all in, not at the end of a batch
+                    if self.progressive and visible_left:
+                        visible_left -= index in visible
+                        if not visible_left:
+                            paint_now() #Previews
+                            self.render_pending()
+                            paint_now() #Final images
+                            print(self.paint_clock.summary())
 
                     #Update UI according to batch sizes
-                    if (i+1) % batch_size == 0:
-                        self.table.parent().adjustSize() #Adjust size of widget (with batches? maybe this isnt working...)
+                    pending_ui += 1
+                    if pending_ui >= self.tuner.ui_batch:
+                        frame_start = time.time()
+                        self.render_pending()
+                        self.add_grades(graded, columns)
+                        graded = []
+                        #The table's size is fixed before the load, a shown window would re-layout it every batch
+                        if not self.progressive:
+                            self.table.parent().adjustSize() #Adjust size of widget (with batches? maybe this isnt working...)
                         QApplication.processEvents() #Keep things responsive or whatever
+                        now = time.time()
+                        self.tuner.record(pending_ui, now - last_update, frame_time = now - frame_start)
+                        executor.set_workers(self.tuner.workers)
+                        scheduler.max_in_flight = 2 * self.tuner.workers
+                        pending_ui = 0
+                        last_update = now
 
-            #Final adjustments
+            #Final adjustments, rows can be sorted by grade once every code is in place
+            self.render_pending()
+            self.attach_cells()
+            self.add_grades(graded, columns)
+            self.table.setSortingEnabled(True)
             self.table.parent().adjustSize()
 
             #Print performance metrics
@@ -152,6 +421,27 @@ class MainWindow(QMainWindow):
             print(f"Total time: {elapsed:.2f} seconds.")
             print(f"QR code generation time: {total_generation_time:.2f} seconds.")
             print(f"Average generation time per QR: {total_generation_time/count*3000:.2f} ms.")
+            print(self.tuner.summary())
+            print(scheduler.summary())
+            print(shared_scheduler().summary())
+            self.update_viewport()
+            print(self.images.summary())
+
+            #Save the batch so the next start skips encoding, only when something new was encoded.
+            #A grouped run holds the distinct payloads only and would replace the full batch's snapshot
+            encoded = sum(self.encoded)
+            print(f"Encoded {encoded} of {count} codes, the rest reused an earlier code or the snapshot.")
+            if self.snapshot is not None:
+                self.snapshot.close()
+                self.snapshot = None
+            if self.groups is None and encoded and all(matrix is not None for matrix in matrices):
+                save_snapshot(SNAPSHOT_PATH, self.urls[:count], matrices, SNAPSHOT_PARAMS)
+                print(f"Snapshot saved to {SNAPSHOT_PATH}.")
+
+            #Decode back verification results
+            if self.verifier is not None:
+                self.verifier.wait()
+                self.verifier.report()
         except Exception as e:
             print(f"Error in add_qr_codes: {e}.")
             raise
@@ -9,6 +9,10 @@ import io
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor
 import time
+import asyncio
+import async_pipeline
+from payload_stream import read_payloads
+from autotune import AdaptiveTuner, get_config
 
 class QRCodeApp(QMainWindow):
     def __init__(self):
@@ -35,10 +39,13 @@ class QRCodeApp(QMainWindow):
         # Vertical layout for QR codes (This is AI generated code, idk what this exactly means)
         self.qr_layout = QVBoxLayout(self.qr_frame)
 
-        #The lists I'll generate codes from
-        self.links = ["https://example.com/1",
-                      "https://example.com/2",
-                      "https://example.com/3"] * 1000
+        #The lists I'll generate codes from, or a payload file (one per line) streamed lazily
+        if len(sys.argv) > 1:
+            self.links = read_payloads(sys.argv[1])
+        else:
+            self.links = ["https://example.com/1",
+                          "https://example.com/2",
+                          "https://example.com/3"] * 1000
 
         
         self.generate_qr_codes()
@@ -59,33 +66,51 @@ class QRCodeApp(QMainWindow):
         #Generate QR codes in parallel 
         start_time = time.time()
 
-        #Do the work in parallel
-        with ThreadPoolExecutor(max_workers = 3) as executor:
-            results = list(executor.map(self.generate_qr_code, self.links))
-
-        #Display the QR Codes
-        for link, img_data in results:
-            if img_data:
-                #Convert to QPixMap
-                pixmap = QPixmap()
-                pixmap.loadFromData(img_data)
-
-                #Make a label for the QR code
-                qr_label = QLabel()
-                qr_label.setPixmap(pixmap)
-                qr_label.setAlignment(Qt.AlignCenter)
-
-                #Make a label for the link
-                text_label = QLabel(link)
-                text_label.setAlignment(Qt.AlignCenter)
-
-                #Add to Layout
-                self.qr_layout.addWidget(qr_label)
-                self.qr_layout.addWidget(text_label)
-
-        self.qr_layout.addStretch()
-
-        print(f"Generated and displayed QR Codes in {time.time() - start_time:.2f} seconds")
+        #Worker count measured for this machine instead of a fixed 3
+        tuner = AdaptiveTuner(get_config())
+        executor = ThreadPoolExecutor(max_workers = tuner.max_workers)
+        max_pending = tuner.max_workers * tuner.chunk_size
+
+        async def generate():
+            #The links are read in blocks on the I/O pool, a payload file never blocks the GUI thread
+            links = async_pipeline.read_blocks(self.links)
+            #Do the work in parallel, only a bounded number of links are in flight at once
+            #Display the QR Codes as they come back in order, the window paints while the pool works
+            async for link, img_data in async_pipeline.feed_pool_async(executor, self.generate_qr_code,
+                                                                      links, max_pending):
+                if img_data:
+                    self.add_qr_code(link, img_data)
+
+        def generated(task):
+            #Called on the GUI thread by the Qt driven asyncio loop
+            executor.shutdown()
+            self.qr_layout.addStretch()
+            try:
+                task.result()
+            except (Exception, asyncio.CancelledError) as e:
+                print(f"Error generating QR codes: {e or 'cancelled'}")
+                return
+            print(f"Generated and displayed QR Codes in {time.time() - start_time:.2f} seconds")
+
+        async_pipeline.qt_driver().start(generate(), generated)
+
+    def add_qr_code(self, link, img_data):
+        #Convert to QPixMap
+        pixmap = QPixmap()
+        pixmap.loadFromData(img_data)
+
+        #Make a label for the QR code
+        qr_label = QLabel()
+        qr_label.setPixmap(pixmap)
+        qr_label.setAlignment(Qt.AlignCenter)
+
+        #Make a label for the link
+        text_label = QLabel(link)
+        text_label.setAlignment(Qt.AlignCenter)
+
+        #Add to Layout
+        self.qr_layout.addWidget(qr_label)
+        self.qr_layout.addWidget(text_label)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
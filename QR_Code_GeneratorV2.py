@@ -1,12 +1,19 @@
-from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QGridLayout, QLabel
-from PyQt5.QtGui import QPixmap
+from PyQt5.QtWidgets import QApplication, QMainWindow, QScrollArea, QWidget, QGridLayout
 from PyQt5.QtCore import Qt
 import sys
-import segno
-import io
 import numpy as np
-import concurrent.futures
 import time
+from autotune import AdaptiveTuner, get_config
+from serial_range import SerialRange
+from scheduler import ChunkScheduler, shared_scheduler, BULK
+from palette import CodeImages, CodeView
+import qrcore
+
+#Show results in index order (rows fill top down) or as soon as each chunk completes
+ORDERED_RESULTS = True
+
+#Decoded images kept in memory, codes far from the viewport beyond this are re-rasterized on demand
+IMAGE_BUDGET_MB = 32
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -32,64 +39,98 @@ class MainWindow(QMainWindow):
 
         #Set the central widget
         self.setCentralWidget(scroll_area)
+        scroll_area.verticalScrollBar().valueChanged.connect(self.update_viewport)
+
+        #3 URLs multiplied, computed per index from a template so no list is held
+        self.urls = SerialRange("https://www.example{n}.com", 1, 4, repeat = 1000)
 
-        self.urls = (
-            ["https://www.example1.com"] * 1000 +
-            ["https://www.example2.com"] * 1000 +
-            ["https://www.example3.com"] * 1000 
-            )
+        #One shared indexed image per distinct code instead of a pixmap per label, within the memory budget
+        self.images = CodeImages(budget_mb = IMAGE_BUDGET_MB)
+
+        #Worker count and UI batch size measured for this machine, adjusted while running
+        self.tuner = AdaptiveTuner(get_config(), ui_batch = 100)
 
         #Add the Qr codes in a grid, takes count and columns
         self.add_qr_codes(count = 3000, columns = 3)
 
     def generate_qr_code(self, index):
-        """Generate a single qrcode and Pixmap"""
+        """Generate a single qrcode image and return its key"""
         start_time = time.time()
         #Use url from hardcoded list
-        qr = segno.make(self.urls[index], micro =False)
-        #Save to BytesIO as PNG
-        buffer = io.BytesIO()
-        qr.save(buffer, kind='png', scale = 5, border = 1)
-        #Convert to Pixmap
-        pixmap = QPixmap()
-        pixmap.loadFromData(buffer.getvalue())
-        #Optional: Convert to numpy array (if needed for processing)
-        #img = np.array(ar.png_data_url()) [would this do anything?  idk]
+        url = self.urls[index]
+        key = qrcore.code_key(url, micro = False)
+        #Encoded and rasterized only the first time the code is seen
+        self.images.get(key, lambda: qrcore.qr_matrix(url, micro = False), scale = 5, border = 1, index = index)
         elapsed = time.time() - start_time
-        return pixmap, index, elapsed
+        return key, index, elapsed
     
-    def add_qr_code(self, pixmap, index, columns):
+    def add_qr_code(self, key, index, columns):
         """Add a QR code to the grid layout."""
-        label = QLabel()
-        label.setPixmap(pixmap.scaled(100,100, Qt.KeepAspectRatio))
+        label = CodeView(self.images, 100, key = key)
         row = index // columns
         col = index % columns
         self.layout.addWidget(label, row, col)
 
+    def update_viewport(self):
+        """Tell the image budget which grid cells are on screen."""
+        scroll_area = self.centralWidget()
+        top = scroll_area.verticalScrollBar().value()
+        bottom = top + scroll_area.viewport().height()
+        rows = self.layout.rowCount()
+        columns = max(1, self.layout.columnCount())
+        #First and last row overlapping the visible band, rows are laid out top down
+        low, high = 0, rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.layout.cellRect(middle, 0).bottom() < top:
+                low = middle + 1
+            else:
+                high = middle
+        first = low
+        low, high = first, rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.layout.cellRect(middle, 0).top() <= bottom:
+                low = middle + 1
+            else:
+                high = middle
+        last = max(first, low - 1)
+        self.images.set_viewport(first * columns, (last + 1) * columns - 1)
+
     def add_qr_codes(self, count, columns):
         """Add multiple QR Codes using threads for efficiency (usually not much efficiency)"""
         start_time = time.time()
         total_generation_time = 0
 
         #Concurrent.futures for parallel cpu usage which maybe gives a boost idk
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            #Submit QR Code generation task
-            futures = [
-                executor.submit(self.generate_qr_code, i)
-                for i in range(count)
-            ]
+        #Workers shared with every window, one-off codes from the forms go ahead of this batch
+        with shared_scheduler(self.tuner.max_workers).executor(BULK) as executor:
+            #Chunks of codes per task and only a few chunks in flight instead of one future per code
+            scheduler = ChunkScheduler(executor, self.generate_qr_code, self.tuner.chunk_size,
+                                       max_in_flight = 2 * self.tuner.workers, ordered = ORDERED_RESULTS)
+            #The tuner's worker count caps how many of our chunks run at once
+            executor.set_workers(self.tuner.workers)
 
             #Process these bitches in batches because waiting 14 seconds for 3000 QR codes is kind of annoying.
-            batch_size = 100
-            for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                pixmap, index, gen_time = future.result()
+            #The autotuner sizes the batches and shrinks them when the window stops painting
+            pending_ui = 0
+            last_update = time.time()
+            for _, (key, index, gen_time) in scheduler.run(count):
                 total_generation_time += gen_time
-                self.add_qr_code(pixmap, index, columns)
+                self.add_qr_code(key, index, columns)
 
                 #Update UI according to batch size
-                if (i+1) % batch_size == 0:
+                pending_ui += 1
+                if pending_ui >= self.tuner.ui_batch:
+                    frame_start = time.time()
                     self.layout.parentWidget().adjustSize()
                     QApplication.processEvents() #Keep UI responsive
+                    now = time.time()
+                    self.tuner.record(pending_ui, now - last_update, frame_time = now - frame_start)
+                    executor.set_workers(self.tuner.workers)
+                    scheduler.max_in_flight = 2 * self.tuner.workers
+                    pending_ui = 0
+                    last_update = now
 
         #Final size adjustment
         self.layout.parentWidget().adjustSize()
@@ -99,6 +140,11 @@ class MainWindow(QMainWindow):
         print(f"Total time: {elapsed:.2f} seconds.")
         print(f"QR code generation time: {total_generation_time:.2f} seconds.")
         print(f"Average generation time per QR: {total_generation_time/count*1000:.2f} ms.")
+        print(self.tuner.summary())
+        print(scheduler.summary())
+        print(shared_scheduler().summary())
+        self.update_viewport()
+        print(self.images.summary())
 
 
 if __name__ == '__main__':
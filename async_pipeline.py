@@ -0,0 +1,322 @@
+import os
+import time
+import asyncio
+import itertools
+import collections
+import concurrent.futures
+import qrcore
+import digests
+import code_png
+from scheduler import shared_scheduler, BULK
+
+#Staged export pipeline on asyncio: read -> hash -> encode -> rasterize -> write.
+#
+#Every stage has its own bounded queue and its own concurrency limit. Disk stages (reading,
+#hashing files, writing) run on a small I/O thread pool, CPU stages (encoding, PNG
+#rasterizing) on the shared priority workers at bulk priority, so a slow disk and busy
+#encoders overlap instead of taking turns. Inside a Qt window the loop is stepped from a
+#QTimer on the GUI thread (QtLoopDriver), so finished coroutines call back on that thread;
+#the windows read payload files (read_blocks) and write exports (run_io) through it.
+#
+#    python async_pipeline.py payloads.txt --out codes/
+#    python async_pipeline.py --hash-files *.iso --out labels/
+
+IO = "io"  #I/O thread pool
+CPU = "cpu"  #Shared priority workers
+LOOP = "loop"  #Inline on the loop, for cheap steps
+
+#In-flight items per stage
+STAGE_LIMITS = {"read": 1, "hash": 2, "encode": 2, "rasterize": 2, "write": 4}
+QUEUE_SIZE = 64  #Items waiting in front of each stage, a slow stage holds back the ones before it
+READ_BLOCK = 256  #Payload lines read per trip to the I/O pool
+STEP_INTERVAL = 4  #Milliseconds each loop step may wait for work before Qt gets the thread back
+
+_DONE = object()
+
+
+def _timed(fn, *args):
+    """Call fn in the worker, returns (result, seconds spent in fn) so queue waits are not counted as busy."""
+    start_time = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start_time
+
+
+class Pipeline:
+    """Chain of stages joined by bounded asyncio queues.
+
+    Each stage function takes one item and returns it (usually the same dict,
+    updated) for the next stage. run() reads the source iterable on the I/O
+    pool in blocks, which is the read stage.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, io_workers=None):
+        self.queue_size = queue_size
+        self.io_workers = io_workers
+        self.stages = []
+        self.stats = collections.OrderedDict()
+        self.seconds = 0.0
+
+    def stage(self, name, fn, kind=IO, concurrency=None):
+        self.stages.append((name, fn, kind, concurrency or STAGE_LIMITS.get(name, 1)))
+        return self
+
+    def _new_stats(self, name, concurrency):
+        self.stats[name] = {"items": 0, "busy": 0.0, "concurrency": concurrency, "queue_peak": 0}
+        return self.stats[name]
+
+    async def run(self, source):
+        """Push every item of source through the stages, returns the items the last stage returned, in order."""
+        loop = asyncio.get_running_loop()
+        io_workers = self.io_workers or STAGE_LIMITS["read"] + sum(
+            concurrency for _, _, kind, concurrency in self.stages if kind == IO)
+        io_pool = concurrent.futures.ThreadPoolExecutor(io_workers, thread_name_prefix="pipeline-io")
+        scheduler = shared_scheduler() if any(kind == CPU for _, _, kind, _ in self.stages) else None
+        queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+        results = {}
+        self.stats.clear()
+        start_time = time.perf_counter()
+
+        async def call(kind, fn, item):
+            if kind == IO:
+                return await loop.run_in_executor(io_pool, _timed, fn, item)
+            if kind == CPU:
+                return await asyncio.wrap_future(scheduler.submit(BULK, _timed, fn, item))
+            return _timed(fn, item)
+
+        async def read():
+            stats = self.stats["read"]
+            iterator = iter(source)
+            index = 0
+            while True:
+                block, busy = await loop.run_in_executor(
+                    io_pool, _timed, lambda: list(itertools.islice(iterator, READ_BLOCK)))
+                stats["busy"] += busy
+                if not block:
+                    break
+                for payload in block:
+                    await queues[0].put({"index": index, "payload": payload})
+                    index += 1
+                stats["items"] += len(block)
+            for _ in range(self.stages[0][3]):
+                await queues[0].put(_DONE)
+
+        async def work(position, running):
+            name, fn, kind, _ = self.stages[position]
+            stats = self.stats[name]
+            inbox = queues[position]
+            outbox = queues[position + 1] if position + 1 < len(queues) else None
+            while True:
+                stats["queue_peak"] = max(stats["queue_peak"], inbox.qsize())
+                item = await inbox.get()
+                if item is _DONE:
+                    break
+                item, busy = await call(kind, fn, item)
+                stats["busy"] += busy
+                stats["items"] += 1
+                if outbox is None:
+                    results[item["index"]] = item
+                else:
+                    await outbox.put(item)
+            #The last worker of a stage to finish passes the end on to every worker of the next
+            running[position] -= 1
+            if running[position] == 0 and outbox is not None:
+                for _ in range(self.stages[position + 1][3]):
+                    await outbox.put(_DONE)
+
+        running = [concurrency for _, _, _, concurrency in self.stages]
+        self._new_stats("read", 1)
+        tasks = [loop.create_task(read())]
+        for position, (name, _, _, concurrency) in enumerate(self.stages):
+            self._new_stats(name, concurrency)
+            tasks.extend(loop.create_task(work(position, running)) for _ in range(concurrency))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            io_pool.shutdown(wait=False)
+            self.seconds = time.perf_counter() - start_time
+        return [results[index] for index in sorted(results)]
+
+    def summary(self):
+        lines = [f"Pipeline: {self.seconds:.2f} seconds."]
+        for name, stats in self.stats.items():
+            lines.append(f"  {name}: {stats['items']} items, busy {stats['busy']:.2f} s over "
+                         f"{stats['concurrency']} slot(s), queue peak {stats['queue_peak']}")
+        busy = sum(stats["busy"] / stats["concurrency"] for stats in self.stats.values())
+        lines.append(f"  Stage time {busy:.2f} s in {self.seconds:.2f} s wall ({busy / max(self.seconds, 1e-9):.1f}x overlap).")
+        return "\n".join(lines)
+
+
+def export_pipeline(directory, hash_files=False, algorithm="SHA-256", encoding="hex", name="code_{index:06d}.png",
+                    scale=8, border=1, dark=code_png.BLACK, light=code_png.WHITE, **params):
+    """Pipeline writing one PNG per payload, or per file digest with hash_files (sources are then file paths)."""
+    os.makedirs(directory, exist_ok=True)
+    pipeline = Pipeline()
+
+    if hash_files:
+        def hash_file(item):
+            item["path"] = item["payload"]
+            #One read of the file on the I/O pool, hashed on the reading thread
+            value = digests.file_digests(item["path"], (algorithm,), threads=False)[algorithm]
+            item["payload"] = digests.encode_digest(value, encoding)
+            return item
+        pipeline.stage("hash", hash_file, IO)
+
+    def encode(item):
+        item["matrix"] = qrcore.make_matrix(item["payload"], **params)
+        return item
+
+    def rasterize(item):
+        item["data"] = code_png.png_bytes(item.pop("matrix"), scale, border, dark, light)
+        return item
+
+    def write(item):
+        item["file"] = os.path.join(directory, name.format(index=item["index"]))
+        with open(item["file"], "wb") as f:
+            f.write(item["data"])
+        item["bytes"] = len(item.pop("data"))
+        return item
+
+    return pipeline.stage("encode", encode, CPU).stage("rasterize", rasterize, CPU).stage("write", write, IO)
+
+
+class QtLoopDriver:
+    """Runs an asyncio loop inside the Qt event loop by stepping it from a QTimer.
+
+    Each step runs the loop for up to interval ms, so coroutines, their done
+    callbacks and the widgets share the GUI thread. A pool task finishing
+    wakes the loop within the step instead of on the next timer tick, and Qt
+    handles its events between steps. The timer only runs while started
+    coroutines are pending.
+    """
+
+    def __init__(self, interval=STEP_INTERVAL):
+        from PyQt5.QtCore import QTimer
+        self.loop = asyncio.new_event_loop()
+        self.interval = interval / 1000
+        self.timer = QTimer()
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.step)
+        self.running = 0
+
+    def step(self):
+        self.loop.call_later(self.interval, self.loop.stop)
+        self.loop.run_forever()
+        if not self.running:
+            self.timer.stop()
+
+    def _finished(self, task):
+        self.running -= 1
+
+    def start(self, coroutine, done=None):
+        """Schedule a coroutine, done(task) is called on the GUI thread when it finishes."""
+        task = self.loop.create_task(coroutine)
+        self.running += 1
+        if done is not None:
+            task.add_done_callback(done)
+        #Added last so the timer keeps stepping until done has run
+        task.add_done_callback(self._finished)
+        self.timer.start()
+        return task
+
+    def watch(self, future, done):
+        """Call done(task) on the GUI thread when a concurrent.futures.Future (a scheduler task) finishes."""
+        return self.start(_wait_future(future), done)
+
+
+async def _wait_future(future):
+    return await asyncio.wrap_future(future)
+
+
+_driver = None
+
+
+def qt_driver():
+    """The process wide QtLoopDriver, created on first use (needs a QApplication)."""
+    global _driver
+    if _driver is None:
+        _driver = QtLoopDriver()
+    return _driver
+
+
+async def run_io(fn, *args):
+    """fn(*args) on the loop's default thread pool, for one-off disk work started from the GUI thread."""
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def file_digests_async(path, algorithms=tuple(digests.ALGORITHMS)):
+    """digests.file_digests off the calling loop's thread."""
+    return await run_io(digests.file_digests, path, algorithms)
+
+
+async def read_blocks(source, size=READ_BLOCK):
+    """Yield lists of up to size items of source, each block read on the loop's default thread pool."""
+    loop = asyncio.get_running_loop()
+    iterator = iter(source)
+    while True:
+        block = await loop.run_in_executor(None, lambda: list(itertools.islice(iterator, size)))
+        if not block:
+            return
+        yield block
+
+
+async def feed_pool_async(executor, fn, blocks, max_pending=64):
+    """payload_stream.feed_pool over an async source of blocks (read_blocks), for coroutines on the loop.
+
+    Results are awaited instead of waited for, so the loop and a window it
+    runs in keep going while the pool works, and up to max_pending tasks stay
+    queued across block boundaries.
+    """
+    pending = collections.deque()
+
+    async def oldest():
+        future = pending.popleft()
+        #A finished task is taken as is, awaiting it would cost a loop step per result
+        return future.result() if future.done() else await asyncio.wrap_future(future)
+
+    async for block in blocks:
+        for payload in block:
+            if len(pending) >= max_pending:
+                yield await oldest()
+            pending.append(executor.submit(fn, payload))
+    while pending:
+        yield await oldest()
+
+
+if __name__ == "__main__":
+    import shutil
+    import argparse
+    import tempfile
+    from payload_stream import read_payloads
+    from serial_range import SerialRange
+
+    parser = argparse.ArgumentParser(description="Export codes through the staged asyncio pipeline.")
+    parser.add_argument("sources", nargs="*", help="Payload file (one per line), or files to hash with --hash-files.")
+    parser.add_argument("--out", help="Output directory (default: a temporary one, compared with the serial export).")
+    parser.add_argument("--hash-files", action="store_true", help="One code per file holding its digest.")
+    parser.add_argument("--count", type=int, default=2000, help="Demo payloads when no source is given.")
+    args = parser.parse_args()
+
+    if args.hash_files:
+        source = args.sources
+    elif args.sources:
+        source = read_payloads(args.sources[0])
+    else:
+        source = SerialRange("https://www.example.com/item/{n}", 1, args.count + 1)
+
+    directory = args.out or tempfile.mkdtemp()
+    pipeline = export_pipeline(directory, hash_files=args.hash_files, error="M")
+    items = asyncio.run(pipeline.run(source))
+    print(f"{len(items)} codes, {sum(item['bytes'] for item in items)} bytes written to {directory}.")
+    print(pipeline.summary())
+
+    if args.out is None:
+        if not args.hash_files and not args.sources:
+            #Same work done serially on this thread
+            serial_directory = tempfile.mkdtemp()
+            start_time = time.perf_counter()
+            files, _ = code_png.export_batch(source, serial_directory, error="M")
+            print(f"Serial export: {files} codes in {time.perf_counter() - start_time:.2f} seconds.")
+            shutil.rmtree(serial_directory)
+        shutil.rmtree(directory)
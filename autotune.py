@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import platform
+import concurrent.futures
+import qrcore
+
+#Measured worker/chunk settings are kept per machine in the user's home directory, written
+#only by an explicit calibration (python autotune.py), windows just read them
+CONFIG_PATH = os.path.join(os.path.expanduser("~"), ".qt_guis_autotune.json")
+
+EXECUTORS = {
+    "thread": concurrent.futures.ThreadPoolExecutor,
+    "process": concurrent.futures.ProcessPoolExecutor,
+}
+
+#What ThreadPoolExecutor() picks on its own, used until a calibration exists
+_DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+DEFAULT_CONFIG = {
+    "thread": {"executor": "thread", "workers": _DEFAULT_WORKERS, "chunk_size": 8, "throughput": 0.0},
+    "process": {"executor": "process", "workers": os.cpu_count() or 1, "chunk_size": 32, "throughput": 0.0},
+    "best": {"executor": "thread", "workers": _DEFAULT_WORKERS, "chunk_size": 8, "throughput": 0.0},
+    "ui_batch": 100,
+}
+
+
+def machine_key():
+    """Identify the machine so a copied config file is not trusted elsewhere."""
+    return f"{platform.node()}-{platform.machine()}-{os.cpu_count()}cpu-py{platform.python_version()}"
+
+
+def _encode_chunk(payloads):
+    """Calibration task: encode a chunk of payloads, module level so processes can pickle it."""
+    for payload in payloads:
+        qrcore.qr_matrix(payload, micro=False)
+    return len(payloads)
+
+
+def measure(kind, workers, chunk_size, payloads):
+    """Return codes per second for one executor type, worker count and chunk size."""
+    chunks = [payloads[i:i + chunk_size] for i in range(0, len(payloads), chunk_size)]
+    with EXECUTORS[kind](max_workers=workers) as executor:
+        #Warm up so process start-up and imports are not timed
+        list(executor.map(_encode_chunk, [payloads[:1]] * workers))
+        start_time = time.perf_counter()
+        done = sum(executor.map(_encode_chunk, chunks))
+        return done / (time.perf_counter() - start_time)
+
+
+def calibrate(payloads=None, kinds=("thread", "process"), worker_counts=None, chunk_sizes=(1, 8, 32),
+              verbose=False):
+    """Measure every combination on a short calibration batch and return the best configuration."""
+    if payloads is None:
+        payloads = [f"https://www.example.com/item/{i}" for i in range(192)]
+    cpus = os.cpu_count() or 1
+    if worker_counts is None:
+        worker_counts = sorted({1, 2, max(1, cpus // 2), cpus, cpus + 4})
+    config = {"machine": machine_key(), "calibrated": time.time(), "results": [],
+              "ui_batch": DEFAULT_CONFIG["ui_batch"]}
+    for kind in kinds:
+        for workers in worker_counts:
+            for chunk_size in chunk_sizes:
+                throughput = measure(kind, workers, chunk_size, payloads)
+                result = {"executor": kind, "workers": workers, "chunk_size": chunk_size,
+                          "throughput": throughput}
+                config["results"].append(result)
+                if verbose:
+                    print(f"{kind:>7} workers={workers:<3} chunk={chunk_size:<3} {throughput:8.1f} codes/s")
+                if kind not in config or throughput > config[kind]["throughput"]:
+                    config[kind] = result
+                if "best" not in config or throughput > config["best"]["throughput"]:
+                    config["best"] = result
+    for kind in EXECUTORS:
+        config.setdefault(kind, DEFAULT_CONFIG[kind])
+    return config
+
+
+def load_config(path=CONFIG_PATH):
+    """Return the persisted configuration for this machine, or None."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f).get(machine_key())
+    except (OSError, ValueError):
+        return None
+
+
+def save_config(config, path=CONFIG_PATH):
+    """Persist the configuration for this machine, keeping entries for other machines."""
+    try:
+        with open(path, "r") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        stored = {}
+    stored[machine_key()] = config
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(stored, f, indent=2)
+    os.replace(temp_path, path)
+
+
+def get_config(path=CONFIG_PATH, calibrate_if_missing=False):
+    """Return the persisted configuration, the defaults if there is none.
+
+    With calibrate_if_missing a short calibration is run and saved instead.
+    """
+    config = load_config(path)
+    if config is None and calibrate_if_missing:
+        try:
+            #Short batch so the first window start only pays a couple of seconds
+            payloads = [f"https://www.example.com/item/{i}" for i in range(64)]
+            config = calibrate(payloads, kinds=("thread",), chunk_sizes=(1, 16))
+            save_config(config, path)
+        except Exception as e:
+            print(f"Autotune calibration failed, using defaults: {e}.")
+    return config or DEFAULT_CONFIG
+
+
+def make_executor(config, kind=None):
+    """Create an executor from a configuration entry ("best" unless kind is given)."""
+    entry = config[kind or "best"]
+    return EXECUTORS[entry["executor"]](max_workers=entry["workers"])
+
+
+class AdaptiveTuner:
+    """Runtime adjustment of the worker count and UI batch size.
+
+    Call record() after every UI batch with the codes finished, the time since
+    the previous batch and how long the batch took to paint (frame_time).
+    When painting a batch took longer than the frame budget, the UI batch
+    shrinks and a worker is released; when throughput drops well under its
+    best level the worker count is nudged (hill climbing) to find the new
+    best. Callers apply workers to their pool (ClassExecutor.set_workers)
+    and to their in-flight window.
+    """
+
+    def __init__(self, config=None, kind="thread", ui_batch=None, frame_budget=0.05, drop_ratio=0.7,
+                 smoothing=0.3):
+        config = config or DEFAULT_CONFIG
+        entry = config.get(kind, DEFAULT_CONFIG[kind])
+        self.max_workers = max(1, entry["workers"])
+        self.workers = self.max_workers
+        self.chunk_size = entry["chunk_size"]
+        self.max_ui_batch = ui_batch or config.get("ui_batch", DEFAULT_CONFIG["ui_batch"])
+        self.ui_batch = self.max_ui_batch
+        self.frame_budget = frame_budget
+        self.drop_ratio = drop_ratio
+        self.smoothing = smoothing
+        self.throughput = None
+        self.best_throughput = 0.0
+        self.step = -1
+        self.adjustments = 0
+
+    def record(self, codes, seconds, frame_time=None):
+        """Feed one batch measurement and adjust workers/ui_batch, returns the smoothed throughput.
+
+        frame_time is the GUI thread's time to put the batch on screen (render
+        and processEvents), the whole interval when not given.
+        """
+        if codes <= 0 or seconds <= 0:
+            return self.throughput
+        current = codes / seconds
+        if self.throughput is None:
+            self.throughput = current
+        else:
+            self.throughput += self.smoothing * (current - self.throughput)
+        self.best_throughput = max(self.best_throughput, self.throughput)
+
+        frame_time = seconds if frame_time is None else frame_time
+        if frame_time > self.frame_budget:
+            #Painting a batch blocks the GUI thread too long: smaller batches and leave it a core
+            if self.ui_batch > 1:
+                self.ui_batch = max(1, self.ui_batch // 2)
+                self.adjustments += 1
+            if self.workers > 1:
+                self.workers -= 1
+                self.adjustments += 1
+        elif frame_time < self.frame_budget / 2:
+            #Plenty of headroom, win back batch size and workers gradually
+            self.ui_batch = min(self.max_ui_batch, self.ui_batch * 2)
+            self.workers = min(self.max_workers, self.workers + 1)
+
+        if self.throughput < self.drop_ratio * self.best_throughput:
+            #Throughput dropped, try the other direction and restart the comparison
+            self.step = -self.step
+            self.workers = min(self.max_workers, max(1, self.workers + self.step))
+            self.best_throughput = self.throughput
+            self.adjustments += 1
+        return self.throughput
+
+    def summary(self):
+        """Return the current settings for the run summary."""
+        return (f"Autotune: {self.workers}/{self.max_workers} workers, chunk {self.chunk_size}, "
+                f"UI batch {self.ui_batch}, {self.adjustments} adjustments.")
+
+
+if __name__ == "__main__":
+    print(f"Calibrating on {machine_key()}.")
+    config = calibrate(verbose=True)
+    save_config(config)
+    best = config["best"]
+    print(f"Best: {best['executor']} executor, {best['workers']} workers, chunk size {best['chunk_size']} "
+          f"({best['throughput']:.1f} codes/s).")
+    print(f"Saved to {CONFIG_PATH}.")
@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import zlib
+import struct
+import hashlib
+import numpy as np
+import qrcore
+
+#PNG writer for code images: 1-bit grayscale for black on white, else a two entry palette
+#(index 0 light, 1 dark, like palette.indexed_image). Rows are packed straight from the
+#scaled module matrix and the whole image is one zlib stream in one IDAT chunk.
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+GRAYSCALE = 0
+PALETTE = 3
+BLACK = "#000000"
+WHITE = "#FFFFFF"
+DEFAULT_LEVEL = 6
+MANIFEST_NAME = ".export-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def _rgb(colour):
+    """(r, g, b) for a "#RRGGBB" string or an (r, g, b) tuple."""
+    if isinstance(colour, str):
+        value = colour.lstrip("#")
+        if len(value) != 6:
+            raise ValueError(f"Colour must be #RRGGBB: {colour}.")
+        return bytes.fromhex(value)
+    return bytes(colour[:3])
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def png_bytes(matrix, scale=8, border=1, dark=BLACK, light=WHITE, level=DEFAULT_LEVEL):
+    """Encode a module matrix (1 = dark) as a 1-bit PNG and return the file contents."""
+    pixels = qrcore.scale_matrix(matrix, scale, border).astype(bool)
+    height, width = pixels.shape
+    dark, light = _rgb(dark), _rgb(light)
+    if dark == b"\0\0\0" and light == b"\xff\xff\xff":
+        #Grayscale bit 1 is white, so the dark modules are the zero bits
+        colour_type, palette = GRAYSCALE, b""
+        pixels = ~pixels
+    else:
+        colour_type, palette = PALETTE, _chunk(b"PLTE", light + dark)
+    packed = np.packbits(pixels, axis=1)
+    #Every row starts with filter type 0 (none), repeated rows compress to almost nothing
+    rows = np.zeros((height, packed.shape[1] + 1), dtype=np.uint8)
+    rows[:, 1:] = packed
+    header = struct.pack(">IIBBBBB", width, height, 1, colour_type, 0, 0, 0)
+    return (SIGNATURE + _chunk(b"IHDR", header) + palette +
+            _chunk(b"IDAT", zlib.compress(rows.tobytes(), level)) + _chunk(b"IEND", b""))
+
+
+def write_png(path, matrix, scale=8, border=1, dark=BLACK, light=WHITE, level=DEFAULT_LEVEL):
+    """Write a module matrix to a PNG file, returns the number of bytes written."""
+    data = png_bytes(matrix, scale, border, dark, light, level)
+    with open(path, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def export_batch(payloads, directory, name="code_{index:06d}.png", scale=8, border=1, dark=BLACK,
+                 light=WHITE, level=DEFAULT_LEVEL, **params):
+    """Encode payloads and write one PNG each into directory, returns (files, bytes)."""
+    os.makedirs(directory, exist_ok=True)
+    files = total = 0
+    for index, payload in enumerate(payloads):
+        matrix = qrcore.make_matrix(payload, **params)
+        total += write_png(os.path.join(directory, name.format(index=index)), matrix, scale, border,
+                           dark, light, level)
+        files += 1
+    return files, total
+
+
+def load_manifest(directory):
+    """Return {file name: [code key hex, sha256, size]} from an export directory, empty when there is none."""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("entries", {}) if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def save_manifest(directory, entries):
+    path = os.path.join(directory, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "entries": entries}, f)
+    os.replace(path + ".tmp", path)
+
+
+def _on_disk(path, size, digest=None):
+    """True when path holds size bytes (with that sha256 hex digest, when given)."""
+    try:
+        if os.path.getsize(path) != size:
+            return False
+        if digest is not None:
+            with open(path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest() == digest
+        return True
+    except OSError:
+        return False
+
+
+def export_incremental(payloads, directory, name="code_{index:06d}.png", scale=8, border=1, dark=BLACK,
+                       light=WHITE, level=DEFAULT_LEVEL, verify=False, **params):
+    """Export like export_batch, but only render codes whose payload or parameters changed.
+
+    The manifest maps every file to the key of (payload, parameters) it was
+    rendered from and the digest of its contents. A file is skipped when its
+    key is unchanged and it is still on disk with the recorded size (and
+    digest, with verify). Files in the manifest the batch no longer produces
+    are deleted. Returns a report dict of the counts.
+    """
+    start_time = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    previous = load_manifest(directory)
+    entries = {}
+    report = {"written": 0, "skipped": 0, "same_content": 0, "deleted": 0, "bytes_written": 0}
+    options = dict(params, scale=scale, border=border, dark=dark, light=light, level=level)
+    for index, payload in enumerate(payloads):
+        file_name = name.format(index=index)
+        path = os.path.join(directory, file_name)
+        key = qrcore.code_key(payload, **options).hex()
+        entry = previous.get(file_name)
+        if entry is not None and entry[0] == key and _on_disk(path, entry[2], entry[1] if verify else None):
+            entries[file_name] = entry
+            report["skipped"] += 1
+            continue
+        data = png_bytes(qrcore.make_matrix(payload, **params), scale, border, dark, light, level)
+        digest = hashlib.sha256(data).hexdigest()
+        entries[file_name] = [key, digest, len(data)]
+        if entry is not None and entry[0] != key and entry[1] == digest and _on_disk(path, len(data), digest):
+            #New key but identical output (e.g. only the zlib level changed back), keep the file
+            report["same_content"] += 1
+            continue
+        #New, changed or damaged on disk
+        with open(path, "wb") as f:
+            f.write(data)
+        report["written"] += 1
+        report["bytes_written"] += len(data)
+    for file_name in previous.keys() - entries.keys():
+        try:
+            os.remove(os.path.join(directory, file_name))
+            report["deleted"] += 1
+        except FileNotFoundError:
+            pass
+    save_manifest(directory, entries)
+    report["files"] = len(entries)
+    report["seconds"] = time.perf_counter() - start_time
+    return report
+
+
+def print_export_report(report):
+    print(f"Export: {report['files']} files in {report['seconds']:.2f} seconds, {report['written']} written "
+          f"({report['bytes_written'] / 1024:.0f} KB), {report['skipped']} skipped unchanged, "
+          f"{report['same_content']} re-rendered with identical output, {report['deleted']} orphans deleted.")
+
+
+def decoded_matrix(data, scale=8, border=1):
+    """Decode PNG data with Pillow and sample it back to modules (1 = dark) for validation."""
+    import io
+    from PIL import Image
+    image = np.array(Image.open(io.BytesIO(data)).convert("L"))
+    modules = image[border * scale + scale // 2::scale, border * scale + scale // 2::scale]
+    size = image.shape[0] // scale - 2 * border
+    return (modules[:size, :size] < 128).astype(np.uint8)
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import tempfile
+    import segno
+    from PyQt5.QtGui import QImage, QPixmap
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QBuffer, QIODevice
+    from palette import indexed_image
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QApplication(sys.argv[:1])
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    payloads = [f"https://www.example.com/item/{i}" for i in range(count)]
+    matrices = [qrcore.qr_matrix(payload) for payload in payloads]
+
+    #Validate against Pillow and Qt's decoders, black on white and a palette colour
+    for dark in (BLACK, "#DC143C"):
+        for matrix in matrices[:50]:
+            data = png_bytes(matrix, dark=dark)
+            assert np.array_equal(decoded_matrix(data), matrix), "Pillow decode differs from the matrix."
+            image = QImage.fromData(data)
+            assert not image.isNull() and image.width() == (matrix.shape[1] + 2) * 8, "Qt failed to decode."
+            assert QImage.fromData(data).pixelColor(8, 8).name().upper() == dark.upper()
+    print("Validated against Pillow and Qt decoders.")
+
+    def timed(label, encode):
+        start_time = time.perf_counter()
+        sizes = [len(encode(matrix, payload)) for matrix, payload in zip(matrices, payloads)]
+        elapsed = time.perf_counter() - start_time
+        print(f"{label:<32} {count / elapsed:8.0f} files/s, {sum(sizes) / count:6.0f} bytes/file")
+
+    codes = {payload: segno.make(payload, micro=False) for payload in payloads}
+
+    def segno_png(matrix, payload):
+        buffer = io.BytesIO()
+        codes[payload].save(buffer, kind="png", scale=8, border=1)
+        return buffer.getvalue()
+
+    def qpixmap_png(matrix, payload):
+        buffer = QBuffer()
+        buffer.open(QIODevice.WriteOnly)
+        QPixmap.fromImage(indexed_image(matrix, 8, 1)).save(buffer, "PNG")
+        return bytes(buffer.data())
+
+    print(f"{count} codes, scale 8, border 1, encoding excluded:")
+    timed("segno save", segno_png)
+    timed("QPixmap.save", qpixmap_png)
+    for level in (1, 6, 9):
+        timed(f"code_png grayscale, zlib {level}", lambda matrix, payload: png_bytes(matrix, level=level))
+    timed("code_png palette, zlib 6", lambda matrix, payload: png_bytes(matrix, dark="#DC143C"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        start_time = time.perf_counter()
+        files, total = export_batch(payloads, directory)
+        elapsed = time.perf_counter() - start_time
+        print(f"Export with encoding: {files} files, {total / 1024:.0f} KB in {elapsed:.2f} seconds "
+              f"({files / elapsed:.0f} files/s).")
+
+        #Incremental reruns: first run renders everything, then 1% changed and the tail dropped
+        print_export_report(export_incremental(payloads, directory))
+        changed = [payload + "?v=2" if i % 100 == 0 else payload for i, payload in enumerate(payloads)]
+        print_export_report(export_incremental(changed[:count - count // 10], directory))
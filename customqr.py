@@ -1,14 +1,17 @@
 import sys
-import segno
-import io
-import numpy as np
 import time
-import hashlib
-from pylibdmtx import pylibdmtx
-from PIL import Image
+import asyncio
+import digests
+import qrcore
+import label_printer
+import code_png
+import profiler
+import async_pipeline
+from scheduler import shared_scheduler, INTERACTIVE
+from palette import indexed_image, colour_table
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QFormLayout, QComboBox,
                              QLineEdit, QPushButton, QLabel, QRadioButton, QFileDialog,
-                             QVBoxLayout, QColorDialog, QMessageBox)
+                             QVBoxLayout, QColorDialog, QMessageBox, QCheckBox)
 from PyQt5.QtGui import QPixmap, QColor
 from PyQt5.QtCore import Qt
 
@@ -31,13 +34,21 @@ class QRMatrixGenerator(QMainWindow):
         self.code_type_combo.addItems(["QR Code", "Data Matrix"])
         form_layout.addRow("Code Type:", self.code_type_combo)
 
-        #Data type (URL or SHA256 hash)
+        #Data type (URL or file hash)
         self.url_radio = QRadioButton("URL")
-        self.hash_radio = QRadioButton("SHA-256 Hash")
+        self.hash_radio = QRadioButton("File Hash")
         self.url_radio.setChecked(True)
         form_layout.addRow("Data Type", self.url_radio)
         form_layout.addRow("", self.hash_radio)
 
+        #Digest on the label and how it is written, binary and base32 give the smallest symbols
+        self.digest_combo = QComboBox()
+        self.digest_combo.addItems(list(digests.ALGORITHMS))
+        form_layout.addRow("Digest:", self.digest_combo)
+        self.encoding_combo = QComboBox()
+        self.encoding_combo.addItems(["Hex", "Hex (uppercase)", "Base32", "Binary"])
+        form_layout.addRow("Digest Encoding:", self.encoding_combo)
+
         #Data input (URL or file path)
         self.data_input = QLineEdit()
         self.data_input.setPlaceholderText("Enter URL or select file.")
@@ -56,14 +67,18 @@ class QRMatrixGenerator(QMainWindow):
 
         #Error correction level
         self.error_combo = QComboBox()
-        self.error_combo.addItems("Low", "Medium", "Quartile", "High")
+        self.error_combo.addItems(["Low", "Medium", "Quartile", "High"])
         form_layout.addRow("Error Correction:", self.error_combo)
 
+        #Mixed mode segments, hex hashes and URL hosts uppercased so they fit alphanumeric mode
+        self.optimize_check = QCheckBox("Compact encoding (smaller QR version)")
+        form_layout.addRow("Encoding:", self.optimize_check)
+
         #Color picker
         self.color_button = QPushButton("Choose Color.")
         self.color_button.clicked.connect(self.choose_color)
         self.color_label = QLabel ("Black (default).")
-        self.color = Qt.black #Default black
+        self.color = QColor(Qt.black) #Default black
         form_layout.addRow("Color:", self.color_button)
         form_layout.addRow("Selected Color:", self.color_label)
 
@@ -88,12 +103,22 @@ class QRMatrixGenerator(QMainWindow):
         main_layout.addWidget(self.save_button)
         main_layout.addStretch()
 
-        #Generated Pixmap for saving
+        #Generated indexed image and its Pixmap for saving
+        self.image = None
         self.pixmap = None
 
+        #Ctrl+Shift+P starts and stops a profile capture tagged with the current form settings
+        profiler.install(self, lambda: {"code_type": self.code_type_combo.currentText(),
+                                        "data_type": "hash" if self.hash_radio.isChecked() else "url",
+                                        "digest": self.digest_combo.currentText(),
+                                        "encoding": self.encoding_combo.currentText(),
+                                        "size": self.size_combo.currentText(),
+                                        "error": self.error_combo.currentText(),
+                                        "optimize": self.optimize_check.isChecked(), "color": self.color.name()})
+
     #File picker
     def select_file(self):
-        """Open file dialog to select a file for SHA-256 Hashing."""
+        """Open file dialog to select a file for hashing."""
         file_path, _ = QFileDialog.getOpenFileName(self, "Select File.")
         if file_path:
             self.data_input.setText(file_path)
@@ -106,31 +131,40 @@ class QRMatrixGenerator(QMainWindow):
         if color.isValid():
             self.color = color
             self.color_label.setText(color.name())
+            #Recolour the displayed code by swapping its colour table, no re-encoding
+            if self.image is not None:
+                self.image.setColorTable(colour_table(color))
+                self.show_image()
+
+    #Every digest for the records comes from one read of the file, the label shows the chosen one
+    def compute_digest(self, file_path, start_time):
+        """Hash a file once for all digests off the GUI thread, then generate the code from the chosen digest."""
+        algorithm = self.digest_combo.currentText()
+        encoding = digests.ENCODINGS[self.encoding_combo.currentIndex()]
+        self.generate_button.setEnabled(False)
+
+        def hashed(task):
+            #Called on the GUI thread by the Qt driven asyncio loop
+            self.generate_button.setEnabled(True)
+            try:
+                values = task.result()
+            except (Exception, asyncio.CancelledError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to hash file: {e or 'cancelled'}.")
+                return
+            for name, digest in values.items():
+                print(f"{name}: {digest.hex()}")
+            self.encode_payload(digests.encode_digest(values[algorithm], encoding), start_time)
 
-    #Compute SHA-256, utilize proper chunks of data and ensure to code and decode properly.
-    def compute_sha256(self, file_path):
-        """Compute SHA 256 Hash of a file."""
-        sha256 = hashlib.sha256()
-        try:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    sha256.update(chunk)
-                return sha256.hexdigest()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to hash file: {e}.")
-            return None
+        #The window keeps painting while a large file is read
+        async_pipeline.qt_driver().start(async_pipeline.file_digests_async(file_path), hashed)
         
     def generate_code(self):
         """Generate QR code or Data Matrix based on user input"""
         start_time = time.time()
 
         #Get user inputs
-        code_type = self.code_type_combo.currentText()
         is_url = self.url_radio.isChecked()
         data = self.data_input.text()
-        size_index = self.size_combo.currentIndex()
-        error_level = self.error_combo.currentText()
-        color = self.color.name()
 
         #Validate input
         if not data:
@@ -139,13 +173,18 @@ class QRMatrixGenerator(QMainWindow):
         
         #Handle data type
         if is_url:
-            data_to_encode = data
+            self.encode_payload(data, start_time)
         else:
-            #Compute SHA256 hash
-            data_to_encode = self.compute_sha256(data)
-            if not data_to_encode:
-                return
-            
+            #Hash the file, the chosen digest in the chosen encoding, the code follows when the hash is done
+            self.compute_digest(data, start_time)
+
+    def encode_payload(self, data_to_encode, start_time):
+        """Encode a payload with the form settings and show it."""
+        code_type = self.code_type_combo.currentText()
+        size_index = self.size_combo.currentIndex()
+        error_level = self.error_combo.currentText()
+        color = self.color.name()
+
         #Map size to QR code version or Data Matrix size
 
         qr_versions = [1, 2, 3, 5] #Approx 19x19, 23x23, 27x27, 33x33
@@ -157,47 +196,79 @@ class QRMatrixGenerator(QMainWindow):
         error_map = {"Low": "L", "Medium": "M", "Quartile": "Q", "High": "H"}
         error = error_map[error_level] if code_type == "QR Code" else None
 
-        try:
-            #Generate QR code or Data Matrix
-            buffer = io.BytesIO()
-            if code_type == "QR Code":
-                qr = segno.make(data_to_encode, micro = False, version = version, error = error)
-                qr.save(buffer, kind = "png", scale = 8, dark = color, border = 1)
-            else: #Data Matrix
-                encoded = pylibdmtx.encode(data_to_encode.encode('utf-8'), size = dm_size)
-                img = Image.frombytes('RGB', (encoded.width, encoded.height), encoded.pixels)
-                img = img.convert("RGBA")
-                data = np.array(img)
-                r, g, b = QColor(color).getRgb()[:3]
-                black = (data[:, :, 0] == 0) & (data[:, :, 1] == 0) & (data[:, :, 2] == 0)
-                data[black] = (r, g, b, 255)
-                img = Image.fromarray(data)
-                img.save(buffer, format='PNG')
-
-            #Convert to QPixmap for display
-            self.pixmap = QPixmap()
-            self.pixmap.loadFromData(buffer.getvalue())
-            self.display_label.setPixmap(self.pixmap.scaled(200, 200, Qt.KeepAspectRatio))
+        #Generate the QR code or Data Matrix module grid
+        #Interactive class on the shared workers, a running table batch yields to it
+        if code_type == "QR Code":
+            future = shared_scheduler().submit(INTERACTIVE, qrcore.qr_matrix, data_to_encode, version = version,
+                                               error = error, micro = False,
+                                               optimize = self.optimize_check.isChecked())
+        else: #Data Matrix
+            future = shared_scheduler().submit(INTERACTIVE, qrcore.dm_matrix, data_to_encode, size = dm_size)
+        self.generate_button.setEnabled(False)
+
+        def encoded(task):
+            #Called on the GUI thread by the Qt driven asyncio loop, the window kept painting meanwhile
+            self.generate_button.setEnabled(True)
+            try:
+                matrix = task.result()
+            except (Exception, asyncio.CancelledError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to generate code: {e or 'cancelled'}.")
+                self.save_button.setEnabled(False)
+                return
+
+            #Indexed image, the colour lives only in its colour table
+            self.matrix = matrix
+            self.image = indexed_image(matrix, scale = 8, border = 1, dark = color)
+            self.show_image()
             self.save_button.setEnabled(True)
 
             #Print Performance
             elapsed = time.time() - start_time
             print(f"Generation time: {elapsed:.2f} seconds.")
 
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to generate code: {e}.")
-            self.save_button.setEnabled(False)
+        async_pipeline.qt_driver().watch(future, encoded)
+
+    def show_image(self):
+        """Convert the indexed image to a QPixmap for display and saving."""
+        self.pixmap = QPixmap.fromImage(self.image)
+        self.display_label.setPixmap(self.pixmap.scaled(200, 200, Qt.KeepAspectRatio))
 
     def save_image(self):
         """Save the generated QR code/Data Matrix as an image."""
         if not self.pixmap:
             QMessageBox.warning(self, "Error.", "No image to save.")
             return
-        file_path, _ = QFileDialog.getSaveFileName(self, "Save Image", "", "PNG Files (*.png)")
-        if file_path:
-            self.pixmap.save(file_path, "PNG")
+        file_path, file_filter = QFileDialog.getSaveFileName(
+            self, "Save Image", "", "PNG Files (*.png);;ZPL Label (*.zpl);;PCL Label (*.pcl)")
+        if not file_path:
+            return
+        matrix = self.matrix
+        dark = self.color.name()
+
+        def write():
+            if file_filter.startswith("PNG"):
+                #1-bit PNG from the modules instead of a 32-bit QPixmap.save
+                code_png.write_png(file_path, matrix, scale = 8, border = 1, dark = dark)
+            else:
+                #1-bit printer raster straight from the modules, no PNG on the print path
+                language = label_printer.ZPL if file_filter.startswith("ZPL") else label_printer.PCL
+                with label_printer.LabelPrinterWriter(file_path, language) as writer:
+                    writer.add_label(matrix)
+
+        def saved(task):
+            #Called on the GUI thread by the Qt driven asyncio loop
+            self.save_button.setEnabled(True)
+            try:
+                task.result()
+            except (Exception, asyncio.CancelledError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to save image: {e or 'cancelled'}.")
+                return
             QMessageBox.information(self, "Success", "Image saved successfully.")
 
+        #The file is written on the I/O pool, the window keeps painting on a slow disk
+        self.save_button.setEnabled(False)
+        async_pipeline.qt_driver().start(async_pipeline.run_io(write), saved)
+
 if __name__ == "__main__":
     try:
         QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
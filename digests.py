@@ -0,0 +1,137 @@
+import queue
+import base64
+import hashlib
+import threading
+
+#File digests for the hash payload type: every requested algorithm is fed from one read
+#pass, so a multi-GB file is read once however many digests the records need.
+
+ALGORITHMS = {
+    "SHA-256": "sha256",
+    "SHA-512": "sha512",
+    "BLAKE2b": "blake2b",
+}
+
+#Payload encodings, smallest symbol last: hex is byte mode, uppercase hex and unpadded
+#base32 fit alphanumeric mode, binary puts the raw digest bytes in byte mode
+ENCODINGS = ("hex", "HEX", "base32", "binary")
+
+CHUNK_SIZE = 1024 * 1024  #Large reads, hashlib only releases the GIL above 2 KB
+QUEUE_DEPTH = 4  #Chunks read ahead of the slowest digest
+
+
+def _new(algorithm):
+    return hashlib.new(ALGORITHMS.get(algorithm, algorithm))
+
+
+def _hash_worker(hasher, chunks):
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        hasher.update(chunk)
+
+
+def file_digests(source, algorithms=("SHA-256",), chunk_size=CHUNK_SIZE, threads=None):
+    """Return {algorithm: digest bytes} for a file path or binary file object, reading it once.
+
+    With more than one algorithm each digest runs on its own thread fed
+    through a small bounded queue (threads=False keeps everything on the
+    calling thread).
+    """
+    hashers = {algorithm: _new(algorithm) for algorithm in algorithms}
+    stream = open(source, "rb") if isinstance(source, (str, bytes)) or hasattr(source, "__fspath__") else source
+    try:
+        if threads is False or len(hashers) < 2:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                for hasher in hashers.values():
+                    hasher.update(chunk)
+        else:
+            queues = [queue.Queue(QUEUE_DEPTH) for _ in hashers]
+            workers = [threading.Thread(target=_hash_worker, args=(hasher, chunks), daemon=True)
+                       for hasher, chunks in zip(hashers.values(), queues)]
+            for worker in workers:
+                worker.start()
+            try:
+                #Chunks are immutable bytes, every worker reads the same object
+                for chunk in iter(lambda: stream.read(chunk_size), b""):
+                    for chunks in queues:
+                        chunks.put(chunk)
+            finally:
+                for chunks in queues:
+                    chunks.put(None)
+                for worker in workers:
+                    worker.join()
+    finally:
+        if stream is not source:
+            stream.close()
+    return {algorithm: hasher.digest() for algorithm, hasher in hashers.items()}
+
+
+def encode_digest(digest, encoding="hex"):
+    """Digest bytes as a payload: str for the text encodings, bytes for binary."""
+    if encoding == "hex":
+        return digest.hex()
+    if encoding == "HEX":
+        return digest.hex().upper()
+    if encoding == "base32":
+        return base64.b32encode(digest).decode("ascii").rstrip("=")
+    if encoding == "binary":
+        return bytes(digest)
+    raise ValueError(f"Unknown digest encoding: {encoding}.")
+
+
+def decode_digest(payload, encoding="hex"):
+    """Digest bytes back from a payload (for checking a scanned label against the records)."""
+    if encoding in ("hex", "HEX"):
+        return bytes.fromhex(payload)
+    if encoding == "base32":
+        return base64.b32decode(payload + "=" * (-len(payload) % 8))
+    if encoding == "binary":
+        return payload.encode("iso-8859-1") if isinstance(payload, str) else bytes(payload)
+    raise ValueError(f"Unknown digest encoding: {encoding}.")
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import time
+    import tempfile
+    import segno
+    import segments
+
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    algorithms = tuple(ALGORITHMS)
+    with tempfile.NamedTemporaryFile(delete=False) as f:
+        block = os.urandom(CHUNK_SIZE)
+        for _ in range(size_mb):
+            f.write(block)
+        path = f.name
+    try:
+        #Warm the page cache so every variant reads from memory alike
+        file_digests(path, ("SHA-256",))
+
+        start_time = time.perf_counter()
+        separate = {algorithm: file_digests(path, (algorithm,))[algorithm] for algorithm in algorithms}
+        print(f"{size_mb} MB, one pass per digest:   {time.perf_counter() - start_time:.2f} seconds.")
+        start_time = time.perf_counter()
+        serial = file_digests(path, algorithms, threads=False)
+        print(f"{size_mb} MB, one pass, serial:      {time.perf_counter() - start_time:.2f} seconds.")
+        start_time = time.perf_counter()
+        threaded = file_digests(path, algorithms)
+        print(f"{size_mb} MB, one pass, threaded:    {time.perf_counter() - start_time:.2f} seconds "
+              f"({os.cpu_count()} cpu).")
+        assert separate == serial == threaded, "Digests differ between passes."
+    finally:
+        os.remove(path)
+
+    #Symbol size per payload encoding
+    for algorithm in algorithms:
+        line = []
+        for encoding in ENCODINGS:
+            payload = encode_digest(threaded[algorithm], encoding)
+            assert decode_digest(payload, encoding) == threaded[algorithm]
+            plain = segno.make(payload, error="M", micro=False)
+            optimized = segments.make(payload, error="M") if isinstance(payload, str) else plain
+            line.append(f"{encoding} v{min(plain.version, optimized.version)}")
+        print(f"{algorithm} ({len(threaded[algorithm])} bytes), ECC M: {', '.join(line)}.")
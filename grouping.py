@@ -0,0 +1,178 @@
+import time
+from PyQt5.QtGui import QPainter, QColor, QFont
+from PyQt5.QtCore import Qt, QRect
+from palette import CodeView
+from serial_range import SerialRange
+
+#Duplicate collapsing for the grid views: one cell per distinct payload with a count badge,
+#the indices it stands for kept as arithmetic runs (3000 repeats of a URL are one run
+#whether they sit in a block or every third cell).
+
+
+class IndexRuns:
+    """Ascending indices stored as (start, last, step) runs, appended in order."""
+
+    def __init__(self):
+        self.runs = []
+        self.count = 0
+
+    def add(self, index):
+        self.count += 1
+        if self.runs:
+            start, last, step = self.runs[-1]
+            if last == start:
+                self.runs[-1] = (start, index, index - start)
+                return
+            if index - last == step:
+                self.runs[-1] = (start, index, step)
+                return
+        self.runs.append((index, index, 1))
+
+    def add_range(self, indices):
+        """Append a whole range at once (the SerialRange fast path)."""
+        if len(indices):
+            self.runs.append((indices[0], indices[-1], indices.step if len(indices) > 1 else 1))
+            self.count += len(indices)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for start, last, step in self.runs:
+            yield from range(start, last + 1, step)
+
+    def text(self, limit=None):
+        """Runs as "0-2999", "2-8999 every 3rd" or single indices, at most limit runs."""
+        parts = []
+        for start, last, step in self.runs[:limit]:
+            if start == last:
+                parts.append(str(start))
+            elif step == 1:
+                parts.append(f"{start}-{last}")
+            else:
+                parts.append(f"{start}-{last} every {step}")
+        if limit is not None and len(self.runs) > limit:
+            parts.append(f"... {len(self.runs) - limit} more runs")
+        return ", ".join(parts)
+
+
+class PayloadGroup:
+    """One distinct payload, its first index and every index showing it."""
+
+    __slots__ = ("payload", "indices")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.indices = IndexRuns()
+
+    @property
+    def count(self):
+        return len(self.indices)
+
+    @property
+    def first(self):
+        return self.indices.runs[0][0]
+
+
+class PayloadGroups:
+    """Counting pass over a payload sequence, groups in order of first appearance.
+
+    A SerialRange whose template holds {n} is grouped arithmetically (every serial
+    number is distinct, its repeats are one block), anything else is counted
+    with one dict lookup per payload.
+    """
+
+    def __init__(self, payloads, count=None):
+        start_time = time.perf_counter()
+        count = len(payloads) if count is None else count
+        self.total = count
+        self.groups = []
+        if isinstance(payloads, SerialRange) and "{n}" in payloads.template:
+            repeat = payloads.repeat
+            for position in range(-(-count // repeat)):
+                group = PayloadGroup(payloads[position * repeat])
+                group.indices.add_range(range(position * repeat, min(count, (position + 1) * repeat)))
+                self.groups.append(group)
+        else:
+            by_payload = {}
+            for index, payload in zip(range(count), payloads):
+                group = by_payload.get(payload)
+                if group is None:
+                    group = by_payload[payload] = PayloadGroup(payload)
+                    self.groups.append(group)
+                group.indices.add(index)
+        self.seconds = time.perf_counter() - start_time
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __getitem__(self, position):
+        return self.groups[position]
+
+    def payloads(self):
+        """Distinct payloads in group order, what the grouped grid encodes."""
+        return [group.payload for group in self.groups]
+
+    def summary(self):
+        return (f"Grouped {self.total} codes into {len(self.groups)} distinct "
+                f"({self.total / max(1, len(self.groups)):.0f}x fewer cells), counting pass {self.seconds*1000:.2f} ms.")
+
+
+class GroupView(CodeView):
+    """CodeView with a repeat count badge, double click expands the index runs over the code."""
+
+    def __init__(self, image, size, group, parent=None, key=None):
+        super().__init__(image, size, parent, key)
+        self.group = group
+        self.expanded = False
+        self.setToolTip(f"{group.payload}\n{group.count} codes: {group.indices.text(limit=20)}")
+
+    def mouseDoubleClickEvent(self, event):
+        self.expanded = not self.expanded
+        self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if self.group.count < 2 and not self.expanded:
+            return
+        painter = QPainter(self)
+        font = QFont(painter.font())
+        font.setPointSize(8)
+        font.setBold(True)
+        painter.setFont(font)
+        if self.expanded:
+            painter.fillRect(self.rect(), QColor(255, 255, 255, 220))
+            painter.setPen(QColor(Qt.black))
+            painter.drawText(self.rect().adjusted(4, 4, -4, -4), Qt.TextWordWrap,
+                             f"x{self.group.count}: {self.group.indices.text(limit=12)}")
+        else:
+            text = f"x{self.group.count}"
+            width = painter.fontMetrics().horizontalAdvance(text) + 8
+            badge = QRect(self.width() - width - 2, 2, width, painter.fontMetrics().height() + 2)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setBrush(QColor(220, 20, 60))
+            painter.setPen(Qt.NoPen)
+            painter.drawRoundedRect(badge, 6, 6)
+            painter.setPen(QColor(Qt.white))
+            painter.drawText(badge, Qt.AlignCenter, text)
+        painter.end()
+
+
+if __name__ == "__main__":
+    import random
+
+    #The demo windows' payloads and a shuffled reprint batch
+    urls = SerialRange("https://www.example.com/{n}", 1, 4, repeat=3000)
+    groups = PayloadGroups(urls)
+    print(groups.summary())
+    for group in groups:
+        print(f"  {group.payload}: x{group.count}, indices {group.indices.text()}")
+
+    rng = random.Random(1)
+    batch = [f"https://www.example.com/item/{rng.randrange(20000)}" for _ in range(100000)]
+    groups = PayloadGroups(batch)
+    print(groups.summary())
+    assert sum(group.count for group in groups) == len(batch)
+    assert all(batch[index] == group.payload for group in groups[:50] for index in group.indices)
+    cycled = PayloadGroups([f"https://www.example.com/{n}" for n in (1, 2, 3)] * 3000)
+    print(cycled.summary(), f"First group: {cycled[0].indices.text()}.")
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import contextlib
+import numpy as np
+
+#Offscreen GUI performance harness.
+#
+#Opens one of the grid windows under the Qt offscreen platform and scripts scrolls, resizes
+#and zooms over its QTableWidget (or the QScrollArea around the QGridLayout). Every step is
+#one frame: the scripted change, the events it causes and a synchronous full paint of the
+#window. A probe timer runs alongside to measure how late the event loop gets to it.
+#
+#    python gui_perf.py QRTable_Label --output label.json --compare label_before.json
+
+WINDOWS = ("QRCode_Table", "QRTable_Label", "QR_Code_GeneratorV2")
+FRAME_BUDGET = 1 / 60
+PROBE_INTERVAL_MS = 5
+
+
+def _stats(values, budget=None, unit="frames"):
+    """Summary statistics in milliseconds for a list of durations in seconds."""
+    if not values:
+        return {unit: 0}
+    ms = np.array(values) * 1000
+    result = {
+        unit: len(values),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max()),
+    }
+    if budget is not None:
+        #A frame that takes n budgets long hides n - 1 refreshes
+        result["dropped"] = int(np.maximum(np.ceil(ms / (budget * 1000)) - 1, 0).sum())
+    return result
+
+
+class Harness:
+    """Run scripted steps inside the event loop and record frame, paint and latency times."""
+
+    def __init__(self, app, window, budget=FRAME_BUDGET):
+        from PyQt5.QtCore import QTimer
+        self.app = app
+        self.window = window
+        self.budget = budget
+        self.frames = {}  #step kind -> [(frame seconds, paint seconds)]
+        self.latencies = []
+        self.probe = QTimer()
+        self.probe.setInterval(PROBE_INTERVAL_MS)
+        self.probe.timeout.connect(self._probe)
+        self.last_probe = None
+
+    def _probe(self):
+        now = time.perf_counter()
+        if self.last_probe is not None:
+            self.latencies.append(max(0.0, now - self.last_probe - PROBE_INTERVAL_MS / 1000))
+        self.last_probe = now
+
+    def run(self, steps):
+        """Execute (kind, action) steps one per event loop turn, returns when all are done."""
+        from PyQt5.QtCore import QEventLoop, QTimer
+        loop = QEventLoop()
+        pending = list(steps)
+
+        def next_step():
+            if not pending:
+                loop.quit()
+                return
+            kind, action = pending.pop(0)
+            start_time = time.perf_counter()
+            action()
+            self.app.sendPostedEvents()
+            paint_start = time.perf_counter()
+            #grab() paints the whole widget tree synchronously (repaint() skips children that
+            #are not dirty), a full frame rather than the scrolled strip Qt would blit
+            self.window.grab()
+            end_time = time.perf_counter()
+            self.frames.setdefault(kind, []).append((end_time - start_time, end_time - paint_start))
+            QTimer.singleShot(0, next_step)
+
+        self.last_probe = None
+        self.probe.start()
+        QTimer.singleShot(0, next_step)
+        loop.exec_()
+        self.probe.stop()
+
+    def report(self):
+        """Per step kind frame and paint statistics plus event loop latency."""
+        result = {}
+        for kind, frames in self.frames.items():
+            result[kind] = _stats([frame for frame, _ in frames], self.budget)
+            result[kind]["paint"] = _stats([paint for _, paint in frames])
+        every = [frame for frames in self.frames.values() for frame, _ in frames]
+        result["all"] = _stats(every, self.budget)
+        result["event_loop_latency"] = _stats(self.latencies, unit="samples")
+        return result
+
+
+def _scroll_area(window):
+    """The scrolled view: the table when there is one, else the central QScrollArea."""
+    return getattr(window, "table", None) or window.centralWidget()
+
+
+def scroll_steps(window, frames=120, step=None):
+    """Scroll down in wheel sized steps, then jump back in page sized steps."""
+    bar = _scroll_area(window).verticalScrollBar()
+    step = step or max(1, bar.singleStep() * 3)
+    steps = [("scroll", lambda: bar.setValue(bar.value() + step)) for _ in range(frames)]
+    steps += [("scroll", lambda: bar.setValue(bar.value() - bar.pageStep())) for _ in range(frames // 4)]
+    return steps
+
+
+def resize_steps(window, sizes=((800, 600), (1024, 768), (640, 480), (1280, 960), (800, 600))):
+    return [("resize", lambda size=size: window.resize(*size)) for size in sizes]
+
+
+def zoom_steps(window, factors=(1.25, 1.5, 0.75, 1.0)):
+    """Scale the cells: table rows/columns, or the grid layout spacing."""
+    table = getattr(window, "table", None)
+    steps = []
+    if table is not None:
+        base_rows = [table.rowHeight(row) for row in range(table.rowCount())]
+        base_columns = [table.columnWidth(col) for col in range(table.columnCount())]
+
+        def zoom(factor):
+            for col, width in enumerate(base_columns):
+                table.setColumnWidth(col, int(width * factor))
+            for row, height in enumerate(base_rows):
+                table.setRowHeight(row, int(height * factor))
+        for factor in factors:
+            steps.append(("zoom", lambda factor=factor: zoom(factor)))
+    else:
+        layout = window.layout
+        base = layout.spacing()
+        for factor in factors:
+            steps.append(("zoom", lambda factor=factor: layout.setSpacing(int(base * factor))))
+    return steps
+
+
+def measure_window(name, scroll_frames=120, quiet=True):
+    """Open a window offscreen, run the scripted steps and return the report dict."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    module = __import__(name)
+
+    start_time = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        window = module.MainWindow()
+    load_seconds = time.perf_counter() - start_time
+    window.resize(800, 600)
+    window.show()
+    app.processEvents()
+
+    harness = Harness(app, window)
+    #Warm up the paint path so the first frame is not an outlier
+    window.grab()
+    harness.run(scroll_steps(window, scroll_frames) + resize_steps(window) + zoom_steps(window))
+    report = {
+        "window": name,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "platform": os.environ.get("QT_QPA_PLATFORM"),
+        "machine": f"{platform.machine()} {os.cpu_count()} cpu",
+        "python": platform.python_version(),
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "frame_budget_ms": FRAME_BUDGET * 1000,
+        "load_seconds": load_seconds,
+        "steps": harness.report(),
+    }
+    images = getattr(window, "images", None)
+    if hasattr(images, "stats"):
+        #Image residency under the memory budget after the scripted run
+        report["images"] = images.stats()
+    window.close()
+    return report
+
+
+def compare(report, baseline):
+    """Print the change of the headline numbers against an earlier report."""
+    print(f"Compared with {baseline.get('created', 'baseline')}:")
+    print(f"  load: {baseline['load_seconds']:.2f} -> {report['load_seconds']:.2f} seconds")
+    for kind, stats in report["steps"].items():
+        old = baseline["steps"].get(kind)
+        if not old or "p95_ms" not in stats or "p95_ms" not in old:
+            continue
+        line = f"  {kind}: p95 {old['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ms"
+        if "dropped" in stats:
+            line += f", dropped {old.get('dropped', 0)} -> {stats['dropped']}"
+        print(line)
+
+
+def print_report(report):
+    print(f"{report['window']}: loaded in {report['load_seconds']:.2f} seconds.")
+    images = report.get("images")
+    if images:
+        print(f"  images: {images['resident']} of {images['codes']} resident, "
+              f"{images['resident_bytes'] / 2**20:.1f} MB (peak {images['peak_bytes'] / 2**20:.1f} MB), "
+              f"{images['evictions']} evicted, {images['re_rasters']} re-rasterized.")
+    for kind, stats in report["steps"].items():
+        if "mean_ms" not in stats:
+            continue
+        count = stats.get("frames", stats.get("samples"))
+        unit = "frames" if "frames" in stats else "samples"
+        line = (f"  {kind}: {count} {unit}, mean {stats['mean_ms']:.1f} ms, "
+                f"p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+        if "dropped" in stats:
+            line += f", {stats['dropped']} dropped"
+        if "paint" in stats:
+            line += f" (paint p95 {stats['paint']['p95_ms']:.1f} ms)"
+        print(line + ".")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offscreen scroll/resize/zoom frame timing for the grid windows.")
+    parser.add_argument("window", nargs="?", default="QRCode_Table", choices=WINDOWS)
+    parser.add_argument("--frames", type=int, default=120, help="Scroll frames (plus a quarter for scrolling back).")
+    parser.add_argument("--output", help="Write the JSON report here.")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against.")
+    parser.add_argument("--verbose", action="store_true", help="Show the window's own output while loading.")
+    args = parser.parse_args(argv)
+
+    report = measure_window(args.window, args.frames, quiet=not args.verbose)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}.")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
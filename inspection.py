@@ -0,0 +1,204 @@
+import numpy as np
+import qrcore
+
+#Symbol quality metrics computed straight from module matrices (1 = dark, no quiet zone).
+#These are pre-print checks on the ideal grid, not a verifier grade from a scanned image.
+
+#Required quiet zone in modules
+QUIET_ZONE = {qrcore.QR_CODE: 4, qrcore.DATA_MATRIX: 1}
+
+#Smallest module (X dimension) in millimetres our label printers resolve reliably
+MIN_MODULE_MM = 0.25
+
+#Grade letters indexed by grade value 0..4
+GRADES = "FDCBA"
+
+#Finder-like 1:1:3:1:1 core of mask penalty rule 3
+_FINDER_CORE = np.array([1, 0, 1, 1, 1, 0, 1], dtype=np.uint8)
+
+
+def stack_matrices(matrices):
+    """Group matrices by shape into 3D arrays, returning {shape: (positions, batch)}."""
+    groups = {}
+    for position, matrix in enumerate(matrices):
+        groups.setdefault(matrix.shape, []).append(position)
+    return {shape: (np.array(positions), np.stack([matrices[p] for p in positions]).astype(np.uint8))
+            for shape, positions in groups.items()}
+
+
+def dark_ratio(batch):
+    """Fraction of dark modules per symbol."""
+    return batch.mean(axis=(1, 2))
+
+
+def _run_penalty(batch):
+    """Penalty rule 1 along the last axis: 3 + (length - 5) for every run of 5 or more."""
+    width = batch.shape[2]
+    if width < 5:
+        return np.zeros(batch.shape[0], dtype=np.int64)
+    same = batch[..., 1:] == batch[..., :-1]
+    #A window of five starting at j is uniform when the four neighbour pairs after j match
+    uniform = same[..., :width - 4] & same[..., 1:width - 3] & same[..., 2:width - 2] & same[..., 3:]
+    starts = np.ones(uniform.shape, dtype=bool)
+    starts[..., 1:] = ~same[..., :width - 5]
+    return uniform.sum(axis=(1, 2)) + 2 * (uniform & starts).sum(axis=(1, 2))
+
+
+def _finder_penalty(batch):
+    """Penalty rule 3 along the last axis: 40 for every finder-like pattern with four light modules beside it.
+
+    Overlapping patterns follow segno's scan: after a counted pattern the next one
+    may start 7 modules on, after an uncounted one 4 modules on.
+    """
+    #The quiet zone counts as light, so patterns touching the edge are found too
+    padded = np.pad(batch, ((0, 0), (0, 0), (4, 4))).astype(bool)
+    positions = batch.shape[2] - 6
+    if positions <= 0:
+        return np.zeros(batch.shape[0], dtype=np.int64)
+    shifted = [padded[..., k:k + positions] for k in range(15)]
+    core = np.ones(shifted[0].shape, dtype=bool)
+    for k, dark in enumerate(_FINDER_CORE):
+        core &= shifted[4 + k] if dark else ~shifted[4 + k]
+    left_light = ~(shifted[0] | shifted[1] | shifted[2] | shifted[3])
+    right_light = ~(shifted[11] | shifted[12] | shifted[13] | shifted[14])
+    counted = core & (left_light | right_light)
+    total = counted.sum(axis=(1, 2))
+
+    #The pattern only overlaps itself 4 or 6 modules on, rows where that happens are rescanned
+    overlap = np.zeros(core.shape, dtype=bool)
+    overlap[..., 4:] |= core[..., 4:] & core[..., :-4]
+    overlap[..., 6:] |= core[..., 6:] & core[..., :-6]
+    for symbol, row in zip(*np.nonzero(overlap.any(axis=2))):
+        scanned = 0
+        next_start = 0
+        for position in np.flatnonzero(core[symbol, row]):
+            if position < next_start:
+                continue
+            if counted[symbol, row, position]:
+                scanned += 1
+                next_start = position + 7
+            else:
+                next_start = position + 4
+        total[symbol] += scanned - counted[symbol, row].sum()
+    return 40 * total
+
+
+def mask_penalty(batch):
+    """Total QR mask penalty score (rules 1-4) per symbol, lower is better."""
+    columns = batch.transpose(0, 2, 1)
+    n1 = _run_penalty(batch) + _run_penalty(columns)
+    top_left = batch[:, :-1, :-1]
+    n2 = 3 * ((top_left == batch[:, 1:, :-1]) & (top_left == batch[:, :-1, 1:]) &
+              (top_left == batch[:, 1:, 1:])).sum(axis=(1, 2))
+    n3 = _finder_penalty(batch) + _finder_penalty(columns)
+    n4 = 10 * (np.abs(dark_ratio(batch) * 100 - 50) // 5).astype(np.int64)
+    return n1 + n2 + n3 + n4
+
+
+def module_size_mm(shape, border, scale=None, dpi=300, print_size_mm=None):
+    """Printed module size for a symbol of the given shape.
+
+    Either the pixel scale at the printer resolution or the printed side
+    length of the whole symbol including its quiet zone decides the size.
+    """
+    if print_size_mm is not None:
+        return print_size_mm / (max(shape) + 2 * border)
+    return 25.4 * (scale or 1) / dpi
+
+
+def _balance_grade(ratio):
+    deviation = np.abs(ratio - 0.5)
+    return 4 - np.searchsorted(np.array([0.1, 0.15, 0.2, 0.25]), deviation, side="left")
+
+
+def _penalty_grade(penalty, shape):
+    #Penalty normalised per module so large and small versions grade alike
+    per_module = penalty / float(shape[0] * shape[1])
+    return 4 - np.searchsorted(np.array([1.1, 1.3, 1.6, 2.0]), per_module, side="left")
+
+
+def _ratio_grade(value, required):
+    ratio = value / required
+    return np.select([ratio >= 1, ratio >= 0.75, ratio >= 0.5, ratio >= 0.25], [4, 3, 2, 1], 0)
+
+
+def inspect_batch(matrices, symbology=qrcore.QR_CODE, border=4, scale=None, dpi=300, print_size_mm=None):
+    """Compute quality metrics for a list of matrices, vectorized per symbol size.
+
+    Returns a dict of NumPy arrays aligned with the input order: dark_ratio,
+    penalty, quiet_zone, module_mm, the component grades, grade (lowest
+    component, 0..4) and score (mean component grade scaled to 0..100).
+    """
+    count = len(matrices)
+    result = {name: np.zeros(count) for name in (
+        "dark_ratio", "penalty", "quiet_zone", "module_mm",
+        "balance_grade", "penalty_grade", "quiet_zone_grade", "module_grade", "grade", "score")}
+    required_zone = QUIET_ZONE[symbology]
+    for shape, (positions, batch) in stack_matrices(matrices).items():
+        ratio = dark_ratio(batch)
+        penalty = mask_penalty(batch)
+        module_mm = module_size_mm(shape, border, scale, dpi, print_size_mm)
+        grades = np.vstack([
+            _balance_grade(ratio),
+            _penalty_grade(penalty, shape),
+            np.full(len(positions), _ratio_grade(border, required_zone)),
+            np.full(len(positions), _ratio_grade(module_mm, MIN_MODULE_MM)),
+        ])
+        result["dark_ratio"][positions] = ratio
+        result["penalty"][positions] = penalty
+        result["quiet_zone"][positions] = border / required_zone
+        result["module_mm"][positions] = module_mm
+        result["balance_grade"][positions] = grades[0]
+        result["penalty_grade"][positions] = grades[1]
+        result["quiet_zone_grade"][positions] = grades[2]
+        result["module_grade"][positions] = grades[3]
+        result["grade"][positions] = grades.min(axis=0)
+        result["score"][positions] = grades.mean(axis=0) * 25
+    return result
+
+
+def inspect(matrix, symbology=qrcore.QR_CODE, border=4, scale=None, dpi=300, print_size_mm=None):
+    """Compute quality metrics for a single matrix, returned as a dict of plain values."""
+    result = inspect_batch([np.asarray(matrix)], symbology, border, scale, dpi, print_size_mm)
+    return {name: values[0].item() for name, values in result.items()}
+
+
+def grade_letter(grade):
+    """Return the letter for a numeric grade (4 = A .. 0 = F)."""
+    return GRADES[int(grade)]
+
+
+def describe(metrics, position=None):
+    """Return a one-line summary of one code's metrics for tooltips and logs."""
+    if position is not None:
+        metrics = {name: values[position] for name, values in metrics.items()}
+    return (f"Grade {grade_letter(metrics['grade'])} (score {metrics['score']:.0f}): "
+            f"dark {metrics['dark_ratio']:.0%}, penalty {metrics['penalty']:.0f}, "
+            f"quiet zone {metrics['quiet_zone']:.0%}, module {metrics['module_mm']:.2f} mm")
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import segno
+    from segno import encoder
+
+    #Mask penalty parity with segno's own evaluation, every mask of a sample of payloads
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    matrices = []
+    for n in range(count):
+        payload = f"https://www.example.com/item/{n * 7919}?batch={n % 13}"
+        for mask in range(8):
+            matrices.append(np.array(segno.make(payload, micro=False, mask=mask, error="LMQH"[n % 4]).matrix,
+                                     dtype=np.uint8))
+    start_time = time.time()
+    ours = np.zeros(len(matrices), dtype=np.int64)
+    for positions, batch in stack_matrices(matrices).values():
+        ours[positions] = mask_penalty(batch)
+    elapsed = time.time() - start_time
+    theirs = np.array([encoder.evaluate_mask([bytearray(row) for row in matrix], *matrix.shape)
+                       for matrix in matrices])
+    mismatches = int((ours != theirs).sum())
+    print(f"Mask penalty of {len(matrices)} symbols in {elapsed*1000:.1f} ms, "
+          f"{mismatches} differ from segno.encoder.evaluate_mask.")
+    assert mismatches == 0
@@ -0,0 +1,307 @@
+import io
+import time
+import socket
+import collections
+import numpy as np
+import qrcore
+
+#1-bit raster output for label printers, straight from module matrices (1 = dark):
+#ZPL ^GFA graphics with Zebra's ASCII compression, or PCL raster rows with PackBits (mode 2)
+#and delta row (mode 3) for repeated rows.
+#Labels are written as they are added, so a job of any length streams to the printer.
+
+ZPL = "zpl"
+PCL = "pcl"
+
+#Zebra compression repeat counts: G..Y = 1..19, g..z = 20..400
+_ZPL_ONES = "GHIJKLMNOPQRSTUVWXY"
+_ZPL_TWENTIES = "ghijklmnopqrstuvwxyz"
+
+ESC = b"\x1b"
+
+#Raster resolutions PCL printers accept in ESC*t#R
+PCL_RESOLUTIONS = (75, 100, 150, 200, 300, 600)
+
+
+def _zpl_count(count):
+    """Repeat count prefix for Zebra compression."""
+    prefix = []
+    while count > 400:
+        prefix.append("z")
+        count -= 400
+    if count >= 20:
+        prefix.append(_ZPL_TWENTIES[count // 20 - 1])
+        count %= 20
+    if count:
+        prefix.append(_ZPL_ONES[count - 1])
+    return "".join(prefix)
+
+
+def zpl_compress_row(hex_row):
+    """Compress one row of ^GF ASCII hex, ',' and '!' fill the rest of the row with 0 or F."""
+    trimmed = hex_row.rstrip("0")
+    fill = "," if len(trimmed) < len(hex_row) else ""
+    if not fill:
+        trimmed = hex_row.rstrip("F")
+        fill = "!" if len(trimmed) < len(hex_row) else ""
+    out = []
+    position = 0
+    while position < len(trimmed):
+        char = trimmed[position]
+        end = position + 1
+        while end < len(trimmed) and trimmed[end] == char:
+            end += 1
+        run = end - position
+        out.append((_zpl_count(run) if run > 1 else "") + char)
+        position = end
+    return "".join(out) + fill
+
+
+def zpl_graphic(packed):
+    """^GFA field for a packed 1-bit image (rows x bytes), repeated rows become ':'."""
+    height, width_bytes = packed.shape
+    rows = []
+    previous = None
+    for row in packed:
+        data = row.tobytes()
+        if data == previous:
+            rows.append(":")
+            continue
+        previous = data
+        rows.append(zpl_compress_row(data.hex().upper()))
+    total = height * width_bytes
+    return f"^GFA,{total},{total},{width_bytes},{''.join(rows)}".encode("ascii")
+
+
+def packbits(data):
+    """TIFF PackBits compression (PCL raster compression mode 2)."""
+    out = bytearray()
+    length = len(data)
+    position = 0
+    while position < length:
+        #Repeated run of at least 2 bytes
+        end = position + 1
+        while end < length and end - position < 128 and data[end] == data[position]:
+            end += 1
+        if end - position >= 2:
+            out.append(257 - (end - position))
+            out.append(data[position])
+            position = end
+            continue
+        #Literal run until the next repeat
+        end = position + 1
+        while end < length and end - position < 128 and not (end + 1 < length and data[end] == data[end + 1]):
+            end += 1
+        out.append(end - position - 1)
+        out += data[position:end]
+        position = end
+    return bytes(out)
+
+
+def pcl_resolution(dpi):
+    """Nearest raster resolution PCL accepts (a 203 dpi thermal head rasters at 200)."""
+    return min(PCL_RESOLUTIONS, key=lambda supported: (abs(supported - dpi), -supported))
+
+
+def pcl_raster(packed, x=0, y=0, dpi=300):
+    """PCL raster graphic at dot position x, y, rows PackBits compressed, repeated rows as empty delta rows."""
+    height, width_bytes = packed.shape
+    out = bytearray()
+    out += ESC + b"*p%dx%dY" % (x, y)  #Cursor position in dots
+    out += ESC + b"*t%dR" % pcl_resolution(dpi)
+    out += ESC + b"*r%dS" % (width_bytes * 8)
+    out += ESC + b"*r1A"  #Start at the cursor
+    mode = None
+    previous = None
+    for row in packed:
+        data = row.tobytes()
+        if data == previous:
+            #Delta row mode with nothing to change repeats the seed (previous) row
+            out += ESC + (b"*b3m0W" if mode != 3 else b"*b0W")
+            mode = 3
+            continue
+        previous = data
+        data = packbits(data)
+        out += ESC + (b"*b2m%dW" if mode != 2 else b"*b%dW") % len(data) + data
+        mode = 2
+    out += ESC + b"*rC"
+    return bytes(out)
+
+
+def open_target(target):
+    """Return a binary stream for a path, file object, tcp://host:port or unix:/path socket."""
+    if not isinstance(target, str):
+        return target, False
+    if target.startswith("tcp://"):
+        host, _, port = target[len("tcp://"):].rpartition(":")
+        connection = socket.create_connection((host or "localhost", int(port or 9100)))
+        return connection.makefile("wb"), connection
+    if target.startswith("unix:"):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(target[len("unix:"):])
+        return connection.makefile("wb"), connection
+    return open(target, "wb"), True
+
+
+class LabelPrinterWriter:
+    """Stream labels to a label printer as 1-bit rasters.
+
+    Every label is one code scaled to scale dots per module with a quiet zone,
+    placed at (x, y) dots, optionally with a caption (ZPL only, printer font).
+    Identical codes reuse their compressed raster (cached by key, max_cache
+    entries) and output is flushed every flush_every labels.
+    """
+
+    def __init__(self, target, language=ZPL, dpi=203, scale=4, quiet_zone=2, x=20, y=20,
+                 caption_height=24, max_cache=4096, flush_every=64):
+        if language not in (ZPL, PCL):
+            raise ValueError(f"Unknown printer language: {language}.")
+        self.stream, self.owner = open_target(target)
+        self.language = language
+        self.dpi = dpi
+        self.scale = scale
+        self.quiet_zone = quiet_zone
+        self.x = x
+        self.y = y
+        self.caption_height = caption_height
+        self.cache = collections.OrderedDict()
+        self.max_cache = max_cache
+        self.flush_every = flush_every
+        self.label_count = 0
+        self.bytes_written = 0
+        self.raster_bytes = 0
+        if language == PCL:
+            self._write(ESC + b"E")  #Printer reset at the start of the job
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, data):
+        self.stream.write(data)
+        self.bytes_written += len(data)
+
+    def _raster(self, key, matrix):
+        """Compressed raster command for a matrix, cached by key."""
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.cache.move_to_end(key)
+            return entry
+        pixels = qrcore.scale_matrix(matrix, self.scale, self.quiet_zone)
+        packed = np.packbits(pixels.astype(bool), axis=1)
+        if self.language == ZPL:
+            entry = (zpl_graphic(packed), packed.shape)
+        else:
+            entry = (pcl_raster(packed, self.x, self.y, self.dpi), packed.shape)
+        self.raster_bytes += packed.size
+        self.cache[key] = entry
+        if len(self.cache) > self.max_cache:
+            self.cache.popitem(last=False)
+        return entry
+
+    def add_label(self, matrix, caption=None, key=None):
+        """Write one label from a module matrix."""
+        if key is None:
+            key = matrix.tobytes() + bytes(matrix.shape)
+        graphic, (height, width_bytes) = self._raster(key, matrix)
+        if self.language == ZPL:
+            out = bytearray(b"^XA^PW%d^LL%d" % (self.x * 2 + width_bytes * 8,
+                                                self.y * 2 + height + (self.caption_height if caption else 0)))
+            out += b"^FO%d,%d" % (self.x, self.y) + graphic + b"^FS"
+            if caption:
+                #^ and ~ start commands, keep them out of the field data
+                text = caption.replace("^", " ").replace("~", " ").encode("ascii", errors="replace")
+                out += b"^FO%d,%d^A0N,%d,%d^FD" % (self.x, self.y + height + 4, self.caption_height - 6,
+                                                     self.caption_height - 6) + text + b"^FS"
+            out += b"^XZ\n"
+        else:
+            out = graphic + b"\x0c"  #Form feed ends the label
+        self._write(bytes(out))
+        self.label_count += 1
+        if self.label_count % self.flush_every == 0:
+            self.stream.flush()
+
+    def add_code(self, payload, symbology=qrcore.QR_CODE, caption=None, **params):
+        """Write a payload as a label, encoding it only when its raster is not cached."""
+        key = qrcore.code_key(payload, symbology, **params)
+        if key in self.cache:
+            self.add_label(None, caption, key)
+        else:
+            self.add_label(qrcore.make_matrix(payload, symbology, **params), caption, key)
+
+    def close(self):
+        if self.stream is None:
+            return
+        if self.language == PCL:
+            self._write(ESC + b"E")
+        self.stream.flush()
+        if self.owner:
+            self.stream.close()
+            if isinstance(self.owner, socket.socket):
+                self.owner.close()
+        self.stream = None
+
+
+def _sink(server, counter):
+    """Local stand-in for a printer port: accept one connection and count what arrives."""
+    connection, _ = server.accept()
+    with connection:
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            counter[0] += len(data)
+
+
+if __name__ == "__main__":
+    import argparse
+    import threading
+    import segno
+
+    parser = argparse.ArgumentParser(description="Stream QR labels as printer rasters.")
+    parser.add_argument("target", nargs="?", default="socket",
+                        help="Output file, tcp://host:port, unix:/path, or 'socket' for a local stand-in.")
+    parser.add_argument("--language", choices=(ZPL, PCL), default=ZPL)
+    parser.add_argument("--count", type=int, default=5000)
+    args = parser.parse_args()
+
+    received = [0]
+    target = args.target
+    if target == "socket":
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        sink = threading.Thread(target=_sink, args=(server, received), daemon=True)
+        sink.start()
+        target = f"tcp://127.0.0.1:{server.getsockname()[1]}"
+
+    payloads = [f"https://www.example.com/item/{i}" for i in range(args.count)]
+    start_time = time.time()
+    with LabelPrinterWriter(target, args.language) as writer:
+        for payload in payloads:
+            writer.add_code(payload, caption=payload)
+    elapsed = time.time() - start_time
+    if args.target == "socket":
+        sink.join(timeout=5)
+        server.close()
+
+    print(f"Streamed {writer.label_count} {args.language.upper()} labels to {target} in {elapsed:.2f} seconds "
+          f"({writer.label_count / elapsed:.0f} labels/s).")
+    print(f"Output {writer.bytes_written / 1024:.0f} KB for {writer.raster_bytes / 1024:.0f} KB of raw 1-bit raster "
+          f"({writer.bytes_written / max(1, writer.label_count):.0f} bytes per label).")
+    if args.target == "socket":
+        print(f"Stand-in printer received {received[0] / 1024:.0f} KB.")
+
+    #What the PNG path costs for the same labels (sampled)
+    sample = payloads[:500]
+    start_time = time.time()
+    png_bytes = 0
+    for payload in sample:
+        buffer = io.BytesIO()
+        segno.make(payload, micro=False).save(buffer, kind="png", scale=4, border=2)
+        png_bytes += buffer.tell()
+    png_elapsed = (time.time() - start_time) / len(sample)
+    print(f"PNG path for comparison: {png_elapsed * 1000:.2f} ms and {png_bytes / len(sample):.0f} bytes per label "
+          f"(before the printer driver decodes and rasterizes it).")
@@ -0,0 +1,216 @@
+import io
+import sys
+import time
+import zlib
+import collections
+import numpy as np
+import qrcore
+
+#Page sizes in PDF points (1/72 inch)
+LETTER = (612, 792)
+A4 = (595, 842)
+
+#Helvetica is one of the standard 14 fonts, so nothing has to be embedded for captions
+CAPTION_FONT = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+
+
+def _pdf_string(text):
+    """Escape text for a PDF literal string."""
+    data = text.encode("cp1252", errors="replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class LabelSheetWriter:
+    """Stream QR/Data Matrix labels onto paged PDF sheets.
+
+    Each page is written out as soon as it is full and every distinct code is
+    embedded once as a 1-bit image mask shared by all labels that show it, so
+    memory stays bounded by one page plus the table of embedded images
+    (capped by max_images, least recently used entries are forgotten).
+    """
+
+    def __init__(self, path, page_size=LETTER, columns=3, rows=8, margin=36, gutter=6,
+                 caption_size=7, quiet_zone=2, max_images=20000):
+        #Only a file opened here is closed by close(), a stream passed in stays the caller's
+        self.owns_file = isinstance(path, str)
+        self.file = open(path, "wb") if self.owns_file else path
+        self.page_width, self.page_height = page_size
+        self.columns = columns
+        self.rows = rows
+        self.margin = margin
+        self.gutter = gutter
+        self.caption_size = caption_size
+        self.quiet_zone = quiet_zone
+        self.max_images = max_images
+        self.label_width = (self.page_width - 2 * margin - (columns - 1) * gutter) / columns
+        self.label_height = (self.page_height - 2 * margin - (rows - 1) * gutter) / rows
+
+        self.offsets = [0, 0, 0, 0]  #Object 0 is the free head, 1 catalog, 2 page tree, 3 font
+        self.position = 0
+        self.images = collections.OrderedDict()  #code key -> (image object number, matrix shape)
+        self.page_ids = []
+        self.page_images = {}
+        self.page_content = io.BytesIO()
+        self.slot = 0
+        self.label_count = 0
+        self.image_count = 0
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._write_object(3, CAPTION_FONT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _write(self, data):
+        self.file.write(data)
+        self.position += len(data)
+
+    def _new_object(self):
+        self.offsets.append(0)
+        return len(self.offsets) - 1
+
+    def _write_object(self, number, body, stream=None):
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n" % number)
+        self._write(body)
+        if stream is not None:
+            self._write(b"\nstream\n")
+            self._write(stream)
+            self._write(b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def _embed_matrix(self, key, matrix):
+        """Write the matrix as an image mask once and return its object number and shape."""
+        entry = self.images.get(key)
+        if entry is not None:
+            self.images.move_to_end(key)
+            return entry
+        height, width = matrix.shape
+        data = zlib.compress(np.packbits(matrix.astype(bool), axis=1).tobytes())
+        number = self._new_object()
+        self._write_object(number, (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ImageMask true "
+            b"/Decode [1 0] /BitsPerComponent 1 /Filter /FlateDecode /Length %d >>"
+            % (width, height, len(data))), data)
+        entry = self.images[key] = (number, matrix.shape)
+        self.image_count += 1
+        if len(self.images) > self.max_images:
+            self.images.popitem(last=False)
+        return entry
+
+    def add_label(self, matrix, caption=None, key=None, color=(0, 0, 0)):
+        """Place one label from a module matrix, key identifies identical codes for sharing."""
+        if key is None:
+            key = matrix.tobytes() + bytes(matrix.shape)
+        image, shape = self._embed_matrix(key, matrix)
+        self._place(image, shape, caption, color)
+
+    def add_code(self, payload, symbology=qrcore.QR_CODE, caption=None, color=(0, 0, 0), **params):
+        """Place a payload as a label, encoding it only the first time it is seen."""
+        key = qrcore.code_key(payload, symbology, **params)
+        entry = self.images.get(key)
+        if entry is None:
+            matrix = qrcore.make_matrix(payload, symbology, **params)
+            entry = self._embed_matrix(key, matrix)
+        else:
+            self.images.move_to_end(key)
+        self._place(entry[0], entry[1], caption, color)
+
+    def _place(self, image, shape, caption, color):
+        """Draw an embedded image and its caption into the next free slot."""
+        self.page_images[image] = True
+        row, col = divmod(self.slot, self.columns)
+        x = self.margin + col * (self.label_width + self.gutter)
+        top = self.page_height - self.margin - row * (self.label_height + self.gutter)
+        caption_height = self.caption_size * 1.6 if caption else 0
+
+        #Square code area, quiet zone kept as empty label space
+        modules = max(shape) + 2 * self.quiet_zone
+        side = min(self.label_width, self.label_height - caption_height)
+        module = side / modules
+        code_w = shape[1] * module
+        code_h = shape[0] * module
+        code_x = x + (self.label_width - code_w) / 2
+        code_y = top - (self.label_height - caption_height - code_h) / 2 - code_h
+
+        out = self.page_content
+        r, g, b = (c / 255 for c in color)
+        out.write(b"q %.3f %.3f %.3f rg %.3f 0 0 %.3f %.3f %.3f cm /Im%d Do Q\n"
+                  % (r, g, b, code_w, code_h, code_x, code_y, image))
+        if caption:
+            #Rough Helvetica advance so long captions are cut to the label width
+            max_chars = max(4, int(self.label_width / (self.caption_size * 0.55)))
+            if len(caption) > max_chars:
+                caption = caption[:max_chars - 3] + "..."
+            text_w = len(caption) * self.caption_size * 0.5
+            text_x = x + max(0, (self.label_width - text_w) / 2)
+            text_y = top - self.label_height + self.caption_size * 0.4
+            out.write(b"BT /F1 %.1f Tf 0 g %.3f %.3f Td %s Tj ET\n"
+                      % (self.caption_size, text_x, text_y, _pdf_string(caption)))
+
+        self.label_count += 1
+        self.slot += 1
+        if self.slot == self.columns * self.rows:
+            self._flush_page()
+
+    def _flush_page(self):
+        """Write the current page and its content stream."""
+        if not self.slot:
+            return
+        content = zlib.compress(self.page_content.getvalue())
+        content_id = self._new_object()
+        self._write_object(content_id, b"<< /Filter /FlateDecode /Length %d >>" % len(content), content)
+        xobjects = b" ".join(b"/Im%d %d 0 R" % (n, n) for n in self.page_images)
+        page_id = self._new_object()
+        self._write_object(page_id, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /XObject << %s >> /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (self.page_width, self.page_height, xobjects, content_id)))
+        self.page_ids.append(page_id)
+        self.page_images = {}
+        self.page_content = io.BytesIO()
+        self.slot = 0
+
+    def close(self):
+        """Finish the last page and write the page tree, catalog and cross reference table."""
+        if self.file is None:
+            return
+        self._flush_page()
+        kids = b" ".join(b"%d 0 R" % n for n in self.page_ids)
+        self._write_object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_ids)))
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_position = self.position
+        self._write(b"xref\n0 %d\n" % len(self.offsets))
+        self._write(b"0000000000 65535 f \n")
+        for offset in self.offsets[1:]:
+            self._write(b"%010d 00000 n \n" % offset)
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                    % (len(self.offsets), xref_position))
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+        self.file = None
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    #10k labels from the same sample links the generator windows use
+    links = ["https://example.com/1", "https://example.com/2", "https://example.com/3"] * 3334
+    path = sys.argv[1] if len(sys.argv) > 1 else "labels.pdf"
+
+    tracemalloc.start()
+    start_time = time.time()
+    with LabelSheetWriter(path) as writer:
+        for index, link in enumerate(links):
+            writer.add_code(f"{link}?n={index % 500}", caption=link, error="H")
+    elapsed = time.time() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+
+    print(f"Wrote {writer.label_count} labels on {len(writer.page_ids)} pages in {elapsed:.2f} seconds.")
+    print(f"Embedded images: {writer.image_count}.")
+    print(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB.")
@@ -0,0 +1,217 @@
+import os
+import gc
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+
+#Headless memory benchmark and leak check for long running sessions.
+#
+#Each scenario runs a number of iterations (repeated generations or full table loads),
+#sampling RSS and tracemalloc after every one. Growth per iteration is the slope of a
+#least squares fit over the iterations after warm up; the run fails (exit code 1) when
+#any scenario grows faster than its threshold.
+#
+#    QT_QPA_PLATFORM=offscreen python memory_bench.py customqr encode --iterations 200
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        #Not Linux: peak RSS is the best the standard library offers
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def slope(values):
+    """Least squares growth per step of a series."""
+    count = len(values)
+    if count < 2:
+        return 0.0
+    mean_x = (count - 1) / 2
+    mean_y = sum(values) / count
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    denominator = sum((x - mean_x) ** 2 for x in range(count))
+    return numerator / denominator
+
+
+def settle(app=None):
+    """Let Qt delete closed widgets and Python collect cycles before sampling."""
+    if app is not None:
+        from PyQt5.QtCore import QCoreApplication, QEvent
+        app.processEvents()
+        QCoreApplication.sendPostedEvents(None, QEvent.DeferredDelete)
+        app.processEvents()
+    gc.collect()
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silence the windows' per code prints while measuring."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+#Scenarios: name -> (codes per iteration, default threshold in KB per iteration, setup)
+#setup(app) returns a function that runs one iteration.
+
+def _encode(app):
+    import qrcore
+    from palette import indexed_image
+    payloads = [f"https://www.example.com/item/{i}" for i in range(100)]
+
+    def iteration():
+        images = [indexed_image(qrcore.qr_matrix(payload), 8, 1) for payload in payloads]
+        return len(images)
+    return iteration
+
+
+def _customqr(app):
+    import customqr
+    window = customqr.QRMatrixGenerator()
+    #Largest size so every test URL fits, an overflow would open a modal error box
+    window.size_combo.setCurrentIndex(window.size_combo.count() - 1)
+    counter = [0]
+
+    def iteration():
+        #Same flow as a click on Generate with a new URL each time
+        for _ in range(10):
+            counter[0] += 1
+            window.data_input.setText(f"https://www.example.com/item/{counter[0]}")
+            window.generate_code()
+        app.processEvents()
+        return 10
+    return iteration
+
+
+def _window(module_name):
+    def setup(app):
+        module = __import__(module_name)
+        snapshot = hasattr(module, "SNAPSHOT_PATH")
+        if snapshot:
+            #Every iteration encodes the whole table, a snapshot saved by the last one would skip that
+            module.SNAPSHOT_PATH = os.path.join(tempfile.gettempdir(), f"memory_bench-{os.getpid()}.qrsnap")
+
+        def iteration():
+            window = module.MainWindow()
+            window.show()
+            app.processEvents()
+            count = len(window.urls)
+            window.close()
+            window.deleteLater()
+            if snapshot:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(module.SNAPSHOT_PATH)
+            return count
+        return iteration
+    return setup
+
+
+SCENARIOS = {
+    "encode": (_encode, 64),
+    "customqr": (_customqr, 64),
+    "qrcode_table": (_window("QRCode_Table"), 256),
+    "generatorv2": (_window("QR_Code_GeneratorV2"), 1024),
+    "qrtable_label": (_window("QRTable_Label"), 2048),
+}
+
+
+def run_scenario(name, iterations, warmup, threshold_kb=None, app=None, verbose=True):
+    """Run one scenario and return its result dict (passed is False when growth exceeds the threshold)."""
+    setup, default_threshold = SCENARIOS[name]
+    threshold_kb = default_threshold if threshold_kb is None else threshold_kb
+    with quiet(not verbose):
+        iteration = setup(app)
+    settle(app)
+    tracemalloc.start()
+    baseline_rss = rss_bytes()
+    baseline_traced = tracemalloc.get_traced_memory()[0]
+    rss, traced, codes = [], [], 0
+    start_time = time.time()
+    for number in range(iterations):
+        with quiet(not verbose):
+            codes += iteration()
+        settle(app)
+        rss.append(rss_bytes())
+        traced.append(tracemalloc.get_traced_memory()[0])
+    elapsed = time.time() - start_time
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    measured = rss[warmup:] if iterations - warmup >= 2 else rss
+    measured_traced = traced[warmup:] if iterations - warmup >= 2 else traced
+    codes_per_iteration = codes / max(1, iterations)
+    result = {
+        "scenario": name,
+        "iterations": iterations,
+        "codes": codes,
+        "seconds": elapsed,
+        "rss_start": baseline_rss,
+        "rss_end": rss[-1] if rss else baseline_rss,
+        "bytes_per_code": (rss[0] - baseline_rss) / max(1, codes_per_iteration) if rss else 0.0,
+        "rss_growth_per_iteration": slope(measured),
+        "traced_growth_per_iteration": slope(measured_traced),
+        "traced_retained": (traced[-1] if traced else baseline_traced) - baseline_traced,
+        "traced_peak": peak_traced,
+        "threshold": threshold_kb * 1024,
+    }
+    result["passed"] = max(result["rss_growth_per_iteration"],
+                           result["traced_growth_per_iteration"]) <= result["threshold"]
+    return result
+
+
+def print_result(result):
+    """One summary block per scenario, in the units the windows use for their metrics."""
+    status = "PASS" if result["passed"] else "FAIL"
+    print(f"[{status}] {result['scenario']}: {result['iterations']} iterations, {result['codes']} codes "
+          f"in {result['seconds']:.2f} seconds.")
+    print(f"    RSS {result['rss_start'] / 2**20:.1f} -> {result['rss_end'] / 2**20:.1f} MB, "
+          f"{result['bytes_per_code']:.0f} bytes per code held by the first iteration.")
+    print(f"    Growth per iteration: RSS {result['rss_growth_per_iteration'] / 1024:.1f} KB, "
+          f"traced {result['traced_growth_per_iteration'] / 1024:.1f} KB "
+          f"(threshold {result['threshold'] / 1024:.0f} KB).")
+    print(f"    Traced: {result['traced_retained'] / 1024:.1f} KB retained, "
+          f"{result['traced_peak'] / 2**20:.1f} MB peak.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Memory benchmark and leak check.")
+    parser.add_argument("scenarios", nargs="*", default=["encode", "customqr", "qrcode_table"],
+                        help=f"Scenarios to run: {', '.join(SCENARIOS)} (default: encode customqr qrcode_table).")
+    parser.add_argument("--iterations", type=int, default=30, help="Iterations per scenario.")
+    parser.add_argument("--warmup", type=int, default=5, help="Iterations left out of the growth fit.")
+    parser.add_argument("--threshold-kb", type=float, default=None,
+                        help="Allowed growth per iteration in KB (default depends on the scenario).")
+    parser.add_argument("--verbose", action="store_true", help="Show the windows' own output.")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenario: {', '.join(unknown)}.")
+
+    #Headless unless a platform was chosen explicitly
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    failed = 0
+    for name in args.scenarios:
+        result = run_scenario(name, args.iterations, args.warmup, args.threshold_kb, app, args.verbose)
+        print_result(result)
+        failed += not result["passed"]
+    if failed:
+        print(f"{failed} scenario(s) exceeded their growth threshold.")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
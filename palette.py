@@ -0,0 +1,207 @@
+import math
+import time
+import bisect
+import threading
+import numpy as np
+from PyQt5.QtWidgets import QWidget
+from PyQt5.QtGui import QImage, QColor, QPainter
+from PyQt5.QtCore import QRect
+import qrcore
+
+#Codes are kept as 1-bit indexed images (index 0 light, 1 dark), so a colour change
+#only swaps the two entry colour table and never touches the pixels or the encoders.
+
+#Named colours offered by the Ui_Main colour boxes
+COLOURS = {
+    "Black": "#000000",
+    "Gold": "#FFD700",
+    "Crimson": "#DC143C",
+    "Royal Purple": "#7851A9",
+    "Sapphire Blue": "#0F52BA",
+    "Forest Green": "#228B22",
+}
+LIGHT = "#FFFFFF"
+
+#Share of the image budget left in use after dropping images, so eviction runs in batches
+LOW_WATER = 0.9
+
+
+def colour_table(dark, light=LIGHT):
+    """Return the two entry colour table for a dark colour (name, hex string or QColor)."""
+    dark = QColor(COLOURS.get(dark, dark)) if isinstance(dark, str) else QColor(dark)
+    return [QColor(light).rgba(), dark.rgba()]
+
+
+def indexed_image(matrix, scale=1, border=0, dark="Black", light=LIGHT):
+    """Render a module matrix to a 1-bit indexed QImage that owns its pixels."""
+    pixels = qrcore.scale_matrix(matrix, scale, border)
+    height, width = pixels.shape
+    packed = np.packbits(pixels.astype(bool), axis=1)
+    #copy() so the image owns its buffer once the packed array is gone
+    image = QImage(packed.tobytes(), width, height, packed.shape[1], QImage.Format_Mono).copy()
+    image.setColorTable(colour_table(dark, light))
+    return image
+
+
+def image_indices(image):
+    """Return the colour indices of a 1-bit image as a uint8 array (1 = dark)."""
+    bits = image.constBits()
+    bits.setsize(image.height() * image.bytesPerLine())
+    packed = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+    return np.unpackbits(packed, axis=1)[:, :image.width()]
+
+
+class CodeImages:
+    """Shared indexed images, one per distinct code key, recoloured together.
+
+    Images are only ever referenced, never copied, so a colour table swap does
+    not detach (and duplicate) the pixel data. With budget_mb set, decoded
+    images beyond the budget are dropped back to their packed matrix, farthest
+    from the viewport (in cells) first, and re-rasterized when painted again.
+    Views keep the key rather than the image (see CodeView) so a dropped image
+    is really freed.
+    """
+
+    def __init__(self, dark="Black", light=LIGHT, budget_mb=None):
+        self.table = colour_table(dark, light)
+        self.images = {}
+        self.lock = threading.Lock()
+        self.budget = budget_mb * 2**20 if budget_mb else None
+        self.compact = {}  #key -> (packed matrix bytes, shape, scale, border)
+        self.positions = {}  #key -> sorted cell indices showing it
+        self.viewport = (0, 0)  #First and last visible cell index
+        self.resident_bytes = 0
+        self.peak_bytes = 0
+        self.compact_bytes = 0
+        self.evictions = 0
+        self.re_rasters = 0
+
+    def _raster(self, key, matrix, scale, border):
+        image = indexed_image(matrix, scale, border)
+        image.setColorTable(self.table)
+        with self.lock:
+            existing = self.images.get(key)
+            if existing is not None:
+                return existing
+            self.images[key] = image
+            self.resident_bytes += image.sizeInBytes()
+            self.peak_bytes = max(self.peak_bytes, self.resident_bytes)
+            if key not in self.compact:
+                packed = np.packbits(matrix.astype(bool)).tobytes()
+                self.compact[key] = (packed, matrix.shape, scale, border)
+                self.compact_bytes += len(packed)
+        return image
+
+    def get(self, key, make_matrix, scale=1, border=0, index=None):
+        """Return the image for key, calling make_matrix() only the first time it is seen.
+
+        index is the cell showing the code, it places the code relative to the viewport.
+        """
+        if index is not None:
+            with self.lock:
+                bisect.insort(self.positions.setdefault(key, []), index)
+        image = self.images.get(key)
+        if image is None:
+            image = self.image(key) if key in self.compact else self._raster(key, make_matrix(), scale, border)
+            self.enforce(protect=key)
+        return image
+
+    def image(self, key):
+        """Return the resident image for key, re-rasterizing it from its packed matrix if it was dropped."""
+        image = self.images.get(key)
+        if image is None:
+            packed, shape, scale, border = self.compact[key]
+            matrix = np.unpackbits(np.frombuffer(packed, dtype=np.uint8))[:shape[0] * shape[1]].reshape(shape)
+            image = self._raster(key, matrix, scale, border)
+            self.re_rasters += 1
+            self.enforce(protect=key)
+        return image
+
+    def distance(self, key):
+        """Cells between the viewport and the nearest cell showing key, 0 when one is visible."""
+        positions = self.positions.get(key)
+        if not positions:
+            return math.inf
+        first, last = self.viewport
+        position = bisect.bisect_left(positions, first)
+        if position < len(positions) and positions[position] <= last:
+            return 0
+        after = positions[position] - last if position < len(positions) else math.inf
+        before = first - positions[position - 1] if position else math.inf
+        return min(after, before)
+
+    def set_viewport(self, first, last):
+        """Record the visible cell range and drop images over the budget."""
+        self.viewport = (first, last)
+        self.enforce()
+
+    def enforce(self, protect=None):
+        """Drop the farthest off-screen images once the resident images exceed the budget."""
+        if self.budget is None or self.resident_bytes <= self.budget:
+            return
+        with self.lock:
+            keys = sorted(self.images, key=self.distance, reverse=True)
+            for key in keys:
+                if self.resident_bytes <= self.budget * LOW_WATER:
+                    break
+                if key == protect or self.distance(key) == 0:
+                    continue
+                image = self.images.pop(key)
+                self.resident_bytes -= image.sizeInBytes()
+                self.evictions += 1
+
+    def set_colour(self, dark, light=LIGHT):
+        """Swap the colour table of every image, returns the seconds taken."""
+        start_time = time.perf_counter()
+        self.table = colour_table(dark, light)
+        with self.lock:
+            images = list(self.images.values())
+        for image in images:
+            image.setColorTable(self.table)
+        return time.perf_counter() - start_time
+
+    def stats(self):
+        """Residency statistics for the run summary and the performance reports."""
+        return {
+            "codes": len(self.compact),
+            "resident": len(self.images),
+            "resident_bytes": self.resident_bytes,
+            "peak_bytes": self.peak_bytes,
+            "compact_bytes": self.compact_bytes,
+            "budget_bytes": self.budget,
+            "evictions": self.evictions,
+            "re_rasters": self.re_rasters,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        budget = f"{stats['budget_bytes'] / 2**20:.0f} MB" if stats["budget_bytes"] else "no budget"
+        return (f"Images: {stats['resident']} of {stats['codes']} codes resident, "
+                f"{stats['resident_bytes'] / 2**20:.1f} MB (peak {stats['peak_bytes'] / 2**20:.1f} MB, {budget}), "
+                f"{stats['compact_bytes'] / 1024:.0f} KB packed, {stats['evictions']} evicted, "
+                f"{stats['re_rasters']} re-rasterized.")
+
+
+class CodeView(QWidget):
+    """Fixed size widget that paints an indexed code image, scaled without smoothing.
+
+    Pass a QImage, or a CodeImages and the code key to fetch the image on every
+    paint so the CodeImages budget can drop it while the cell is off-screen.
+    """
+
+    def __init__(self, image, size=150, parent=None, key=None):
+        super().__init__(parent)
+        self.image = image
+        self.key = key
+        self.setFixedSize(size, size)
+
+    def paintEvent(self, event):
+        image = self.image.image(self.key) if self.key is not None else self.image
+        painter = QPainter(self)
+        #Keep the aspect ratio, rectangular Data Matrix symbols are wider than tall
+        factor = min(self.width() / image.width(), self.height() / image.height())
+        width = int(image.width() * factor)
+        height = int(image.height() * factor)
+        target = QRect((self.width() - width) // 2, (self.height() - height) // 2, width, height)
+        painter.drawImage(target, image)
+        painter.end()
@@ -0,0 +1,120 @@
+import bisect
+import heapq
+import itertools
+import time
+
+#In-memory lookup from payload (or payload prefix) to code index, for find/jump in the grids
+
+#Prefixes skipped when matching, so "example.com/12" finds "https://www.example.com/12"
+SCHEMES = ("https://", "http://")
+
+
+def strip_scheme(payload):
+    """Return the payload without its URL scheme and a leading www."""
+    for scheme in SCHEMES:
+        if payload.startswith(scheme):
+            payload = payload[len(scheme):]
+            break
+    return payload[4:] if payload.startswith("www.") else payload
+
+
+class PayloadIndex:
+    """Payload -> code indices, maintained incrementally as results arrive.
+
+    Exact lookups are a dict hit. Prefix lookups bisect a sorted list of the
+    distinct payloads (with and without scheme); payloads added since the
+    last search are merged into it lazily on the next search, so adding
+    stays O(1) while a batch is streaming in. Each payload's indices are kept
+    sorted (results arriving out of order are inserted in place).
+    """
+
+    def __init__(self):
+        self.indices = {}  #payload -> [code index, ...]
+        self.keys = []  #sorted (search key, payload)
+        self.pending = []
+        self.count = 0
+        self.last_search = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, index, payload):
+        """Record that code index shows payload."""
+        entry = self.indices.get(payload)
+        if entry is None:
+            self.indices[payload] = [index]
+            self.pending.append((payload, payload))
+            stripped = strip_scheme(payload)
+            if stripped != payload:
+                self.pending.append((stripped, payload))
+        elif index > entry[-1]:
+            entry.append(index)
+        else:
+            bisect.insort(entry, index)
+        self.count += 1
+
+    def _merge(self):
+        if self.pending:
+            #Timsort merges the sorted run and the new tail in about linear time
+            self.keys.extend(self.pending)
+            self.keys.sort()
+            self.pending = []
+
+    def prefix(self, text, limit=None):
+        """Return the distinct payloads starting with text (with or without scheme), in sorted order."""
+        self._merge()
+        payloads = []
+        seen = set()
+        position = bisect.bisect_left(self.keys, (text,))
+        while position < len(self.keys):
+            key, payload = self.keys[position]
+            if not key.startswith(text):
+                break
+            if payload not in seen:
+                seen.add(payload)
+                payloads.append(payload)
+                if limit is not None and len(payloads) >= limit:
+                    break
+            position += 1
+        return payloads
+
+    def find(self, text, limit=1000):
+        """Return sorted code indices for an exact payload, or else for every payload with that prefix.
+
+        At most limit indices: the first ones of the payload, or for a prefix the
+        first few of each of (at most limit) matching payloads.
+        """
+        start_time = time.perf_counter()
+        text = text.strip()
+        if not text:
+            found = []
+        elif text in self.indices:
+            found = self.indices[text][:limit]
+        else:
+            #The limit is shared out over the matching payloads so every one of them can be reached
+            payloads = self.prefix(text, limit)
+            share = max(1, limit // len(payloads)) if payloads else 0
+            found = list(heapq.merge(*(itertools.islice(self.indices[payload], share) for payload in payloads)))
+        self.last_search = time.perf_counter() - start_time
+        return found
+
+
+def cell(index, columns):
+    """Return the (row, column) of a code index in a grid with the given column count."""
+    return divmod(index, columns)
+
+
+if __name__ == "__main__":
+    #100k code grid, three copies of each URL like the table windows
+    payloads = [f"https://www.example.com/{i // 3}" for i in range(100000)]
+    index = PayloadIndex()
+    start_time = time.perf_counter()
+    for i, payload in enumerate(payloads):
+        index.add(i, payload)
+    print(f"Indexed {len(index)} codes in {(time.perf_counter() - start_time)*1000:.1f} ms.")
+
+    for query in ("https://www.example.com/33333", "example.com/1234", "example.com/9", "nothing"):
+        index.find(query)  #The first search pays the pending merge
+        found = index.find(query)
+        print(f"{query!r}: {len(found)} matches, first cell {cell(found[0], 3) if found else None}, "
+              f"{index.last_search*1e6:.0f} us.")
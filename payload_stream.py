@@ -0,0 +1,140 @@
+import sys
+import io
+import time
+import collections
+import concurrent.futures
+import segno
+from segno import consts
+from segno.encoder import version_range
+
+#Read size for the text chunker, small enough that memory stays flat on any input
+READ_SIZE = 64 * 1024
+
+
+def open_source(source=None, encoding="utf-8-sig"):
+    """Return a text stream for a file path, an open file or stdin ("-" or None)."""
+    if source is None or source == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding=encoding, errors="replace")
+    if hasattr(source, "read"):
+        return source
+    return open(source, "r", encoding=encoding, errors="replace", newline="")
+
+
+def read_payloads(source=None, encoding="utf-8-sig", skip_blank=True):
+    """Lazily yield one payload per line from a file path, an open file or stdin."""
+    stream = open_source(source, encoding)
+    try:
+        for line in stream:
+            line = line.rstrip("\r\n")
+            if skip_blank and not line.strip():
+                continue
+            yield line
+    finally:
+        if stream is not source and source not in (None, "-"):
+            stream.close()
+
+
+def payload_capacity(version, error="L", mode="byte"):
+    """Return how many characters of the given mode fit into a QR version/ECC."""
+    error_level = consts.ERROR_MAPPING[error.upper()]
+    mode_const = consts.MODE_MAPPING[mode]
+    bits = consts.SYMBOL_CAPACITY[version][error_level]
+    #Mode indicator and character count indicator come off the top
+    bits -= 4 + consts.CHAR_COUNT_INDICATOR_LENGTH[mode_const][version_range(version)]
+    if mode == "byte":
+        return bits // 8
+    if mode == "alphanumeric":
+        return (bits // 11) * 2 + (1 if bits % 11 >= 6 else 0)
+    if mode == "numeric":
+        rest = bits % 10
+        return (bits // 10) * 3 + (2 if rest >= 7 else 1 if rest >= 4 else 0)
+    raise ValueError(f"Unsupported mode for capacity: {mode}.")
+
+
+def _split_to_capacity(text, capacity, encoding):
+    """Return the longest prefix of text whose encoded size fits the capacity."""
+    head = text[:capacity]
+    encoded = head.encode(encoding)
+    if len(encoded) <= capacity:
+        return head
+    #Multi byte characters, cut at the byte limit and drop a partial trailing character
+    return encoded[:capacity].decode(encoding, errors="ignore")
+
+
+def chunk_text(source=None, version=10, error="L", encoding="utf-8", read_size=READ_SIZE):
+    """Lazily split a long text source into payloads that fit the chosen version/ECC.
+
+    The source is read in fixed-size blocks, so at most one block plus one
+    payload is held in memory however large the input is.
+    """
+    capacity = payload_capacity(version, error, "byte")
+    stream = open_source(source)
+    buffer = ""
+    try:
+        while True:
+            block = stream.read(read_size)
+            buffer += block
+            position = 0
+            while len(buffer) - position >= capacity or (not block and position < len(buffer)):
+                piece = _split_to_capacity(buffer[position:position + capacity], capacity, encoding)
+                position += len(piece)
+                yield piece
+            buffer = buffer[position:]
+            if not block:
+                break
+    finally:
+        if stream is not source and source not in (None, "-"):
+            stream.close()
+
+
+def feed_pool(executor, fn, payloads, max_pending=64):
+    """Submit payloads to the executor with backpressure and yield results in input order.
+
+    No more than max_pending tasks are queued at once; the payload iterator
+    is only advanced when a slot frees up, so lazy sources stay lazy.
+    """
+    pending = collections.deque()
+    for payload in payloads:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, payload))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _encode_payload(payload, version=None, error="L"):
+    """Encode a payload and return its version, used by the command line run."""
+    qr = segno.make(payload, version=version, error=error, micro=False, boost_error=False)
+    return qr.version
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+
+    parser = argparse.ArgumentParser(description="Stream payloads from a text source into the QR generator pool.")
+    parser.add_argument("source", nargs="?", default="pg9550.txt", help="File to read, or - for stdin.")
+    parser.add_argument("--lines", action="store_true", help="One payload per line instead of capacity-sized chunks.")
+    parser.add_argument("--version", type=int, default=10)
+    parser.add_argument("--error", default="L")
+    parser.add_argument("--max-pending", type=int, default=64)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    if args.lines:
+        payloads = read_payloads(args.source)
+    else:
+        payloads = chunk_text(args.source, args.version, args.error)
+
+    version = None if args.lines else args.version
+    count = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        encode = lambda payload: _encode_payload(payload, version, args.error)
+        for _ in feed_pool(executor, encode, payloads, args.max_pending):
+            count += 1
+
+    elapsed = time.time() - start_time
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"Encoded {count} payloads in {elapsed:.2f} seconds.")
+    print(f"Capacity per payload: {payload_capacity(args.version, args.error)} bytes.")
+    print(f"Peak RSS: {peak_kb / 1024:.1f} MB.")
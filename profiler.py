@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import platform
+import threading
+import collections
+
+#On-demand profiling for the generator windows.
+#
+#Ctrl+Shift+P (or profiler.install(window, params) and its action) starts a capture and
+#the same key stops it. A capture runs cProfile on the GUI thread and on every shared
+#scheduler worker task, plus a sampling thread that records the stacks of all threads
+#(verification pools included). From Python 3.12 cProfile is one profiler per interpreter,
+#so there only the GUI thread is profiled and the workers are left to the sampler.
+#Stopping writes, next to each other:
+#
+#    profile-<window>-<time>.pstats      cProfile statistics (python -m pstats, snakeviz)
+#    profile-<window>-<time>.collapsed   "thread;frame;frame count" lines for flamegraph.pl/speedscope
+#    profile-<window>-<time>.json        the run parameters and capture settings
+#
+#While no capture runs the only cost is the scheduler reading CURRENT once per task.
+
+SHORTCUT = "Ctrl+Shift+P"
+SAMPLE_INTERVAL = 0.005
+OUTPUT_DIR = os.environ.get("QT_GUIS_PROFILE_DIR", ".")
+
+#The running capture, None while profiling is off
+CURRENT = None
+
+#A second cProfile enable() raises ValueError from 3.12 (sys.monitoring allows one profiler)
+PER_THREAD_CPROFILE = sys.version_info < (3, 12)
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Capture:
+    """One profiling window: cProfile per thread and/or a stack sampling thread."""
+
+    def __init__(self, name="run", params=None, cprofile=True, sample=True, interval=SAMPLE_INTERVAL,
+                 output_dir=None):
+        self.name = name
+        self.params = dict(params or {})
+        self.cprofile = cprofile
+        self.sample = sample
+        self.interval = interval
+        self.output_dir = output_dir or OUTPUT_DIR
+        self.profiles = {}  #thread id -> cProfile.Profile
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.sampler = None
+        self.stopping = threading.Event()
+        self.started = None
+        self.owner = None
+
+    def thread_profile(self):
+        """cProfile.Profile of the calling thread, created on first use."""
+        ident = threading.get_ident()
+        profile = self.profiles.get(ident)
+        if profile is None:
+            profile = cProfile.Profile()
+            with self.lock:
+                self.profiles[ident] = profile
+        return profile
+
+    def run_task(self, fn, *args, **kwargs):
+        """Call fn under this thread's profile (used by the scheduler workers)."""
+        #Tasks run inline by a waiting task are already inside the outer task's profile
+        if (not self.cprofile or not PER_THREAD_CPROFILE or threading.get_ident() == self.owner
+                or getattr(self.local, "active", False)):
+            return fn(*args, **kwargs)
+        profile = self.thread_profile()
+        try:
+            profile.enable()
+        except ValueError:
+            #Another profiler is active, the task only shows up in the samples
+            return fn(*args, **kwargs)
+        self.local.active = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            self.local.active = False
+
+    def _sample(self):
+        me = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        global CURRENT
+        self.started = time.time()
+        self.owner = threading.get_ident()
+        if self.cprofile:
+            try:
+                self.thread_profile().enable()
+            except ValueError as e:
+                print(f"cProfile unavailable ({e}), sampling only.")
+                self.cprofile = False
+                self.profiles.clear()
+        if self.sample:
+            self.sampler = threading.Thread(target=self._sample, name="profiler-sampler", daemon=True)
+            self.sampler.start()
+        CURRENT = self
+
+    def stop(self):
+        """Stop the capture and write its files, returns the path prefix."""
+        global CURRENT
+        CURRENT = None
+        duration = time.time() - self.started
+        if self.cprofile:
+            self.profiles[self.owner].disable()
+        if self.sampler is not None:
+            self.stopping.set()
+            self.sampler.join()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        prefix = os.path.join(self.output_dir, f"profile-{self.name}-{stamp}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        if self.cprofile:
+            with self.lock:
+                profiles = list(self.profiles.values())
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(prefix + ".pstats")
+        if self.sample:
+            with open(prefix + ".collapsed", "w") as f:
+                for stack, count in sorted(self.stacks.items()):
+                    f.write(f"{stack} {count}\n")
+        with open(prefix + ".json", "w") as f:
+            json.dump({
+                "name": self.name,
+                "params": self.params,
+                "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+                "seconds": duration,
+                "cprofile_threads": len(self.profiles) if self.cprofile else 0,
+                "samples": self.samples,
+                "sample_interval": self.interval if self.sample else None,
+                "python": platform.python_version(),
+                "machine": f"{platform.machine()} {os.cpu_count()} cpu",
+            }, f, indent=2, default=str)
+        return prefix
+
+
+def run_task(fn, *args, **kwargs):
+    """Call fn, under the running capture when there is one."""
+    capture = CURRENT
+    if capture is None:
+        return fn(*args, **kwargs)
+    return capture.run_task(fn, *args, **kwargs)
+
+
+def toggle(name="run", params=None, **options):
+    """Start a capture, or stop the running one and return its file prefix."""
+    if CURRENT is not None:
+        prefix = CURRENT.stop()
+        print(f"Profile saved to {prefix}.pstats/.collapsed/.json.")
+        return prefix
+    Capture(name, params, **options).start()
+    print(f"Profiling {name}, press {SHORTCUT} again to stop.")
+    return None
+
+
+def install(window, params=None, name=None, shortcut=SHORTCUT, seconds=None):
+    """Add the start/stop profiling action (window wide shortcut) to a window.
+
+    params is a dict or a callable returning one, read when a capture starts so it
+    holds the current run parameters. With seconds the capture stops on its own.
+    """
+    from PyQt5.QtWidgets import QAction
+    from PyQt5.QtCore import QTimer, Qt
+    #Named after the window's script, which is __main__ when run directly
+    module = sys.modules.get(type(window).__module__)
+    name = name or os.path.splitext(os.path.basename(getattr(module, "__file__", "window")))[0]
+    action = QAction("Start/Stop Profiling", window)
+    action.setShortcut(shortcut)
+    action.setShortcutContext(Qt.WindowShortcut)
+
+    def triggered():
+        started = CURRENT is None
+        toggle(name, params() if callable(params) else params)
+        if started and seconds:
+            QTimer.singleShot(int(seconds * 1000), lambda: CURRENT is not None and toggle())
+    action.triggered.connect(triggered)
+    window.addAction(action)
+    return action
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile a generator window from start to loaded.")
+    parser.add_argument("window", choices=("QRCode_Table", "QRTable_Label", "QR_Code_GeneratorV2"))
+    parser.add_argument("--no-cprofile", action="store_true", help="Sampling only.")
+    parser.add_argument("--interval", type=float, default=SAMPLE_INTERVAL, help="Sampling interval in seconds.")
+    parser.add_argument("--output", default=OUTPUT_DIR)
+    args = parser.parse_args()
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    module = __import__(args.window)
+    #The scheduler sees the imported module, not this __main__ copy
+    import profiler
+    capture = profiler.Capture(args.window, {"window": args.window}, cprofile=not args.no_cprofile,
+                      interval=args.interval, output_dir=args.output)
+    capture.start()
+    window = module.MainWindow()
+    prefix = capture.stop()
+    print(f"Profile saved to {prefix}.pstats/.collapsed/.json ({capture.samples} samples).")
+    if not args.no_cprofile:
+        pstats.Stats(prefix + ".pstats").sort_stats("cumulative").print_stats(15)
@@ -0,0 +1,140 @@
+import time
+import itertools
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtGui import QPainter, QColor
+from palette import CodeView, indexed_image
+
+#Progressive cells for the table views: a placeholder painted as soon as the cell exists, a
+#low resolution preview straight from the module matrix (one pixel per module, scaled up
+#without smoothing when painted) once the code is encoded, then the final render. Cells are
+#requested viewport first in reading order, and PaintClock measures when the cells visible
+#at the start were first painted at each stage.
+
+PLACEHOLDER = 0
+PREVIEW = 1
+FINAL = 2
+STAGE_NAMES = ("placeholder", "preview", "final")
+
+PLACEHOLDER_COLOUR = "#E4E4E4"
+FINDER_COLOUR = "#C8C8C8"
+
+
+def reading_order(count, columns, first_row, last_row):
+    """Cell indices row by row: the visible rows, then the rows below them, then the rows above."""
+    rows = -(-count // columns)
+    first_row = max(0, min(first_row, rows - 1))
+    last_row = max(first_row, min(last_row, rows - 1))
+    for row in itertools.chain(range(first_row, last_row + 1), range(last_row + 1, rows), range(first_row)):
+        yield from range(row * columns, min(count, (row + 1) * columns))
+
+
+def paint_now():
+    """Process events until new cell widgets are painted (the table lays them out on a zero timer first)."""
+    QApplication.processEvents()
+    QApplication.processEvents()
+
+
+class PaintClock:
+    """Time from the start of a load until every watched cell has been painted at each stage."""
+
+    def __init__(self, cells, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.cells = len(cells)
+        self.waiting = [set(cells) for _ in STAGE_NAMES]
+        self.times = [None] * len(STAGE_NAMES)
+
+    def painted(self, index, stage):
+        #A final paint is also the first meaningful one when the preview was never painted
+        for level in range(stage + 1):
+            waiting = self.waiting[level]
+            if index in waiting:
+                waiting.discard(index)
+                if not waiting and self.times[level] is None:
+                    self.times[level] = time.perf_counter() - self.start
+
+    def done(self, stage):
+        return self.times[stage] is not None
+
+    def summary(self):
+        parts = [f"{name} {seconds*1000:.0f} ms" if seconds is not None else f"{name} pending"
+                 for name, seconds in zip(STAGE_NAMES, self.times)]
+        return f"First paint of the {self.cells} visible cells: {', '.join(parts)}."
+
+
+class ProgressiveView(CodeView):
+    """CodeView that starts as a placeholder and is upgraded to a preview, then to the final image."""
+
+    def __init__(self, size=150, clock=None, index=None, parent=None):
+        super().__init__(None, size, parent)
+        self.clock = clock
+        self.index = index
+        self.stage = PLACEHOLDER
+
+    def set_preview(self, matrix, colours=None, border=1):
+        """Show the module matrix at one pixel per module until the final image arrives."""
+        if self.stage >= PREVIEW:
+            return
+        image = indexed_image(matrix, 1, border)
+        if colours is not None:
+            image.setColorTable(colours)
+        self.image = image
+        self.stage = PREVIEW
+        self.update()
+
+    def set_final(self, image, key=None):
+        """Show the final image: a QImage, or a CodeImages and the code key."""
+        self.image = image
+        self.key = key
+        self.stage = FINAL
+        self.update()
+
+    def paintEvent(self, event):
+        if self.stage == PLACEHOLDER:
+            #A flat tile with the three finder pattern corners, no image involved
+            painter = QPainter(self)
+            side = min(self.width(), self.height())
+            left, top = (self.width() - side) // 2, (self.height() - side) // 2
+            painter.fillRect(left, top, side, side, QColor(PLACEHOLDER_COLOUR))
+            finder = side // 4
+            margin = side // 12
+            for x, y in ((margin, margin), (side - margin - finder, margin), (margin, side - margin - finder)):
+                painter.fillRect(left + x, top + y, finder, finder, QColor(FINDER_COLOUR))
+            painter.end()
+        else:
+            super().paintEvent(event)
+        if self.clock is not None:
+            self.clock.painted(self.index, self.stage)
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import shutil
+    import tempfile
+    import importlib
+
+    #Time to meaningful paint of a table window with and without progressive rendering
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv[:1])
+    name = sys.argv[1] if len(sys.argv) > 1 else "QRTable_Label"
+    module = importlib.import_module(name)
+    scratch = tempfile.mkdtemp()
+    for progressive in (False, True):
+        module.PROGRESSIVE_RENDERING = progressive
+        #Both runs encode everything, neither loads the other's snapshot
+        module.SNAPSHOT_PATH = os.path.join(scratch, f"run{int(progressive)}.qrsnap")
+        start_time = time.perf_counter()
+        window = module.MainWindow()
+        loaded = time.perf_counter() - start_time
+        if not progressive:
+            #Without progressive rendering nothing is on screen before the load returns and the window is shown
+            window.show()
+            window.grab()
+            print(f"{name} plain: first paint after {(time.perf_counter() - start_time)*1000:.0f} ms "
+                  f"(load {loaded:.2f} s).")
+        else:
+            #The window printed its PaintClock summary as soon as the visible cells were final
+            print(f"{name} progressive: load {loaded:.2f} s.")
+        window.close()
+    shutil.rmtree(scratch)
@@ -0,0 +1,75 @@
+import hashlib
+import numpy as np
+import segno
+
+#Qt-free generation core: payloads go in, module matrices (1 = dark, no quiet zone) come out
+
+QR_CODE = "qr"
+DATA_MATRIX = "dm"
+
+
+def qr_matrix(payload, version=None, error=None, micro=False, boost_error=True, optimize=False):
+    """Return the module matrix of a QR code.
+
+    optimize picks the mixed numeric/alphanumeric/byte segmentation with the
+    smallest version, uppercasing hex digests and URL scheme/host to get there.
+    Binary payloads (bytes) are byte mode already and skip it.
+    """
+    if optimize and not micro and isinstance(payload, str):
+        #Imported here, segments pulls in segno internals the plain path never needs
+        import segments
+        qr = segments.make(payload, error=error, version=version, boost_error=boost_error, normalize=True)
+        return np.array(qr.matrix, dtype=np.uint8)
+    qr = segno.make(payload, version=version, error=error, micro=micro, boost_error=boost_error)
+    return np.array(qr.matrix, dtype=np.uint8)
+
+
+def dm_matrix(payload, size=None):
+    """Return the module matrix of a Data Matrix code, sampled from the libdmtx image."""
+    #Imported here so the QR paths keep working on machines without the dmtx shared library
+    from pylibdmtx import pylibdmtx
+    if isinstance(size, tuple):
+        size = f"{size[0]}x{size[1]}"
+    data = payload.encode("utf-8") if isinstance(payload, str) else payload
+    encoded = pylibdmtx.encode(data, size=size)
+    pixels = np.frombuffer(encoded.pixels, dtype=np.uint8)
+    pixels = pixels.reshape(encoded.height, encoded.width, encoded.bpp // 8)
+    dark = pixels[:, :, 0] < 128
+    #Crop the margin, the solid L finder spans the full symbol
+    rows = np.flatnonzero(dark.any(axis=1))
+    cols = np.flatnonzero(dark.any(axis=0))
+    dark = dark[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    #The top timing row starts dark then light, so the first run is one module wide
+    module = int(np.argmin(dark[0]))
+    return dark[module // 2::module, module // 2::module].astype(np.uint8)
+
+
+def make_matrix(payload, symbology=QR_CODE, version=None, error=None, micro=False,
+                dm_size=None, boost_error=True, optimize=False):
+    """Return the module matrix for a payload in the given symbology."""
+    if symbology == QR_CODE:
+        return qr_matrix(payload, version=version, error=error, micro=micro, boost_error=boost_error,
+                         optimize=optimize)
+    if symbology == DATA_MATRIX:
+        return dm_matrix(payload, size=dm_size)
+    raise ValueError(f"Unknown symbology: {symbology}.")
+
+
+def code_key(payload, symbology=QR_CODE, **params):
+    """Return a short digest identifying a payload rendered with the given parameters."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(symbology.encode("ascii"))
+    for name in sorted(params):
+        digest.update(f"\0{name}={params[name]!r}".encode("utf-8"))
+    digest.update(b"\0\0")
+    digest.update(payload.encode("utf-8") if isinstance(payload, str) else payload)
+    return digest.digest()
+
+
+def scale_matrix(matrix, scale=1, border=0):
+    """Return the matrix with a light quiet zone of border modules, scaled by pixel repetition."""
+    if border:
+        matrix = np.pad(matrix, border, constant_values=0)
+    if scale > 1:
+        matrix = np.repeat(np.repeat(matrix, scale, axis=0), scale, axis=1)
+    return matrix
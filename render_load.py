@@ -0,0 +1,133 @@
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import threading
+import http.client
+import urllib.parse
+import numpy as np
+
+#Load generator for render_service.py. Each client thread keeps one keep-alive connection
+#and sends requests back to back, a share of them repeating payloads already asked for so
+#the cache is exercised as it would be by label tools reprinting codes.
+#
+#    python render_load.py --clients 8 --requests 200            (starts its own service)
+#    python render_load.py --url http://127.0.0.1:8765 --clients 8
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix socket path."""
+
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def connect(target):
+    """Connection for http://host:port or unix:/path."""
+    if target.startswith("unix:"):
+        return UnixHTTPConnection(target[len("unix:"):])
+    url = urllib.parse.urlsplit(target)
+    return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+
+
+def client(target, requests, repeat_share, fmt, seed, latencies, failures):
+    """One client thread: requests over a single keep-alive connection."""
+    rng = random.Random(seed)
+    connection = connect(target)
+    sent = []
+    for number in range(requests):
+        if sent and rng.random() < repeat_share:
+            payload = rng.choice(sent)
+        else:
+            payload = f"https://www.example.com/item/{seed}-{number}"
+            sent.append(payload)
+        path = "/code?" + urllib.parse.urlencode({"data": payload, "format": fmt})
+        start_time = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                failures.append(response.status)
+        except (OSError, http.client.HTTPException) as e:
+            failures.append(str(e))
+            connection.close()
+            connection = connect(target)
+            continue
+        latencies.append(time.perf_counter() - start_time)
+    connection.close()
+
+
+def fetch_stats(target):
+    connection = connect(target)
+    connection.request("GET", "/stats")
+    stats = json.loads(connection.getresponse().read())
+    connection.close()
+    return stats
+
+
+def run_load(target, clients=8, requests=200, repeat_share=0.3, fmt="png"):
+    """Run the clients to completion, returns a result dict."""
+    latencies, failures = [], []
+    threads = [threading.Thread(target=client, args=(target, requests, repeat_share, fmt, seed, latencies, failures))
+               for seed in range(clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start_time
+    ms = np.array(latencies) * 1000
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "failures": len(failures),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else 0.0,
+        "p95_ms": float(np.percentile(ms, 95)) if len(ms) else 0.0,
+        "max_ms": float(ms.max()) if len(ms) else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the render service.")
+    parser.add_argument("--url", help="http://host:port or unix:/path of a running service "
+                                      "(default: start one in this process).")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client.")
+    parser.add_argument("--repeat", type=float, default=0.3, help="Share of requests repeating earlier payloads.")
+    parser.add_argument("--format", default="png", choices=("png", "zpl", "pcl", "txt"))
+    args = parser.parse_args(argv)
+
+    server = None
+    target = args.url
+    if target is None:
+        import render_service
+        server = render_service.RenderServer(("127.0.0.1", 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        target = f"http://127.0.0.1:{server.server_address[1]}"
+
+    result = run_load(target, args.clients, args.requests, args.repeat, args.format)
+    print(f"{result['requests']} requests from {result['clients']} keep-alive clients in {result['seconds']:.2f} "
+          f"seconds: {result['requests_per_second']:.0f} req/s, p50 {result['p50_ms']:.1f} ms, "
+          f"p95 {result['p95_ms']:.1f} ms, max {result['max_ms']:.1f} ms, {result['failures']} failures.")
+    stats = fetch_stats(target)
+    print(f"Service: {stats['rendered']} rendered in {stats['batches']} batches (mean {stats['mean_batch']:.1f}, "
+          f"max {stats['max_batch']}), {stats['cache_hits']} cache hits, {stats['cache_entries']} cached.")
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    return 1 if result["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
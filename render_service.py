@@ -0,0 +1,309 @@
+import io
+import os
+import json
+import time
+import queue
+import threading
+import collections
+import socketserver
+import urllib.parse
+import http.server
+import numpy as np
+import qrcore
+import code_png
+import label_printer
+
+#Local render service on the Qt-free core for tools that cannot run a window:
+#
+#    GET  /code?data=...&format=png|zpl|pcl|txt&symbology=qr|dm&scale=8&border=1&error=M&dark=%23000000
+#    POST /code?format=...        (payload in the request body)
+#    GET  /stats                  (JSON latency and throughput statistics)
+#
+#Requests that arrive together are rendered as one micro-batch by a single render thread,
+#identical codes in a batch are rendered once, and rendered bodies stay in an LRU cache.
+#HTTP/1.1 keep-alive is on, so a client can send many requests over one connection.
+#
+#    python render_service.py --port 8765        or        python render_service.py --unix /tmp/qr.sock
+
+FORMATS = {
+    "png": "image/png",
+    "zpl": "application/vnd.zebra-zpl",
+    "pcl": "application/vnd.hp-pcl",
+    "txt": "text/plain; charset=utf-8",
+}
+ERRORS = ("L", "M", "Q", "H")
+
+
+def parse_request(query, body=None):
+    """Validate request parameters, returns (payload, options) or raises ValueError."""
+    payload = body if body is not None else query.get("data", [None])[0]
+    if not payload:
+        raise ValueError("No data to encode.")
+    options = {
+        "format": query.get("format", ["png"])[0],
+        "symbology": query.get("symbology", [qrcore.QR_CODE])[0],
+        "scale": int(query.get("scale", [8])[0]),
+        "border": int(query.get("border", [1])[0]),
+        "error": query.get("error", [None])[0],
+        "dark": query.get("dark", [code_png.BLACK])[0],
+    }
+    if options["format"] not in FORMATS:
+        raise ValueError(f"Unknown format: {options['format']}.")
+    if options["symbology"] not in (qrcore.QR_CODE, qrcore.DATA_MATRIX):
+        raise ValueError(f"Unknown symbology: {options['symbology']}.")
+    if options["error"] is not None and options["error"].upper() not in ERRORS:
+        raise ValueError(f"Unknown error level: {options['error']}.")
+    if not 1 <= options["scale"] <= 64 or not 0 <= options["border"] <= 16:
+        raise ValueError("scale must be 1..64 and border 0..16.")
+    return payload, options
+
+
+def render(payload, options):
+    """Encode and render one code to the response body."""
+    if options["symbology"] == qrcore.QR_CODE:
+        matrix = qrcore.qr_matrix(payload, error=options["error"], micro=False)
+    else:
+        matrix = qrcore.dm_matrix(payload)
+    kind = options["format"]
+    if kind == "png":
+        return code_png.png_bytes(matrix, options["scale"], options["border"], dark=options["dark"])
+    if kind == "txt":
+        pixels = qrcore.scale_matrix(matrix, 1, options["border"])
+        return "\n".join("".join("1" if bit else "0" for bit in row) for row in pixels).encode("ascii") + b"\n"
+    buffer = io.BytesIO()
+    with label_printer.LabelPrinterWriter(buffer, kind, scale=options["scale"],
+                                          quiet_zone=options["border"]) as writer:
+        writer.add_label(matrix)
+    return buffer.getvalue()
+
+
+class RenderBatcher:
+    """One render thread that drains the request queue in micro-batches.
+
+    After the first request of a batch arrives it waits up to max_wait seconds
+    for more (or until max_batch are queued). Identical requests in a batch
+    share one render and every body lands in an LRU cache of cache_size.
+    """
+
+    def __init__(self, max_batch=64, max_wait=0.002, cache_size=10000, history=10000):
+        self.requests = queue.Queue()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cache = collections.OrderedDict()
+        self.cache_size = cache_size
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=history)
+        self.batch_sizes = collections.deque(maxlen=history)
+        self.counts = collections.Counter()
+        self.started = time.time()
+        self.thread = threading.Thread(target=self._run, name="render-batcher", daemon=True)
+        self.thread.start()
+
+    def _key(self, payload, options):
+        return qrcore.code_key(payload, **options)
+
+    def render(self, payload, options):
+        """Render through the batch queue (the cache answers directly), returns the body."""
+        start_time = time.perf_counter()
+        key = self._key(payload, options)
+        with self.lock:
+            body = self.cache.get(key)
+            if body is not None:
+                self.cache.move_to_end(key)
+                self.counts["cache_hits"] += 1
+        if body is None:
+            done = threading.Event()
+            slot = {"key": key, "payload": payload, "options": options, "done": done}
+            self.requests.put(slot)
+            done.wait()
+            if "error" in slot:
+                raise slot["error"]
+            body = slot["body"]
+        with self.lock:
+            self.counts["requests"] += 1
+            self.latencies.append(time.perf_counter() - start_time)
+        return body
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self.requests.get(timeout=remaining) if remaining > 0 else
+                                 self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            self._render_batch(batch)
+
+    def _render_batch(self, batch):
+        rendered = {}
+        for slot in batch:
+            key = slot["key"]
+            if key not in rendered:
+                try:
+                    rendered[key] = (render(slot["payload"], slot["options"]), None)
+                except Exception as e:
+                    rendered[key] = (None, e)
+            body, error = rendered[key]
+            if error is not None:
+                slot["error"] = error
+            else:
+                slot["body"] = body
+        with self.lock:
+            for key, (body, error) in rendered.items():
+                if error is None:
+                    self.cache[key] = body
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            self.batch_sizes.append(len(batch))
+            self.counts["batches"] += 1
+            self.counts["rendered"] += len(rendered)
+        for slot in batch:
+            slot["done"].set()
+
+    def stats(self):
+        """Latency (ms), throughput and batching statistics as a JSON-able dict."""
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            sizes = np.array(self.batch_sizes)
+            counts = dict(self.counts)
+            cached = len(self.cache)
+        uptime = time.time() - self.started
+        result = {
+            "uptime_seconds": uptime,
+            "requests": counts.get("requests", 0),
+            "requests_per_second": counts.get("requests", 0) / max(uptime, 1e-9),
+            "cache_hits": counts.get("cache_hits", 0),
+            "cache_entries": cached,
+            "batches": counts.get("batches", 0),
+            "rendered": counts.get("rendered", 0),
+            "errors": counts.get("errors", 0),
+            "mean_batch": float(sizes.mean()) if len(sizes) else 0.0,
+            "max_batch": int(sizes.max()) if len(sizes) else 0,
+        }
+        if len(latencies):
+            result.update(p50_ms=float(np.percentile(latencies, 50)), p95_ms=float(np.percentile(latencies, 95)),
+                          p99_ms=float(np.percentile(latencies, 99)), max_ms=float(latencies.max()))
+        return result
+
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  #Keep-alive unless the client asks to close
+    #Headers and body are separate writes, with Nagle on the client's delayed ACK holds every reply ~40 ms
+    disable_nagle_algorithm = True
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status, message):
+        with self.server.batcher.lock:
+            self.server.batcher.counts["errors"] += 1
+        self._send(status, (message + "\n").encode("utf-8"), FORMATS["txt"])
+
+    def _code(self, body=None):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            payload, options = parse_request(urllib.parse.parse_qs(url.query), body)
+            data = self.server.batcher.render(payload, options)
+        except ValueError as e:
+            #Bad parameters, or data that does not fit (segno.DataOverflowError is a ValueError)
+            self._error(400, str(e))
+            return
+        except Exception as e:
+            self._error(500, f"Failed to render code: {e}.")
+            return
+        self._send(200, data, FORMATS[options["format"]])
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/code":
+            self._code()
+        elif path == "/stats":
+            self._send(200, json.dumps(self.server.batcher.stats(), indent=2).encode("utf-8"), "application/json")
+        else:
+            self._error(404, f"Unknown path: {path}.")
+
+    def do_POST(self):
+        path = urllib.parse.urlsplit(self.path).path
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if path == "/code":
+            try:
+                #Strict, a replaced character would print a different payload than the one sent
+                body = body.decode("utf-8")
+            except UnicodeDecodeError as e:
+                self._error(400, f"Request body is not UTF-8: {e}.")
+                return
+            self._code(body)
+        else:
+            self._error(404, f"Unknown path: {path}.")
+
+    def address_string(self):
+        #Unix socket clients have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RenderServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher=None, verbose=False):
+        self.batcher = batcher or RenderBatcher()
+        self.verbose = verbose
+        super().__init__(address, RenderHandler)
+
+
+class UnixRenderHandler(RenderHandler):
+    disable_nagle_algorithm = False  #No TCP options on a Unix socket
+
+
+class UnixRenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher=None, verbose=False):
+        self.batcher = batcher or RenderBatcher()
+        self.verbose = verbose
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, UnixRenderHandler)
+
+
+def serve(port=8765, host="127.0.0.1", unix=None, verbose=False, **batch_options):
+    """Run the service until interrupted."""
+    batcher = RenderBatcher(**batch_options)
+    server = UnixRenderServer(unix, batcher, verbose) if unix else RenderServer((host, port), batcher, verbose)
+    print(f"Render service on {unix or f'http://{host}:{port}'} (Ctrl+C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if unix and os.path.exists(unix):
+            os.remove(unix)
+        print(json.dumps(batcher.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local QR/Data Matrix render service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Listen on this Unix socket path instead of TCP.")
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args()
+    serve(args.port, args.host, args.unix, args.verbose, max_batch=args.max_batch,
+          max_wait=args.max_wait_ms / 1000, cache_size=args.cache_size)
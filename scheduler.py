@@ -0,0 +1,408 @@
+import time
+import heapq
+import itertools
+import threading
+import collections
+import concurrent.futures
+import numpy as np
+import profiler
+
+#Chunked work window: a few tasks of many items each instead of one future per item
+
+#Priority classes of the shared scheduler, lower runs first
+INTERACTIVE = 0  #A single code the user just asked for
+VISIBLE = 1  #Cells in the viewport
+PREFETCH = 2  #Cells about to scroll into view
+BULK = 3  #Whole table loads and exports
+CLASS_NAMES = ("interactive", "visible", "prefetch", "bulk")
+#Submit to result latency each class should stay under, in seconds (None: throughput only)
+LATENCY_TARGETS = (0.05, 0.1, 0.5, None)
+
+#Priority and scheduler of the task the current worker thread is running
+_current = threading.local()
+
+
+def _run_chunk(fn, indices):
+    """Worker side: call fn for every index of the chunk, returns (results, seconds spent in fn)."""
+    start_time = time.perf_counter()
+    results = []
+    for index in indices:
+        checkpoint()
+        results.append(fn(index))
+    return results, time.perf_counter() - start_time
+
+
+def checkpoint():
+    """Let higher priority work go first when called on a PriorityScheduler worker, a no-op elsewhere."""
+    scheduler = getattr(_current, "scheduler", None)
+    if scheduler is not None:
+        scheduler._yield(_current.priority)
+
+
+class ChunkScheduler:
+    """Submit fn(index) in chunks of chunk_size items, with at most max_in_flight chunks pending.
+
+    Results come back as (index, result) pairs, in index order when ordered is
+    True or as chunks complete otherwise. max_in_flight may be changed while
+    iterating (the autotuner does this), it takes effect at the next submit.
+    Consumer side bookkeeping is timed separately from waiting on workers so
+    the per-item scheduling overhead can be reported.
+    """
+
+    def __init__(self, executor, fn, chunk_size=16, max_in_flight=4, ordered=True):
+        self.executor = executor
+        self.fn = fn
+        self.chunk_size = max(1, chunk_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.ordered = ordered
+        self.items = 0
+        self.chunks = 0
+        self.peak_in_flight = 0
+        self.schedule_time = 0.0  #Submitting chunks and unpacking results
+        self.wait_time = 0.0  #Blocked waiting for a worker
+        self.work_time = 0.0  #Inside fn, summed over workers
+        self.elapsed = 0.0
+
+    def _chunks(self, indices):
+        chunk = []
+        for index in indices:
+            chunk.append(index)
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def run(self, indices):
+        """Yield (index, result) for every index, keeping the in-flight window bounded."""
+        if isinstance(indices, int):
+            indices = range(indices)
+        start_time = time.perf_counter()
+        chunks = self._chunks(indices)
+        pending = collections.deque()  #(indices, future) in submission order
+        exhausted = False
+        try:
+            while True:
+                mark = time.perf_counter()
+                while not exhausted and len(pending) < max(1, self.max_in_flight):
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending.append((chunk, self.executor.submit(_run_chunk, self.fn, chunk)))
+                    self.chunks += 1
+                self.peak_in_flight = max(self.peak_in_flight, len(pending))
+                if not pending:
+                    self.schedule_time += time.perf_counter() - mark
+                    break
+
+                if self.ordered:
+                    chunk, future = pending.popleft()
+                else:
+                    waited = time.perf_counter()
+                    self.schedule_time += waited - mark
+                    concurrent.futures.wait([f for _, f in pending],
+                                            return_when=concurrent.futures.FIRST_COMPLETED)
+                    mark = time.perf_counter()
+                    self.wait_time += mark - waited
+                    position = next(i for i, (_, f) in enumerate(pending) if f.done())
+                    chunk, future = pending[position]
+                    del pending[position]
+
+                waited = time.perf_counter()
+                self.schedule_time += waited - mark
+                results, work = future.result()
+                mark = time.perf_counter()
+                self.wait_time += mark - waited
+                self.work_time += work
+                self.items += len(chunk)
+                pairs = list(zip(chunk, results))
+                self.schedule_time += time.perf_counter() - mark
+                #Time spent by the caller between items is not ours to count
+                yield from pairs
+        finally:
+            for _, future in pending:
+                future.cancel()
+            self.elapsed = time.perf_counter() - start_time
+
+    def overhead_per_item(self):
+        """Consumer side scheduling cost per item in seconds."""
+        return self.schedule_time / self.items if self.items else 0.0
+
+    def summary(self):
+        """Return the scheduling statistics for the run summary."""
+        return (f"Scheduler: {self.items} items in {self.chunks} chunks of {self.chunk_size}, "
+                f"peak {self.peak_in_flight} in flight, "
+                f"overhead {self.overhead_per_item() * 1e6:.1f} us/item, "
+                f"waiting {self.wait_time:.2f} s, work {self.work_time:.2f} s.")
+
+
+class ClassExecutor:
+    """Executor-like view of a PriorityScheduler that submits everything at one priority.
+
+    Chunks from a ChunkScheduler holding promoted indices (promote) are
+    submitted in the promoted class instead, e.g. the cells in the viewport.
+    """
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.limited = False
+        self.promoted = []  #(priority, indices)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        #The workers are shared, leaving the with block does not shut them down, only lifts our limit
+        if self.limited:
+            self.scheduler.set_limit(self.priority, None)
+            self.limited = False
+        return False
+
+    def set_workers(self, workers):
+        """Run at most workers tasks of this class at once (the autotuner's worker count)."""
+        self.scheduler.set_limit(self.priority, workers)
+        self.limited = True
+
+    def promote(self, priority, indices):
+        """Submit chunks holding any of indices (a range or set) at priority."""
+        self.promoted.append((priority, indices))
+        self.promoted.sort(key=lambda entry: entry[0])
+
+    def submit(self, fn, *args, **kwargs):
+        priority = self.priority
+        if self.promoted and fn is _run_chunk:
+            chunk = args[1]
+            priority = next((promoted for promoted, indices in self.promoted
+                             if promoted < priority and any(index in indices for index in chunk)), priority)
+        return self.scheduler.submit(priority, fn, *args, **kwargs)
+
+
+class PriorityScheduler:
+    """Worker threads shared by all windows, taking tasks from one priority queue.
+
+    A task is a whole chunk (see ChunkScheduler), so a queued higher class
+    task starts at the next chunk boundary. Chunks also call checkpoint()
+    between items: a worker there runs any queued higher class task inline
+    and otherwise waits while higher class tasks are running, so with one
+    CPU an interactive request does not share the interpreter with a batch.
+    A class may be limited to fewer concurrent tasks than there are workers
+    (set_limit). Submit to result latency is recorded per class against
+    LATENCY_TARGETS.
+    """
+
+    def __init__(self, workers=2, history=1000):
+        self.workers = max(1, workers)
+        self.condition = threading.Condition()
+        self.heap = []  #(priority, sequence, future, fn, args, kwargs, queued)
+        self.sequence = itertools.count()
+        self.running = [0] * len(CLASS_NAMES)
+        self.limits = [None] * len(CLASS_NAMES)  #Concurrent tasks allowed per class, None for every worker
+        self.latencies = [collections.deque(maxlen=history) for _ in CLASS_NAMES]
+        self.completed = [0] * len(CLASS_NAMES)
+        self.stopped = False
+        self.threads = [threading.Thread(target=self._work, name=f"priority-worker-{i}", daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, priority, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) in a priority class, returns a concurrent.futures.Future."""
+        future = concurrent.futures.Future()
+        with self.condition:
+            if self.stopped:
+                raise RuntimeError("Cannot submit to a stopped scheduler.")
+            heapq.heappush(self.heap, (priority, next(self.sequence), future, fn, args, kwargs,
+                                       time.perf_counter()))
+            self.condition.notify_all()
+        return future
+
+    def executor(self, priority):
+        """Executor-like object for ChunkScheduler and friends that submits at priority."""
+        return ClassExecutor(self, priority)
+
+    def set_limit(self, priority, workers):
+        """Allow at most workers concurrent tasks of a class, None lifts the limit."""
+        with self.condition:
+            self.limits[priority] = None if workers is None else max(1, workers)
+            self.condition.notify_all()
+
+    def _higher_running(self, priority):
+        return any(self.running[:priority])
+
+    def _can_start(self, priority):
+        limit = self.limits[priority]
+        return not self._higher_running(priority) and (limit is None or self.running[priority] < limit)
+
+    def _execute(self, task):
+        """Run one popped task (running count already taken) and record its latency."""
+        priority, _, future, fn, args, kwargs, queued = task
+        outer = (getattr(_current, "scheduler", None), getattr(_current, "priority", None))
+        _current.scheduler, _current.priority = self, priority
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(profiler.run_task(fn, *args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+                latency = time.perf_counter() - queued
+                self.latencies[priority].append(latency)
+                self.completed[priority] += 1
+        finally:
+            _current.scheduler, _current.priority = outer
+            with self.condition:
+                self.running[priority] -= 1
+                self.condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self.condition:
+                #A lower class task waits for running higher class tasks before it starts
+                #and a class at its limit waits for one of its own tasks to finish
+                while not self.stopped and (not self.heap or not self._can_start(self.heap[0][0])):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                task = heapq.heappop(self.heap)
+                self.running[task[0]] += 1
+            self._execute(task)
+
+    def _yield(self, priority):
+        """Called between items of a task: run queued higher class work, wait for running higher work."""
+        while True:
+            with self.condition:
+                if self.heap and self.heap[0][0] < priority:
+                    task = heapq.heappop(self.heap)
+                    self.running[task[0]] += 1
+                elif self._higher_running(priority) and not self.stopped:
+                    self.condition.wait()
+                    continue
+                else:
+                    return
+            self._execute(task)
+
+    def latency_report(self):
+        """Per class latency statistics in milliseconds and the share within the class target."""
+        report = {}
+        for priority, name in enumerate(CLASS_NAMES):
+            latencies = np.array(self.latencies[priority]) * 1000
+            if not len(latencies):
+                continue
+            target = LATENCY_TARGETS[priority]
+            report[name] = {
+                "completed": self.completed[priority],
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "max_ms": float(latencies.max()),
+                "target_ms": target * 1000 if target else None,
+                "within_target": float((latencies <= target * 1000).mean()) if target else None,
+            }
+        return report
+
+    def summary(self):
+        """Return the per class latency lines for the run summary."""
+        lines = []
+        for name, stats in self.latency_report().items():
+            line = (f"{name}: {stats['completed']} tasks, p50 {stats['p50_ms']:.1f} ms, "
+                    f"p95 {stats['p95_ms']:.1f} ms, max {stats['max_ms']:.1f} ms")
+            if stats["target_ms"]:
+                line += f", {stats['within_target']:.0%} within {stats['target_ms']:.0f} ms"
+            lines.append(line + ".")
+        return "Priority scheduler: " + (" ".join(lines) if lines else "idle.")
+
+    def shutdown(self, cancel_pending=True):
+        """Stop the workers, cancelling queued tasks unless cancel_pending is False."""
+        with self.condition:
+            if cancel_pending:
+                for task in self.heap:
+                    task[2].cancel()
+                self.heap.clear()
+            self.stopped = True
+            self.condition.notify_all()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_scheduler(workers=None):
+    """The process wide PriorityScheduler, started on first use (workers from the autotune config)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            if workers is None:
+                import autotune
+                workers = autotune.get_config()["thread"]["workers"]
+            _shared = PriorityScheduler(workers)
+        return _shared
+
+
+def per_future_overhead(executor, fn, count):
+    """Baseline for the benchmark: one future per item drained through as_completed, seconds per item."""
+    start_time = time.perf_counter()
+    futures = [executor.submit(fn, i) for i in range(count)]
+    for future in concurrent.futures.as_completed(futures):
+        future.result()
+    return (time.perf_counter() - start_time) / count
+
+
+if __name__ == "__main__":
+    import qrcore
+
+    count = 9000
+    payloads = [f"https://www.example{i % 3 + 1}.com" for i in range(count)]
+
+    def noop(index):
+        return index
+
+    def encode(index):
+        return qrcore.qr_matrix(payloads[index]).shape
+
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        #A no-op task makes the scheduling cost the whole cost
+        baseline = per_future_overhead(executor, noop, count)
+        print(f"One future per item (no-op): {baseline * 1e6:.1f} us/item.")
+        for chunk_size in (1, 16, 64):
+            for ordered in (True, False):
+                scheduler = ChunkScheduler(executor, noop, chunk_size, max_in_flight=8, ordered=ordered)
+                start_time = time.perf_counter()
+                for _ in scheduler.run(count):
+                    pass
+                total = (time.perf_counter() - start_time) / count
+                print(f"Chunks of {chunk_size:<3} {'ordered' if ordered else 'completion'} (no-op): "
+                      f"{total * 1e6:.1f} us/item total, {scheduler.overhead_per_item() * 1e6:.1f} us/item scheduling.")
+
+        start_time = time.perf_counter()
+        per_future_overhead(executor, encode, 1000)
+        print(f"One future per item (encode): {(time.perf_counter() - start_time):.2f} s for 1000.")
+        scheduler = ChunkScheduler(executor, encode, chunk_size=16, max_in_flight=8)
+        start_time = time.perf_counter()
+        for _ in scheduler.run(1000):
+            pass
+        print(f"Chunks of 16 (encode): {(time.perf_counter() - start_time):.2f} s for 1000.")
+        print(scheduler.summary())
+
+    #Interactive requests while a 100k bulk batch runs on the shared workers
+    priority = PriorityScheduler(workers=4)
+    bulk = ChunkScheduler(priority.executor(BULK), lambda index: qrcore.qr_matrix(f"https://www.example.com/item/{index}"),
+                          chunk_size=16, max_in_flight=8)
+    batch = bulk.run(100000)
+
+    def drain():
+        for _ in batch:
+            if stop.is_set():
+                break
+    stop = threading.Event()
+    consumer = threading.Thread(target=drain)
+    consumer.start()
+    time.sleep(1)
+    for i in range(20):
+        start_time = time.perf_counter()
+        priority.submit(INTERACTIVE, qrcore.qr_matrix, f"https://www.example.com/form/{i}").result()
+        time.sleep(0.2)
+    stop.set()
+    consumer.join()
+    print(f"Bulk batch (stopped early): {bulk.items} codes done alongside the interactive requests.")
+    print(priority.summary())
+    priority.shutdown()
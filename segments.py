@@ -0,0 +1,203 @@
+import re
+import time
+import collections
+import segno
+from segno import consts
+from segno.encoder import version_range, prepare_data, find_version
+
+#Mixed mode segmentation: every character goes in the cheapest mode it allows, paying a
+#segment header whenever the mode changes, the classic shortest path over three states.
+
+NUMERIC = "numeric"
+ALPHANUMERIC = "alphanumeric"
+BYTE = "byte"
+MODES = (NUMERIC, ALPHANUMERIC, BYTE)
+
+_UNREACHABLE = float("inf")
+_NUMERIC_CHARS = frozenset("0123456789")
+_ALPHANUMERIC_CHARS = frozenset(consts.ALPHANUMERIC_CHARS.decode("ascii"))
+
+#Lowercase hex digests (SHA-256 and friends) become alphanumeric once uppercased
+_HEX_DIGEST = re.compile(r"[0-9a-f]{32,}")
+#Scheme and host of a URL are case insensitive (RFC 3986), user info is left alone
+_URL_HEAD = re.compile(r"[A-Za-z][A-Za-z0-9+.-]*://[^/?#@]*(?=[/?#]|$)")
+
+
+def normalize_payload(payload, hex_digests=True, urls=True):
+    """Uppercase the case insensitive parts of a payload so they fit alphanumeric mode."""
+    if hex_digests and _HEX_DIGEST.fullmatch(payload):
+        return payload.upper()
+    if urls:
+        match = _URL_HEAD.match(payload)
+        if match:
+            return match.group(0).upper() + payload[match.end():]
+    return payload
+
+
+def _char_bits(char):
+    """Cost of one character per mode in sixths of a bit, None where the mode cannot hold it."""
+    try:
+        size = len(char.encode("iso-8859-1"))
+    except UnicodeEncodeError:
+        size = len(char.encode("utf-8"))
+    return (20 if char in _NUMERIC_CHARS else None,
+            33 if char in _ALPHANUMERIC_CHARS else None,
+            48 * size)
+
+
+def _segment(payload, group):
+    """Return the cheapest [(text, mode)] segmentation and its size in bits for one version group."""
+    version = (1, 10, 27)[group - 1]
+    heads = [(4 + consts.CHAR_COUNT_INDICATOR_LENGTH[consts.MODE_MAPPING[mode]][version_range(version)]) * 6
+             for mode in MODES]
+    costs = [_UNREACHABLE] * 3
+    back = []
+    for position, char in enumerate(payload):
+        char_costs = _char_bits(char)
+        if position == 0:
+            best_mode, switch_cost = None, 0
+        else:
+            #Switching rounds the finished segment up to whole bits
+            best_mode = min(range(3), key=costs.__getitem__)
+            switch_cost = -(-costs[best_mode] // 6) * 6
+        new_costs = [_UNREACHABLE] * 3
+        choice = [None, None, None]
+        for mode in range(3):
+            if char_costs[mode] is None:
+                continue
+            stay = costs[mode] + char_costs[mode]
+            switch = switch_cost + heads[mode] + char_costs[mode]
+            if stay <= switch:
+                new_costs[mode], choice[mode] = stay, mode
+            else:
+                new_costs[mode], choice[mode] = switch, best_mode
+        costs = new_costs
+        back.append(choice)
+    if not payload:
+        return [("", BYTE)], heads[2] // 6
+
+    #Walk back from the cheapest final mode
+    mode = min(range(3), key=costs.__getitem__)
+    bits = int(-(-costs[mode] // 6))
+    modes = []
+    for choice in reversed(back):
+        modes.append(mode)
+        mode = choice[mode]
+    modes.reverse()
+
+    segments = []
+    start = 0
+    for position in range(1, len(payload) + 1):
+        if position == len(payload) or modes[position] != modes[start]:
+            segments.append((payload[start:position], MODES[modes[start]]))
+            start = position
+    return segments, bits
+
+
+def _smallest_version(bits, error, group):
+    """Smallest version of a version group whose data capacity holds bits, or None."""
+    error_level = consts.ERROR_MAPPING[error.upper()]
+    first, last = ((1, 9), (10, 26), (27, 40))[group - 1]
+    for version in range(first, last + 1):
+        if consts.SYMBOL_CAPACITY[version][error_level] >= bits:
+            return version
+    return None
+
+
+def optimal_segments(payload, error="L", normalize=False):
+    """Return (segments, version) for the smallest symbol, segments as [(text, mode name)]."""
+    if normalize:
+        payload = normalize_payload(payload)
+    best = None
+    for group in (1, 2, 3):
+        segments, bits = _segment(payload, group)
+        version = _smallest_version(bits, error, group)
+        if version is not None and (best is None or version < best[1]):
+            best = (segments, version)
+    if best is None:
+        raise ValueError("Payload does not fit into any QR code version.")
+    return best
+
+
+def segno_content(segments):
+    """Convert [(text, mode name)] into the content list segno.make accepts."""
+    return [(text, consts.MODE_MAPPING[mode]) for text, mode in segments]
+
+
+def plain_version(payload, error=None):
+    """Version segno picks for the payload as one segment, without building the symbol."""
+    error_level = consts.ERROR_MAPPING[(error or "L").upper()]
+    return find_version(prepare_data(payload, None, None), error_level, eci=False, micro=False)
+
+
+def make(payload, error=None, version=None, boost_error=True, normalize=False):
+    """segno.make with the optimal mixed mode segmentation when it gives a smaller symbol."""
+    try:
+        segments, optimized_version = optimal_segments(payload, error or "L", normalize)
+    except ValueError:
+        segments = None
+    if segments is not None and (version is None or version >= optimized_version):
+        try:
+            plain = plain_version(payload, error)
+        except segno.DataOverflowError:
+            plain = 41
+        if optimized_version < plain and (version is None or version < plain):
+            return segno.make(segno_content(segments), error=error, version=version, micro=False,
+                              boost_error=boost_error)
+    return segno.make(payload, error=error, version=version, micro=False, boost_error=boost_error)
+
+
+def batch_report(payloads, error=None, normalize=True, scale=8, border=1):
+    """Compare plain and optimized encoding over a batch: versions, modules and render time.
+
+    Encode + render time is measured for the plain and the optimized symbol,
+    the segmentation search is timed on its own.
+    """
+    report = {"count": 0, "smaller": 0, "modules_before": 0, "modules_after": 0,
+              "seconds_before": 0.0, "seconds_after": 0.0, "seconds_search": 0.0,
+              "versions_before": collections.Counter(), "versions_after": collections.Counter()}
+    for payload in payloads:
+        start_time = time.perf_counter()
+        plain = segno.make(payload, error=error, micro=False)
+        plain.png_data_uri(scale=scale, border=border)
+        searched = time.perf_counter()
+        segments, version = optimal_segments(payload, error or "L", normalize)
+        content = segno_content(segments) if version < plain.version else payload
+        rendered = time.perf_counter()
+        optimized = segno.make(content, error=error, micro=False)
+        optimized.png_data_uri(scale=scale, border=border)
+        report["seconds_before"] += searched - start_time
+        report["seconds_search"] += rendered - searched
+        report["seconds_after"] += time.perf_counter() - rendered
+
+        report["count"] += 1
+        report["smaller"] += optimized.version < plain.version
+        report["versions_before"][plain.version] += 1
+        report["versions_after"][optimized.version] += 1
+        report["modules_before"] += plain.symbol_size(border=0)[0] ** 2
+        report["modules_after"] += optimized.symbol_size(border=0)[0] ** 2
+    return report
+
+
+def print_report(report, label="Batch"):
+    """Print a batch_report the way the generator windows print their metrics."""
+    count = max(1, report["count"])
+    saved = report["modules_before"] - report["modules_after"]
+    print(f"{label}: {report['smaller']} of {report['count']} codes got a smaller version.")
+    print(f"Versions before: {dict(sorted(report['versions_before'].items()))}, "
+          f"after: {dict(sorted(report['versions_after'].items()))}.")
+    print(f"Modules: {report['modules_before']} -> {report['modules_after']} "
+          f"({saved / max(1, report['modules_before']):.1%} fewer).")
+    print(f"Encode + render time per code: {report['seconds_before'] / count * 1000:.2f} ms -> "
+          f"{report['seconds_after'] / count * 1000:.2f} ms "
+          f"({1 - report['seconds_after'] / max(report['seconds_before'], 1e-9):.1%} less), "
+          f"segmentation search {report['seconds_search'] / count * 1000:.2f} ms.")
+
+
+if __name__ == "__main__":
+    import hashlib
+
+    urls = [f"https://www.example.com/item/{i}" for i in range(0, 100000, 100)]
+    digests = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(1000)]
+    print_report(batch_report(urls, error="M"), "URLs")
+    print_report(batch_report(digests, error="M"), "SHA-256 digests")
@@ -0,0 +1,199 @@
+import re
+import string
+import collections.abc
+
+#Payloads described by a template and a serial range, e.g. https://host/item/{n} for n in
+#1..5,000,000. Every payload is computed from its index, so nothing is ever materialized.
+
+
+class SerialRange(collections.abc.Sequence):
+    """Lazy sequence of template.format(n=...) for n = start, start + step, ... < stop.
+
+    repeat shows every n that many times in a row (the demo windows repeat a
+    few URLs), so index i holds n = start + (i // repeat) * step. Indexing,
+    slicing, len() and sharding are all arithmetic, memory is O(1) in the
+    range size (a slice of a repeated range is a SerialSlice view).
+    """
+
+    def __init__(self, template, start, stop, step=1, repeat=1):
+        if step == 0 or repeat < 1:
+            raise ValueError("step must be non-zero and repeat at least 1.")
+        self.template = template
+        self.numbers = range(start, stop, step)
+        self.repeat = repeat
+
+    def __repr__(self):
+        numbers = self.numbers
+        return (f"SerialRange({self.template!r}, {numbers.start}, {numbers.stop}, {numbers.step}"
+                f"{f', repeat={self.repeat}' if self.repeat != 1 else ''})")
+
+    def __len__(self):
+        return len(self.numbers) * self.repeat
+
+    def n(self, index):
+        """Serial number shown at index."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SerialRange index out of range.")
+        return self.numbers[index // self.repeat]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if self.repeat == 1:
+                return SerialRange(self.template, 0, 0).with_numbers(self.numbers[start:stop:step])
+            return SerialSlice(self, range(start, stop, step))
+        return self.template.format(n=self.n(index))
+
+    def with_numbers(self, numbers, repeat=1):
+        """Return a SerialRange over another range of numbers with the same template."""
+        result = SerialRange(self.template, 0, 0, repeat=repeat)
+        result.numbers = numbers
+        return result
+
+    def __iter__(self):
+        template = self.template
+        repeat = self.repeat
+        for n in self.numbers:
+            payload = template.format(n=n)
+            for _ in range(repeat):
+                yield payload
+
+    def index_of(self, n):
+        """First index showing serial number n."""
+        return self.numbers.index(n) * self.repeat
+
+    def locate(self, payload):
+        """Return the range of indices showing payload, parsed back through the template (empty if none).
+
+        The template may format n with a spec ({n:06d}, {n:x}, ...); templates
+        locate cannot parse back raise ValueError.
+        """
+        head, spec, tail = _split_template(self.template)
+        if spec is None:
+            #No {n} at all, every index shows the same payload
+            return range(len(self)) if payload == head else range(0)
+        if not payload.startswith(head) or not payload.endswith(tail) or len(payload) < len(head) + len(tail):
+            return range(0)
+        digits = payload[len(head):len(payload) - len(tail)]
+        base = _SPEC_BASES.get(spec[-1:] if spec[-1:].isalpha() else "")
+        fill = re.match(r"(.)[<>=^]", spec)
+        if base is None or (fill and fill.group(1) not in " 0"):
+            raise ValueError(f"Cannot locate payloads of template {self.template!r}, unsupported format spec {spec!r}.")
+        try:
+            #int() takes the padding, sign, 0x prefix and _ separators a spec can add
+            n = int(digits.strip().replace(",", ""), base)
+        except ValueError:
+            return range(0)
+        #Padding, sign and case are checked by formatting the number again
+        if format(n, spec) != digits or n not in self.numbers:
+            return range(0)
+        first = self.index_of(n)
+        return range(first, first + self.repeat)
+
+    def shard(self, shard, shards):
+        """Return the contiguous block of this range that worker shard (of shards) handles."""
+        if not 0 <= shard < shards:
+            raise ValueError(f"shard must be in 0..{shards - 1}.")
+        size, extra = divmod(len(self.numbers), shards)
+        start = shard * size + min(shard, extra)
+        stop = start + size + (1 if shard < extra else 0)
+        return self.with_numbers(self.numbers[start:stop], self.repeat)
+
+    def shards(self, shards):
+        """Split into shards contiguous blocks of (nearly) equal size."""
+        return [self.shard(shard, shards) for shard in range(shards)]
+
+    def n_at(self, row, col, columns):
+        """Serial number shown in a grid cell."""
+        return self.n(row * columns + col)
+
+
+class SerialSlice(collections.abc.Sequence):
+    """Lazy view of the indices of a SerialRange picked by a slice (repeated ranges do not slice into one)."""
+
+    def __init__(self, serial, indices):
+        self.serial = serial
+        self.indices = indices
+
+    def __repr__(self):
+        return f"{self.serial!r}[{self.indices.start}:{self.indices.stop}:{self.indices.step}]"
+
+    @property
+    def template(self):
+        return self.serial.template
+
+    def __len__(self):
+        return len(self.indices)
+
+    def n(self, index):
+        """Serial number shown at index."""
+        return self.serial.n(self.indices[index])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SerialSlice(self.serial, self.indices[index])
+        return self.serial[self.indices[index]]
+
+    def __iter__(self):
+        serial = self.serial
+        for index in self.indices:
+            yield serial[index]
+
+
+#Number base of the integer presentation types a template may format n with
+_SPEC_BASES = {"": 10, "d": 10, "n": 10, "x": 16, "X": 16, "o": 8, "b": 2}
+
+
+def _split_template(template):
+    """Split a template around its single {n} field: (text before, format spec, text after).
+
+    A template without any field gives (template, None, ""); anything else
+    than one plain {n} field raises ValueError.
+    """
+    parts = list(string.Formatter().parse(template))
+    fields = [(field, spec, conversion) for _, field, spec, conversion in parts if field is not None]
+    if not fields:
+        return "".join(literal for literal, *_ in parts), None, ""
+    if len(fields) != 1 or fields[0][0] != "n" or fields[0][2]:
+        raise ValueError(f"Template {template!r} needs exactly one {{n}} field without a conversion.")
+    head = []
+    tail = []
+    text = head
+    for literal, field, _, _ in parts:
+        #Each field follows the literal text it is parsed with
+        text.append(literal)
+        if field is not None:
+            text = tail
+    return "".join(head), fields[0][1], "".join(tail)
+
+
+def _encode_shard(shard):
+    """Worker task: encode one shard, only the template and range numbers are pickled."""
+    import qrcore
+    return sum(qrcore.qr_matrix(payload).size for payload in shard)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import tracemalloc
+    import concurrent.futures
+
+    tracemalloc.start()
+    payloads = SerialRange("https://host/item/{n}", 1, 5000001)
+    print(f"{len(payloads)} payloads, payload 4,999,999: {payloads[4999998]}, "
+          f"row 1000 col 2 of 3 columns: n = {payloads.n_at(1000, 2, 3)}.")
+    print(f"Locate https://host/item/4242: {payloads.locate('https://host/item/4242')}.")
+
+    #Encode a slice of the range sharded over processes
+    sample = payloads[:2000]
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    start_time = time.time()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        modules = sum(executor.map(_encode_shard, sample.shards(workers * 4)))
+    print(f"Encoded {len(sample)} codes ({modules} modules) on {workers} processes in "
+          f"{time.time() - start_time:.2f} seconds.")
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"Peak traced memory in this process: {peak / 1024:.0f} KB.")
@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import itertools
+import subprocess
+import qrcore
+import code_png
+import label_printer
+from serial_range import SerialRange
+from payload_stream import read_payloads
+
+#Sharded batch generation for runs too big for one machine.
+#
+#A job file names the payload source, the encode parameters, the output format and the
+#shard count. The job splits into contiguous index ranges by arithmetic alone, so any
+#machine holding the job file runs any shard on its own and writes its outputs plus a
+#checksum manifest. The merge step checks that the manifests belong to the job (payload
+#file contents included), tile the whole index range, encoded the job's payloads and match
+#the files on disk, then writes one job manifest.
+#
+#    {"name": "nightly", "shards": 8,
+#     "source": {"template": "https://www.example.com/item/{n}", "start": 1, "stop": 1000001},
+#     "params": {"error": "M"}, "output": {"format": "zpl", "scale": 4, "border": 2}}
+#
+#    python shard_job.py run job.json --shard 3 --out runs/nightly     (on any machine)
+#    python shard_job.py merge job.json --out runs/nightly --concat    (after copying the shards together)
+#    python shard_job.py local job.json --out runs/nightly --processes 4
+
+MANIFEST_VERSION = 1
+STREAM_FORMATS = (label_printer.ZPL, label_printer.PCL)
+CHUNK_SIZE = 1024 * 1024
+
+
+def load_job(path):
+    """Read a job file and fill in the defaults."""
+    with open(path, "r") as f:
+        job = json.load(f)
+    job.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    job.setdefault("shards", 1)
+    job.setdefault("params", {})
+    job.setdefault("output", {})
+    job["output"].setdefault("format", "png")
+    job["output"].setdefault("scale", 8 if job["output"]["format"] == "png" else 4)
+    job["output"].setdefault("border", 1 if job["output"]["format"] == "png" else 2)
+    if job["output"]["format"] not in ("png",) + STREAM_FORMATS:
+        raise ValueError(f"Unknown output format: {job['output']['format']}.")
+    return job
+
+
+def job_hash(job):
+    """Digest of everything that decides the outputs, shards of different jobs never merge.
+
+    A file source is hashed by content (size and sha256), not by path, so shards
+    made from different versions of the payload file do not merge either.
+    """
+    description = {key: job[key] for key in ("source", "params", "output", "shards")}
+    if "file" in job["source"]:
+        path = job["source"]["file"]
+        description["source_content"] = [os.path.getsize(path), file_digest(path)]
+    return hashlib.blake2b(json.dumps(description, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def job_payloads(job):
+    """Sequence (template source) or re-readable callable (file source) of the job's payloads."""
+    source = job["source"]
+    if "template" in source:
+        return SerialRange(source["template"], source["start"], source["stop"], source.get("step", 1),
+                           source.get("repeat", 1))
+    return lambda: read_payloads(source["file"])
+
+
+def payload_count(job):
+    payloads = job_payloads(job)
+    if callable(payloads):
+        return sum(1 for _ in payloads())
+    return len(payloads)
+
+
+def shard_range(count, shard, shards):
+    """Contiguous index range of one shard, sizes differ by at most one."""
+    if not 0 <= shard < shards:
+        raise ValueError(f"shard must be in 0..{shards - 1}.")
+    size, extra = divmod(count, shards)
+    start = shard * size + min(shard, extra)
+    return range(start, start + size + (1 if shard < extra else 0))
+
+
+def shard_payloads(job, indices):
+    """Payloads of an index range, a file source is read up to the end of the range only."""
+    payloads = job_payloads(job)
+    if callable(payloads):
+        return itertools.islice(payloads(), indices.start, indices.stop)
+    return (payloads[index] for index in indices)
+
+
+def _label_line(index, payload):
+    return f"{index}\t{payload}\n".encode("utf-8")
+
+
+def label_digests(job, count):
+    """sha256 of every shard's (index, payload) lines, from one pass over the job's payloads."""
+    payloads = job_payloads(job)
+    payloads = payloads() if callable(payloads) else iter(payloads)
+    digests = []
+    for shard in range(job["shards"]):
+        labels = hashlib.sha256()
+        for index, payload in zip(shard_range(count, shard, job["shards"]), payloads):
+            labels.update(_label_line(index, payload))
+        digests.append(labels.hexdigest())
+    return digests
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shard_name(shard):
+    return f"shard-{shard:05d}"
+
+
+def run_shard(job, shard, out_dir, count=None, verbose=True):
+    """Generate one shard into out_dir and write its manifest last, returns the manifest."""
+    start_time = time.time()
+    count = payload_count(job) if count is None else count
+    indices = shard_range(count, shard, job["shards"])
+    output = job["output"]
+    fmt = output["format"]
+    name = shard_name(shard)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, name + ".manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)  #A rerun is incomplete until its new manifest is written
+
+    files = []
+    labels = hashlib.sha256()  #Digest of every (index, payload) in order
+    if fmt in STREAM_FORMATS:
+        file_name = f"{name}.{fmt}"
+        with label_printer.LabelPrinterWriter(os.path.join(out_dir, file_name), fmt, scale=output["scale"],
+                                              quiet_zone=output["border"]) as writer:
+            for index, payload in zip(indices, shard_payloads(job, indices)):
+                writer.add_code(payload, **job["params"])
+                labels.update(_label_line(index, payload))
+        files.append(file_name)
+    else:
+        directory = os.path.join(out_dir, name)
+        os.makedirs(directory, exist_ok=True)
+        for index, payload in zip(indices, shard_payloads(job, indices)):
+            file_name = os.path.join(name, f"code_{index:09d}.png")
+            matrix = qrcore.make_matrix(payload, **job["params"])
+            code_png.write_png(os.path.join(out_dir, file_name), matrix, output["scale"], output["border"])
+            labels.update(_label_line(index, payload))
+            files.append(file_name)
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "job": job["name"],
+        "job_hash": job_hash(job),
+        "shard": shard,
+        "shards": job["shards"],
+        "start": indices.start,
+        "stop": indices.stop,
+        "labels_sha256": labels.hexdigest(),
+        "files": [[file_name, os.path.getsize(os.path.join(out_dir, file_name)),
+                   file_digest(os.path.join(out_dir, file_name))] for file_name in files],
+        "host": os.uname().nodename if hasattr(os, "uname") else "",
+        "seconds": time.time() - start_time,
+    }
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+    if verbose:
+        print(f"Shard {shard}/{job['shards']}: indices {indices.start}..{indices.stop - 1}, "
+              f"{len(files)} file(s) in {manifest['seconds']:.2f} seconds.")
+    return manifest
+
+
+def merge(job, out_dir, concat=False, check_files=True):
+    """Validate the shard manifests and write the job manifest, raises ValueError listing every problem."""
+    count = payload_count(job)
+    expected_hash = job_hash(job)
+    #What every shard must have encoded, recomputed from the source this machine holds
+    expected_labels = label_digests(job, count)
+    problems = []
+    manifests = []
+    for shard in range(job["shards"]):
+        path = os.path.join(out_dir, shard_name(shard) + ".manifest.json")
+        try:
+            with open(path, "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            problems.append(f"Shard {shard}: no readable manifest ({e}).")
+            continue
+        indices = shard_range(count, shard, job["shards"])
+        if manifest.get("job_hash") != expected_hash:
+            problems.append(f"Shard {shard}: manifest belongs to a different job or parameters.")
+        if (manifest.get("shard"), manifest.get("start"), manifest.get("stop")) != (shard, indices.start,
+                                                                                     indices.stop):
+            problems.append(f"Shard {shard}: covers {manifest.get('start')}..{manifest.get('stop')}, "
+                            f"expected {indices.start}..{indices.stop}.")
+        if manifest.get("labels_sha256") != expected_labels[shard]:
+            problems.append(f"Shard {shard}: its labels do not match the job's payloads.")
+        if check_files:
+            for file_name, size, digest in manifest.get("files", []):
+                path = os.path.join(out_dir, file_name)
+                if not os.path.exists(path):
+                    problems.append(f"Shard {shard}: missing {file_name}.")
+                elif os.path.getsize(path) != size or file_digest(path) != digest:
+                    problems.append(f"Shard {shard}: {file_name} does not match its checksum.")
+        manifests.append(manifest)
+    if problems:
+        raise ValueError("Merge failed:\n" + "\n".join(problems))
+
+    result = {
+        "version": MANIFEST_VERSION,
+        "job": job["name"],
+        "job_hash": expected_hash,
+        "count": count,
+        "shards": [{key: manifest[key] for key in ("shard", "start", "stop", "labels_sha256", "host", "seconds")}
+                   for manifest in manifests],
+        "files": [entry for manifest in manifests for entry in manifest["files"]],
+        "merged": time.time(),
+    }
+    fmt = job["output"]["format"]
+    if concat and fmt in STREAM_FORMATS:
+        #ZPL labels and PCL pages are self contained, the shard streams join end to end
+        combined = os.path.join(out_dir, f"{job['name']}.{fmt}")
+        digest = hashlib.sha256()
+        with open(combined + ".tmp", "wb") as out:
+            for manifest in manifests:
+                for file_name, _, _ in manifest["files"]:
+                    with open(os.path.join(out_dir, file_name), "rb") as f:
+                        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                            out.write(block)
+                            digest.update(block)
+        os.replace(combined + ".tmp", combined)
+        result["combined"] = [os.path.basename(combined), os.path.getsize(combined), digest.hexdigest()]
+    with open(os.path.join(out_dir, f"{job['name']}.manifest.json"), "w") as f:
+        json.dump(result, f, indent=1)
+    return result
+
+
+def run_local(job_path, out_dir, processes=2, concat=False):
+    """Run every shard as a separate process on this machine, then merge."""
+    job = load_job(job_path)
+    start_time = time.time()
+    count = str(payload_count(job))
+    pending = list(range(job["shards"]))
+    running = []
+    failed = []
+    while pending or running:
+        while pending and len(running) < processes:
+            shard = pending.pop(0)
+            command = [sys.executable, os.path.abspath(__file__), "run", job_path, "--shard", str(shard),
+                       "--out", out_dir, "--count", count]
+            running.append((shard, subprocess.Popen(command)))
+        shard, process = running.pop(0)
+        if process.wait() != 0:
+            failed.append(shard)
+    if failed:
+        print(f"Shards failed: {failed}.")
+        return None
+    result = merge(job, out_dir, concat)
+    print(f"{job['name']}: {result['count']} codes in {job['shards']} shards on {processes} processes, "
+          f"merged in {time.time() - start_time:.2f} seconds.")
+    return result
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Sharded batch generation with checksum manifests.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan = commands.add_parser("plan", help="Show the index range of every shard.")
+    plan.add_argument("job")
+    run = commands.add_parser("run", help="Generate one shard.")
+    run.add_argument("job")
+    run.add_argument("--shard", type=int, required=True)
+    run.add_argument("--out", required=True)
+    run.add_argument("--count", type=int, help="Payload count, saves re-reading a file source.")
+    merge_parser = commands.add_parser("merge", help="Validate the shards and write the job manifest.")
+    merge_parser.add_argument("job")
+    merge_parser.add_argument("--out", required=True)
+    merge_parser.add_argument("--concat", action="store_true", help="Join ZPL/PCL shard streams into one file.")
+    local = commands.add_parser("local", help="Run all shards as local processes, then merge.")
+    local.add_argument("job")
+    local.add_argument("--out", required=True)
+    local.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    local.add_argument("--concat", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.command == "local":
+        return 0 if run_local(args.job, args.out, args.processes, args.concat) else 1
+    job = load_job(args.job)
+    if args.command == "plan":
+        count = payload_count(job)
+        print(f"{job['name']}: {count} payloads in {job['shards']} shards, job hash {job_hash(job)}.")
+        for shard in range(job["shards"]):
+            indices = shard_range(count, shard, job["shards"])
+            print(f"  {shard_name(shard)}: {indices.start}..{indices.stop - 1} ({len(indices)} codes)")
+    elif args.command == "run":
+        run_shard(job, args.shard, args.out, args.count)
+    else:
+        try:
+            result = merge(job, args.out, args.concat)
+        except ValueError as e:
+            print(e)
+            return 1
+        print(f"Merged {len(result['shards'])} shards, {result['count']} codes, {len(result['files'])} files.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import os
+import json
+import mmap
+import time
+import struct
+import hashlib
+import numpy as np
+import segno
+import qrcore
+
+#One file per generated batch: header, fixed size entry table, payload bytes, packed matrices.
+#
+#  magic (8) | header length (4) | JSON header | entry table | payloads | matrices
+#
+#Matrices are stored bit packed (np.packbits of the flattened grid), read back
+#through an mmap so opening a snapshot costs nothing until a code is needed.
+
+MAGIC = b"QRSNAP1\0"
+FORMAT_VERSION = 1
+SUFFIX = ".qrsnap"
+
+ENTRY = np.dtype([
+    ("key", "V16"),
+    ("payload_offset", "<u8"),
+    ("payload_length", "<u4"),
+    ("matrix_offset", "<u8"),
+    ("height", "<u2"),
+    ("width", "<u2"),
+])
+
+
+def param_hash(params):
+    """Digest of the generation parameters plus everything else that changes the matrices."""
+    description = {"params": params, "segno": segno.__version__, "format": FORMAT_VERSION}
+    return hashlib.blake2b(json.dumps(description, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def save_snapshot(path, payloads, matrices, params):
+    """Write payloads and their matrices to path, replacing any existing snapshot atomically."""
+    entries = np.zeros(len(payloads), dtype=ENTRY)
+    payload_blob = bytearray()
+    matrix_blob = bytearray()
+    for position, (payload, matrix) in enumerate(zip(payloads, matrices)):
+        data = payload.encode("utf-8")
+        entry = entries[position]
+        entry["key"] = qrcore.code_key(payload, **params)
+        entry["payload_offset"] = len(payload_blob)
+        entry["payload_length"] = len(data)
+        entry["matrix_offset"] = len(matrix_blob)
+        entry["height"], entry["width"] = matrix.shape
+        payload_blob += data
+        matrix_blob += np.packbits(matrix.astype(bool)).tobytes()
+
+    header = json.dumps({
+        "params": params,
+        "param_hash": param_hash(params),
+        "count": len(payloads),
+        "payload_bytes": len(payload_blob),
+        "created": time.time(),
+    }).encode("utf-8")
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(entries.tobytes())
+        f.write(payload_blob)
+        f.write(matrix_blob)
+    os.replace(temp_path, path)
+
+
+class Snapshot:
+    """Read-only view of a snapshot file through mmap."""
+
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if self.map[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a snapshot file.")
+            (header_length,) = struct.unpack_from("<I", self.map, len(MAGIC))
+            start = len(MAGIC) + 4
+            self.header = json.loads(self.map[start:start + header_length].decode("utf-8"))
+            self.count = self.header["count"]
+            table_start = start + header_length
+            self.entries = np.frombuffer(self.map, dtype=ENTRY, count=self.count, offset=table_start)
+            self.payload_start = table_start + self.entries.nbytes
+            self.matrix_start = self.payload_start + self.header["payload_bytes"]
+        except Exception:
+            self.close()
+            raise
+        #Built up front so worker threads can look codes up concurrently
+        self.positions = {bytes(key): position for position, key in enumerate(self.entries["key"])}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def params(self):
+        return self.header["params"]
+
+    def is_current(self, params):
+        """True when the snapshot was generated with these parameters by this segno version."""
+        return self.header["param_hash"] == param_hash(params)
+
+    def payload(self, position):
+        entry = self.entries[position]
+        start = self.payload_start + int(entry["payload_offset"])
+        return self.map[start:start + int(entry["payload_length"])].decode("utf-8")
+
+    def matrix(self, position):
+        """Unpack one matrix straight from the mapped file."""
+        entry = self.entries[position]
+        height, width = int(entry["height"]), int(entry["width"])
+        packed = np.frombuffer(self.map, dtype=np.uint8, count=(height * width + 7) // 8,
+                               offset=self.matrix_start + int(entry["matrix_offset"]))
+        return np.unpackbits(packed, count=height * width).reshape(height, width)
+
+    def find(self, key):
+        """Return the position of the code with this code_key, or None."""
+        return self.positions.get(key)
+
+    def close(self):
+        if self.map is not None:
+            self.entries = None
+            self.map.close()
+            self.map = None
+
+
+def open_snapshot(path, params):
+    """Open the snapshot at path if it exists and matches params, else return None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        snapshot = Snapshot(path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable snapshot {path}: {e}.")
+        return None
+    if not snapshot.is_current(params):
+        print(f"Snapshot {path} is stale (parameters or segno version changed), rebuilding.")
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def load_or_build(path, payloads, params, make_matrix=None):
+    """Return matrices for payloads, reusing the snapshot and encoding only what is missing.
+
+    The snapshot is rewritten when anything had to be encoded. Returns the
+    matrices and the number of codes that were encoded.
+    """
+    make_matrix = make_matrix or (lambda payload: qrcore.make_matrix(payload, **params))
+    snapshot = open_snapshot(path, params)
+    matrices = []
+    encoded = 0
+    for payload in payloads:
+        position = snapshot.find(qrcore.code_key(payload, **params)) if snapshot is not None else None
+        if position is None:
+            matrices.append(make_matrix(payload))
+            encoded += 1
+        else:
+            matrices.append(snapshot.matrix(position))
+    if snapshot is not None:
+        snapshot.close()
+    if encoded or snapshot is None:
+        save_snapshot(path, payloads, matrices, params)
+    return matrices, encoded
+
+
+if __name__ == "__main__":
+    import sys
+
+    path = sys.argv[1] if len(sys.argv) > 1 else "batch" + SUFFIX
+    params = {"micro": False}
+    payloads = [f"https://www.example.com/{i}" for i in range(9000)]
+    for label, batch in (("First run", payloads), ("Reopen", payloads),
+                         ("100 payloads changed", payloads[:-100] + [p + "?v=2" for p in payloads[-100:]])):
+        start_time = time.time()
+        matrices, encoded = load_or_build(path, batch, params)
+        print(f"{label}: {len(matrices)} codes, {encoded} encoded, {time.time() - start_time:.2f} seconds.")
+    print(f"Snapshot size: {os.path.getsize(path) / 1024:.0f} KB.")
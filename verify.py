@@ -0,0 +1,590 @@
+import time
+import functools
+import threading
+import concurrent.futures
+import numpy as np
+from segno import consts
+from segno import encoder as segno_encoder
+import qrcore
+
+#Decode-back verification straight from the module grid, no image recognition involved.
+#Matrices are numpy arrays with 1 = dark and no quiet zone, as produced by qrcore.
+
+
+class VerificationError(ValueError):
+    """Raised when a module grid cannot be decoded."""
+
+
+#Reed-Solomon over GF(256), QR uses 0x11d with roots from a^0, Data Matrix 0x12d with roots from a^1
+@functools.lru_cache(maxsize=None)
+def _gf_tables(prim):
+    exp = [0] * 512
+    log = [0] * 256
+    value = 1
+    for i in range(255):
+        exp[i] = value
+        log[value] = i
+        value <<= 1
+        if value & 0x100:
+            value ^= prim
+    for i in range(255, 512):
+        exp[i] = exp[i - 255]
+    return exp, log
+
+
+@functools.lru_cache(maxsize=None)
+def _rs_generator(count, prim, first_root):
+    exp, log = _gf_tables(prim)
+    gen = [1]
+    for i in range(count):
+        root = exp[i + first_root]
+        nxt = [0] * (len(gen) + 1)
+        for j, coef in enumerate(gen):
+            nxt[j] ^= coef
+            if coef:
+                nxt[j + 1] ^= exp[log[coef] + log[root]]
+        gen = nxt
+    return gen
+
+
+def rs_remainder(data, count, prim, first_root):
+    """Return the Reed-Solomon error correction codewords for the data."""
+    exp, log = _gf_tables(prim)
+    gen = _rs_generator(count, prim, first_root)
+    block = list(data) + [0] * count
+    for k in range(len(data)):
+        coef = block[k]
+        if coef:
+            lcoef = log[coef]
+            for n in range(1, count + 1):
+                if gen[n]:
+                    block[k + n] ^= exp[lcoef + log[gen[n]]]
+    return block[len(data):]
+
+
+#QR Code
+
+_QR_MASKS = (
+    lambda i, j: (i + j) % 2 == 0,
+    lambda i, j: i % 2 == 0,
+    lambda i, j: j % 3 == 0,
+    lambda i, j: (i + j) % 3 == 0,
+    lambda i, j: (i // 2 + j // 3) % 2 == 0,
+    lambda i, j: (i * j) % 2 + (i * j) % 3 == 0,
+    lambda i, j: ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+    lambda i, j: ((i + j) % 2 + (i * j) % 3) % 2 == 0,
+)
+
+#Format bits 14..0 read around the upper left finder pattern
+_FORMAT_CELLS = ([(8, col) for col in (0, 1, 2, 3, 4, 5, 7, 8)] +
+                 [(row, 8) for row in (7, 5, 4, 3, 2, 1, 0)])
+
+
+@functools.lru_cache(maxsize=None)
+def _qr_layout(version):
+    """Return the data module coordinates in placement order and the mask patterns for a version."""
+    size = version * 4 + 17
+    matrix = segno_encoder.make_matrix(size, size)
+    segno_encoder.add_finder_patterns(matrix, size, size)
+    segno_encoder.add_alignment_patterns(matrix, size, size)
+    is_data = np.array(matrix, dtype=np.uint8) == 0x2
+    rows, cols = [], []
+    for right in range(size - 1, 0, -2):
+        if right <= 6:
+            right -= 1
+        upwards = (right & 2) == 0
+        for vertical in range(size):
+            for z in (0, 1):
+                j = right - z
+                i = (size - 1 - vertical) if (upwards ^ (j < 6)) else vertical
+                if is_data[i, j]:
+                    rows.append(i)
+                    cols.append(j)
+    rows = np.array(rows, dtype=np.intp)
+    cols = np.array(cols, dtype=np.intp)
+    masks = tuple(np.array([fn(i, j) for i, j in zip(rows, cols)], dtype=np.uint8) for fn in _QR_MASKS)
+    return rows, cols, masks
+
+
+def _read_format(matrix):
+    """Return (error level constant, mask) from the format information."""
+    bits = 0
+    for row, col in _FORMAT_CELLS:
+        bits = (bits << 1) | int(matrix[row, col])
+    #Nearest valid sequence tolerates a few damaged format modules
+    best = min(range(32), key=lambda idx: bin(consts.FORMAT_INFO[idx] ^ bits).count("1"))
+    if bin(consts.FORMAT_INFO[best] ^ bits).count("1") > 3:
+        raise VerificationError("Unreadable format information.")
+    return best >> 3, best & 0x7
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+
+    def remaining(self):
+        return len(self.data) * 8 - self.position
+
+    def read(self, count):
+        value = 0
+        for _ in range(count):
+            byte = self.data[self.position >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.position & 7))) & 1)
+            self.position += 1
+        return value
+
+
+def _parse_qr_segments(data, version):
+    """Decode the QR bit stream into bytes, digits and alphanumerics as ASCII."""
+    reader = _BitReader(data)
+    ver_range = segno_encoder.version_range(version)
+    out = bytearray()
+    while reader.remaining() >= 4:
+        mode = reader.read(4)
+        if mode == 0:
+            break
+        if mode == consts.MODE_ECI:
+            first = reader.read(8)
+            if first & 0x80:
+                reader.read(8 if (first & 0xc0) == 0x80 else 16)
+            continue
+        if mode == consts.MODE_STRUCTURED_APPEND:
+            reader.read(16)
+            continue
+        if mode in (0x5, 0x9):  #FNC1 markers
+            if mode == 0x9:
+                reader.read(8)
+            continue
+        if mode not in consts.CHAR_COUNT_INDICATOR_LENGTH:
+            raise VerificationError(f"Unknown QR mode indicator {mode}.")
+        count = reader.read(consts.CHAR_COUNT_INDICATOR_LENGTH[mode][ver_range])
+        if mode == consts.MODE_NUMERIC:
+            while count >= 3:
+                out += b"%03d" % reader.read(10)
+                count -= 3
+            if count == 2:
+                out += b"%02d" % reader.read(7)
+            elif count == 1:
+                out += b"%d" % reader.read(4)
+        elif mode == consts.MODE_ALPHANUMERIC:
+            chars = consts.ALPHANUMERIC_CHARS
+            while count >= 2:
+                value = reader.read(11)
+                out.append(chars[value // 45])
+                out.append(chars[value % 45])
+                count -= 2
+            if count:
+                out.append(chars[reader.read(6)])
+        elif mode == consts.MODE_BYTE:
+            out += bytes(reader.read(8) for _ in range(count))
+        elif mode == consts.MODE_KANJI:
+            for _ in range(count):
+                value = reader.read(13)
+                value = (value // 0xc0) << 8 | (value % 0xc0)
+                value += 0x8140 if value < 0x1f00 else 0xc140
+                out += value.to_bytes(2, "big")
+        else:
+            raise VerificationError(f"Unsupported QR mode {mode}.")
+    return bytes(out)
+
+
+def decode_qr(matrix):
+    """Decode a QR module grid and return the payload bytes, checking every RS block."""
+    matrix = np.asarray(matrix, dtype=np.uint8)
+    size = matrix.shape[0]
+    version, rest = divmod(size - 17, 4)
+    if matrix.shape[0] != matrix.shape[1] or rest or not 1 <= version <= 40:
+        raise VerificationError(f"Not a QR Code module grid: {matrix.shape}.")
+    error, mask = _read_format(matrix)
+    rows, cols, masks = _qr_layout(version)
+    bits = matrix[rows, cols] ^ masks[mask]
+    codewords = np.packbits(bits[:len(bits) // 8 * 8]).tolist()
+
+    #Undo the block interleaving
+    blocks = [ec.num_data for ec in consts.ECC[version][error] for _ in range(ec.num_blocks)]
+    ec_count = consts.ECC[version][error][0].num_total - consts.ECC[version][error][0].num_data
+    data_blocks = [[] for _ in blocks]
+    position = 0
+    for i in range(max(blocks)):
+        for block, length in zip(data_blocks, blocks):
+            if i < length:
+                block.append(codewords[position])
+                position += 1
+    ec_blocks = [[] for _ in blocks]
+    for i in range(ec_count):
+        for block in ec_blocks:
+            block.append(codewords[position])
+            position += 1
+    for data, ecc in zip(data_blocks, ec_blocks):
+        if rs_remainder(data, ec_count, 0x11d, 0) != ecc:
+            raise VerificationError("QR error correction codewords do not match the data.")
+    return _parse_qr_segments([cw for block in data_blocks for cw in block], version)
+
+
+#Data Matrix ECC200
+
+#(rows, cols): (region rows, region cols, data codewords, error codewords, interleaved blocks)
+DM_SYMBOLS = {
+    (10, 10): (8, 8, 3, 5, 1), (12, 12): (10, 10, 5, 7, 1), (14, 14): (12, 12, 8, 10, 1),
+    (16, 16): (14, 14, 12, 12, 1), (18, 18): (16, 16, 18, 14, 1), (20, 20): (18, 18, 22, 18, 1),
+    (22, 22): (20, 20, 30, 20, 1), (24, 24): (22, 22, 36, 24, 1), (26, 26): (24, 24, 44, 28, 1),
+    (32, 32): (14, 14, 62, 36, 1), (36, 36): (16, 16, 86, 42, 1), (40, 40): (18, 18, 114, 48, 1),
+    (44, 44): (20, 20, 144, 56, 1), (48, 48): (22, 22, 174, 68, 1), (52, 52): (24, 24, 204, 84, 2),
+    (64, 64): (14, 14, 280, 112, 2), (72, 72): (16, 16, 368, 144, 4), (80, 80): (18, 18, 456, 192, 4),
+    (88, 88): (20, 20, 576, 224, 4), (96, 96): (22, 22, 696, 272, 4), (104, 104): (24, 24, 816, 336, 6),
+    (120, 120): (18, 18, 1050, 408, 6), (132, 132): (20, 20, 1304, 496, 8),
+    (144, 144): (22, 22, 1558, 620, 10),
+    (8, 18): (6, 16, 5, 7, 1), (8, 32): (6, 14, 10, 11, 1), (12, 26): (10, 24, 16, 14, 1),
+    (12, 36): (10, 16, 22, 18, 1), (16, 36): (14, 16, 32, 24, 1), (16, 48): (14, 22, 49, 28, 1),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def _dm_placement(nrow, ncol):
+    """Return (codeword, bit) for every module of the mapping matrix, ECC200 Annex F."""
+    grid = [[None] * ncol for _ in range(nrow)]
+
+    def module(row, col, chr_, bit):
+        if row < 0:
+            row += nrow
+            col += 4 - ((nrow + 4) % 8)
+        if col < 0:
+            col += ncol
+            row += 4 - ((ncol + 4) % 8)
+        grid[row][col] = (chr_, bit)
+
+    def utah(row, col, chr_):
+        module(row - 2, col - 2, chr_, 7)
+        module(row - 2, col - 1, chr_, 6)
+        module(row - 1, col - 2, chr_, 5)
+        module(row - 1, col - 1, chr_, 4)
+        module(row - 1, col, chr_, 3)
+        module(row, col - 2, chr_, 2)
+        module(row, col - 1, chr_, 1)
+        module(row, col, chr_, 0)
+
+    def corner(cells, chr_):
+        for bit, (row, col) in zip(range(7, -1, -1), cells):
+            module(row, col, chr_, bit)
+
+    chr_ = 0
+    row, col = 4, 0
+    while True:
+        if row == nrow and col == 0:
+            corner(((nrow - 1, 0), (nrow - 1, 1), (nrow - 1, 2), (0, ncol - 2),
+                    (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)), chr_)
+            chr_ += 1
+        if row == nrow - 2 and col == 0 and ncol % 4:
+            corner(((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 4),
+                    (0, ncol - 3), (0, ncol - 2), (0, ncol - 1), (1, ncol - 1)), chr_)
+            chr_ += 1
+        if row == nrow - 2 and col == 0 and ncol % 8 == 4:
+            corner(((nrow - 3, 0), (nrow - 2, 0), (nrow - 1, 0), (0, ncol - 2),
+                    (0, ncol - 1), (1, ncol - 1), (2, ncol - 1), (3, ncol - 1)), chr_)
+            chr_ += 1
+        if row == nrow + 4 and col == 2 and not ncol % 8:
+            corner(((nrow - 1, 0), (nrow - 1, ncol - 1), (0, ncol - 3), (0, ncol - 2),
+                    (0, ncol - 1), (1, ncol - 3), (1, ncol - 2), (1, ncol - 1)), chr_)
+            chr_ += 1
+        #Sweep upward diagonally
+        while True:
+            if row < nrow and col >= 0 and grid[row][col] is None:
+                utah(row, col, chr_)
+                chr_ += 1
+            row -= 2
+            col += 2
+            if not (row >= 0 and col < ncol):
+                break
+        row += 1
+        col += 3
+        #Sweep downward diagonally
+        while True:
+            if row >= 0 and col < ncol and grid[row][col] is None:
+                utah(row, col, chr_)
+                chr_ += 1
+            row += 2
+            col -= 2
+            if not (row < nrow and col >= 0):
+                break
+        row += 3
+        col += 1
+        if not (row < nrow or col < ncol):
+            break
+    return grid, chr_
+
+
+def _dm_mapping(matrix, region_rows, region_cols):
+    """Strip the finder and alignment patterns and return the mapping matrix."""
+    rows, cols = matrix.shape
+    vertical = rows // (region_rows + 2)
+    horizontal = cols // (region_cols + 2)
+    parts = []
+    for v in range(vertical):
+        top = v * (region_rows + 2) + 1
+        band = [matrix[top:top + region_rows, h * (region_cols + 2) + 1:h * (region_cols + 2) + 1 + region_cols]
+                for h in range(horizontal)]
+        parts.append(np.hstack(band))
+    return np.vstack(parts)
+
+
+def _dm_c40_char(value, shift, text, out, state):
+    """Append one C40/Text value, returning the new shift set."""
+    if shift == 0:
+        if value < 3:
+            return value + 1
+        if value == 3:
+            char = 32
+        elif value < 14:
+            char = value + 44
+        else:
+            char = value + (83 if text else 51)
+    elif shift == 1:
+        char = value
+    elif shift == 2:
+        if value < 15:
+            char = value + 33
+        elif value < 22:
+            char = value + 43
+        elif value < 27:
+            char = value + 69
+        elif value == 27:
+            char = 0x1d
+        elif value == 30:
+            state["upper"] = True
+            return 0
+        else:
+            raise VerificationError(f"Invalid C40 shift 2 value {value}.")
+    else:
+        if not text:
+            char = value + 96
+        elif value == 0:
+            char = 96
+        elif value < 27:
+            char = value + 64
+        else:
+            char = value + 96
+    if state["upper"]:
+        char += 128
+        state["upper"] = False
+    out.append(char)
+    return 0
+
+
+def _parse_dm(codewords):
+    """Decode ECC200 data codewords in ASCII, C40, Text, X12, EDIFACT and Base 256 encodation."""
+    out = bytearray()
+    state = {"upper": False}
+    count = len(codewords)
+    i = 0
+    while i < count:
+        cw = codewords[i]
+        i += 1
+        if cw == 129:  #Pad, end of message
+            break
+        if 1 <= cw <= 128:
+            out.append(cw - 1 + (128 if state["upper"] else 0))
+            state["upper"] = False
+        elif 130 <= cw <= 229:
+            out += b"%02d" % (cw - 130)
+        elif cw == 235:
+            state["upper"] = True
+        elif cw == 232:  #FNC1 reads as group separator
+            out.append(0x1d)
+        elif cw in (230, 238, 239):
+            #C40, X12 and Text pack three values into every codeword pair
+            shift = 0
+            while i + 1 < count and codewords[i] != 254:
+                value = codewords[i] * 256 + codewords[i + 1] - 1
+                i += 2
+                for part in (value // 1600, (value // 40) % 40, value % 40):
+                    if cw == 238:
+                        out.append(b"\r*> 0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"[part])
+                    else:
+                        shift = _dm_c40_char(part, shift, cw == 239, out, state)
+            if i < count and codewords[i] == 254:
+                i += 1
+        elif cw == 240:
+            #EDIFACT packs four 6-bit values into three codewords
+            done = False
+            while i < count and not done:
+                chunk = codewords[i:i + 3]
+                i += len(chunk)
+                bits = int.from_bytes(bytes(chunk), "big") << (8 * (3 - len(chunk)))
+                for shift in (18, 12, 6, 0):
+                    value = (bits >> shift) & 0x3f
+                    if value == 0x1f:
+                        done = True
+                        break
+                    out.append(value if value >= 32 else value + 64)
+        elif cw == 231:
+            def unrandom(position):
+                return (codewords[position] - ((149 * (position + 1)) % 255 + 1)) % 256
+            length = unrandom(i)
+            i += 1
+            if length >= 250:
+                length = (length - 249) * 250 + unrandom(i)
+                i += 1
+            elif length == 0:
+                length = count - i
+            out += bytes(unrandom(i + k) for k in range(length))
+            i += length
+        else:
+            raise VerificationError(f"Unsupported Data Matrix codeword {cw}.")
+    return bytes(out)
+
+
+def decode_dm(matrix):
+    """Decode a Data Matrix ECC200 module grid and return the payload bytes."""
+    matrix = np.asarray(matrix, dtype=np.uint8)
+    spec = DM_SYMBOLS.get(matrix.shape)
+    if spec is None:
+        raise VerificationError(f"Not a Data Matrix module grid: {matrix.shape}.")
+    region_rows, region_cols, data_count, ec_count, block_count = spec
+    mapping = _dm_mapping(matrix, region_rows, region_cols)
+    grid, total = _dm_placement(*mapping.shape)
+    codewords = [0] * total
+    for r, line in enumerate(grid):
+        for c, cell in enumerate(line):
+            if cell is not None and mapping[r, c]:
+                codewords[cell[0]] |= 1 << cell[1]
+    codewords = codewords[:data_count + ec_count]
+    data = codewords[:data_count]
+    ec_per_block = ec_count // block_count
+    for block in range(block_count):
+        ecc = codewords[data_count + block::block_count]
+        if rs_remainder(data[block::block_count], ec_per_block, 0x12d, 1) != ecc:
+            raise VerificationError("Data Matrix error correction codewords do not match the data.")
+    return _parse_dm(data)
+
+
+def decode_matrix(matrix, symbology=qrcore.QR_CODE):
+    """Decode a module grid of the given symbology back to its payload bytes."""
+    if symbology == qrcore.QR_CODE:
+        return decode_qr(matrix)
+    if symbology == qrcore.DATA_MATRIX:
+        return decode_dm(matrix)
+    raise ValueError(f"Unknown symbology: {symbology}.")
+
+
+def payload_matches(payload, decoded):
+    """Return True if decoded bytes are a valid encoding of the payload."""
+    if isinstance(payload, bytes):
+        return payload == decoded
+    #The encodings segno tries in order, kanji segments decode to Shift_JIS bytes
+    for encoding in (consts.DEFAULT_BYTE_ENCODING, consts.KANJI_ENCODING, "utf-8"):
+        try:
+            if payload.encode(encoding) == decoded:
+                return True
+        except UnicodeEncodeError:
+            continue
+    return False
+
+
+def image_modules(pixels, scale, border):
+    """Sample a rendered grayscale image (dark < 128) back to its module grid."""
+    pixels = np.asarray(pixels)
+    offset = border * scale + scale // 2
+    end_row = pixels.shape[0] - border * scale
+    end_col = pixels.shape[1] - border * scale
+    return (pixels[offset:end_row:scale, offset:end_col:scale] < 128).astype(np.uint8)
+
+
+class Verifier:
+    """Decode-back verification stage running in its own worker pool.
+
+    rate is the fraction of submitted codes that are checked (1.0 verifies
+    everything); sampling is spread evenly over the submission order.
+    """
+
+    def __init__(self, rate=1.0, max_workers=None, symbology=qrcore.QR_CODE, max_failures=100):
+        self.rate = rate
+        self.symbology = symbology
+        self.max_failures = max_failures
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.futures = set()  #Outstanding checks, each one drops out when it completes
+        self.credit = 0.0
+        self.submitted = 0
+        self.checked = 0
+        self.failed = 0
+        self.failures = []
+        self.busy_time = 0.0
+        self.start_time = time.time()
+
+    def submit(self, index, matrix, payload, sample=True):
+        """Queue a module grid for verification if it falls inside the sampling rate.
+
+        matrix may be a callable returning the grid, so sampling a rendered
+        image only costs anything for codes that are actually checked. With
+        sample=False the grid is always checked (an image shared by many
+        cells, submitted once).
+        """
+        with self.lock:
+            self.submitted += 1
+            if sample:
+                self.credit += self.rate
+                if self.credit < 1.0:
+                    return None
+                self.credit -= 1.0
+        future = self.executor.submit(self._check, index, matrix, payload)
+        with self.lock:
+            self.futures.add(future)
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future):
+        with self.lock:
+            self.futures.discard(future)
+
+    def _check(self, index, matrix, payload):
+        start_time = time.time()
+        try:
+            if callable(matrix):
+                matrix = matrix()
+            decoded = decode_matrix(matrix, self.symbology)
+            error = None if payload_matches(payload, decoded) else f"decoded {decoded!r}"
+        except Exception as e:
+            error = str(e)
+        with self.lock:
+            self.checked += 1
+            self.busy_time += time.time() - start_time
+            if error is not None:
+                self.failed += 1
+                if len(self.failures) < self.max_failures:
+                    self.failures.append((index, payload, error))
+        return error is None
+
+    def wait(self):
+        """Wait for the checks submitted so far, the pool stays up for the next batch."""
+        with self.lock:
+            futures = list(self.futures)
+        concurrent.futures.wait(futures)
+
+    def close(self):
+        """Wait for outstanding checks and stop the pool."""
+        self.executor.shutdown(wait=True)
+        self.futures.clear()
+
+    def summary(self):
+        """Return verification counts and throughput for the run summary."""
+        elapsed = time.time() - self.start_time
+        return {
+            "submitted": self.submitted,
+            "checked": self.checked,
+            "failed": self.failed,
+            "rate": self.rate,
+            "elapsed": elapsed,
+            "codes_per_second": self.checked / self.busy_time if self.busy_time else 0.0,
+            "failures": list(self.failures),
+        }
+
+    def report(self):
+        """Print the verification part of the run summary."""
+        stats = self.summary()
+        print(f"Verified {stats['checked']} of {stats['submitted']} codes "
+              f"(rate {stats['rate']:.0%}), {stats['failed']} failed.")
+        print(f"Verification throughput: {stats['codes_per_second']:.0f} codes/s per worker.")
+        for index, payload, error in stats["failures"][:10]:
+            print(f"Verification failed for code {index} ({payload!r}): {error}.")
+        return stats